@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+"""
+A stand-in Directadmin server for benchmarks
+
+This file is part of python-directadmin.
+
+python-directadmin is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+python-directadmin is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with python-directadmin.  If not, see <http://www.gnu.org/licenses/>.
+
+FakeDirectadmin speaks just enough of Directadmin's API to
+benchmark the library: url-encoded responses, list[] results,
+error=0/1 flags, the X-DirectAdmin: unauthorized header and
+sessions opened with CMD_LOGIN, over HTTP/1.1 keep-alive
+connections.
+
+Usage:
+
+server = FakeDirectadmin(users=10000)
+server.start()
+api = directadmin.Api(server.username, server.password,
+                      server.hostname, server.port)
+...
+server.stop()
+"""
+import base64
+import Cookie
+import gzip
+import os
+import time
+import zlib
+import StringIO
+import threading
+import urllib
+import urlparse
+import BaseHTTPServer
+import SocketServer
+
+
+class _Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """Threaded HTTP server"""
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 256
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Request handler, answers with the data of the FakeDirectadmin
+       object set as the 'directadmin' attribute of the server"""
+    protocol_version = 'HTTP/1.1'
+    # Buffer the response so it goes out in as few packets as possible
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        """Silences the request log"""
+        pass
+
+    def do_GET(self):
+        self._handle('')
+
+    def do_POST(self):
+        length = int(self.headers.getheader('Content-Length') or 0)
+        self._handle(self.rfile.read(length))
+
+    def _handle(self, body):
+        directadmin = self.server.directadmin
+        url = urlparse.urlparse(self.path)
+        parameters = dict(urlparse.parse_qsl(url.query))
+        parameters.update(urlparse.parse_qsl(body))
+
+        if directadmin.latency:
+            time.sleep(directadmin.latency)
+
+        if url.path == '/CMD_LOGIN':
+            session = directadmin.login(parameters.get('username'),
+                                        parameters.get('password'))
+            if session is None:
+                self._reply('', [('X-DirectAdmin', 'unauthorized')])
+            else:
+                self._reply('', [('Set-Cookie', 'session=%s; path=/' %
+                                  session),
+                                 ('Set-Cookie', 'key=%s; path=/' %
+                                  directadmin.sessions[session]),
+                                 ('Location', '/')], 302)
+            return
+        if not directadmin.check(self.headers.getheader('Authorization'),
+                                 self.headers.getheader('Cookie')):
+            self._reply('', [('X-DirectAdmin', 'unauthorized')])
+            return
+        body = directadmin.respond(url.path.lstrip('/'), parameters)
+        accepted = self.headers.getheader('Accept-Encoding') or ''
+        encoding = directadmin.compression
+        if encoding is not None and encoding in accepted:
+            self._reply(directadmin.compress(body),
+                        [('Content-Encoding', encoding)])
+        else:
+            self._reply(body)
+
+    def _reply(self, body, headers=(), status=200):
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakeDirectadmin(object):
+    """Fake Directadmin
+
+    In-process stand-in for a Directadmin server
+    """
+
+    def __init__(self,
+                 users=1000,
+                 username='admin',
+                 password='password',
+                 latency=0,
+                 compression=None,
+                 password_cost=0):
+        """Constructor
+
+        Parameters:
+        users -- number of users on the server (default: 1000)
+        username -- admin username (default: admin)
+        password -- admin password (default: password)
+        latency -- seconds to wait before answering each
+                   request (default: 0)
+        compression -- 'gzip' or 'deflate' to compress the responses
+                       for the clients that accept it, None never
+                       compresses (default: None)
+        password_cost -- seconds it takes to check the password,
+                         which Basic authentication does on every
+                         request and sessions only on login
+                         (default: 0)
+        """
+        self.username = username
+        self.password = password
+        self.auth = 'Basic %s' % base64.b64encode('%s:%s' %
+                                                  (username, password))
+        self.latency = latency
+        self.compression = compression
+        self.password_cost = password_cost
+        self.list_members = 1000
+        self.password_checks = 0
+        self.sessions = {}
+        self.hostname = '127.0.0.1'
+        self.port = None
+        self._server = None
+        self.set_users(users)
+
+    def set_users(self, users):
+        """Changes the number of users on the server"""
+        self.users = ['user%d' % n for n in range(users)]
+        # Lists are encoded once, they are the biggest responses
+        self._user_list = urllib.urlencode([('list[]', user)
+                                            for user in self.users])
+        self._domain_list = urllib.urlencode([('list[]', '%s.com' % user)
+                                              for user in self.users])
+        self._domain_owners = urllib.urlencode([('%s.com' % user, user)
+                                                for user in self.users])
+
+    def start(self):
+        """Starts serving on a random port, on a background thread"""
+        self._server = _Server((self.hostname, 0), _Handler)
+        self._server.directadmin = self
+        self.port = self._server.server_address[1]
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        """Stops the server"""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def check_password(self, username, password):
+        """Checks a username and password, taking password_cost.
+           The admin can login as any user ('admin|user')"""
+        self.password_checks += 1
+        if self.password_cost:
+            time.sleep(self.password_cost)
+        return username.split('|')[0] == self.username and \
+               password == self.password
+
+    def login(self, username, password):
+        """Opens a session, returns its id or None"""
+        if not self.check_password(username, password):
+            return None
+        session = os.urandom(16).encode('hex')
+        self.sessions[session] = os.urandom(8).encode('hex')
+        return session
+
+    def check(self, authorization, cookie):
+        """Checks the credentials of a request"""
+        if cookie:
+            cookies = Cookie.SimpleCookie(cookie)
+            if 'session' in cookies and 'key' in cookies:
+                session = cookies['session'].value
+                return self.sessions.get(session) == cookies['key'].value
+            return False
+        if not authorization or not authorization.startswith('Basic '):
+            return False
+        username, sep, password = base64.b64decode(
+            authorization[6:]).partition(':')
+        return self.check_password(username, password)
+
+    def expire_sessions(self):
+        """Closes all the sessions"""
+        self.sessions = {}
+
+    def compress(self, body):
+        """Returns a body compressed with the server's encoding"""
+        if self.compression == 'deflate':
+            return zlib.compress(body)
+        buf = StringIO.StringIO()
+        f = gzip.GzipFile(fileobj=buf, mode='wb')
+        f.write(body)
+        f.close()
+        return buf.getvalue()
+
+    def respond(self, cmd, parameters):
+        """Returns the body of the response to a command"""
+        if cmd == 'CMD_API_SHOW_USERS' and parameters.get('reseller'):
+            # The users belong to the admin, resellers have none
+            return ''
+        if cmd in ('CMD_API_SHOW_ALL_USERS', 'CMD_API_SHOW_USERS'):
+            return self._user_list
+        if cmd == 'CMD_API_SHOW_RESELLERS':
+            return urllib.urlencode([('list[]', 'reseller')])
+        if cmd == 'CMD_API_SHOW_DOMAINS':
+            return self._domain_list
+        if cmd == 'CMD_API_DOMAIN_OWNERS':
+            return self._domain_owners
+        if cmd == 'CMD_API_SHOW_USER_USAGE':
+            return urllib.urlencode([('bandwidth', '1024.5'),
+                                     ('quota', '512.25'),
+                                     ('inode', '12000'),
+                                     ('vdomains', '2'),
+                                     ('nsubdomains', '3'),
+                                     ('nemails', '10'),
+                                     ('mysql', '1')])
+        if cmd == 'CMD_API_SHOW_USER_CONFIG':
+            return urllib.urlencode([('username', parameters.get('user', '')),
+                                     ('bandwidth', '10240'),
+                                     ('quota', 'unlimited'),
+                                     ('package', 'default'),
+                                     ('suspended', 'no')])
+        if cmd == 'CMD_API_SHOW_USER_DOMAINS':
+            # used bandwidth:bandwidth limit:disk usage:log usage:
+            # subdomains:suspended:quota:ssl:cgi:php
+            return urllib.urlencode([('%s.com' % parameters.get('user', ''),
+                                      '1.5:unlimited:20.1:0.2:2:no:'
+                                      'unlimited:ON:ON:ON')])
+        if cmd == 'CMD_API_SUBDOMAINS':
+            return urllib.urlencode([('list[]', 'www'), ('list[]', 'mail')])
+        if cmd == 'CMD_API_EMAIL_LIST':
+            # Every domain has two lists: 'newsletter', with
+            # list_members members, and 'staff', with 10
+            if parameters.get('action') != 'view':
+                return urllib.urlencode([('newsletter',
+                                          str(self.list_members)),
+                                         ('staff', '10')])
+            if parameters.get('name') == 'newsletter':
+                count = self.list_members
+            else:
+                count = 10
+            domain = parameters.get('domain', '')
+            return urllib.urlencode([('subscriber',
+                                      'member%d@%s' % (n, domain))
+                                     for n in range(count)])
+        if cmd == 'CMD_API_DATABASES':
+            return urllib.urlencode([('list[]', 'db1'), ('list[]', 'db2')])
+        if cmd == 'CMD_API_EMAIL_AUTORESPONDER':
+            return urllib.urlencode([('list[]', 'info')])
+        if cmd == 'CMD_API_POP':
+            return urllib.urlencode([('list[]', 'info'), ('list[]', 'sales')])
+        if cmd in ('CMD_API_SELECT_USERS',
+                   'CMD_API_ACCOUNT_USER',
+                   'CMD_API_ACCOUNT_RESELLER'):
+            return urllib.urlencode([('error', '0'),
+                                     ('text', 'Success'),
+                                     ('details', '')])
+        return urllib.urlencode([('error', '1'),
+                                 ('text', 'Unknown command'),
+                                 ('details', cmd)])
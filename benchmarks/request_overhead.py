@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Microbenchmark of the per-call overhead of building an API request
+
+This file is part of python-directadmin.
+
+python-directadmin is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+python-directadmin is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with python-directadmin.  If not, see <http://www.gnu.org/licenses/>.
+
+Compares the time spent preparing a request before any byte is
+sent: the way ApiConnector used to build it for every command
+(base64 of the credentials, URL formatting and a urllib2.Request
+with its headers) against the precomputed request template.
+
+Usage: request_overhead.py [options]
+"""
+import os
+import sys
+import base64
+import timeit
+import urllib
+import urllib2
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import directadmin
+
+
+def legacy_prepare(connector, cmd, parameters=None, get=None):
+    """Builds a request the way ApiConnector.execute did
+       before the request template was introduced"""
+    if connector._https:
+        protocol = "https"
+    else:
+        protocol = "http"
+    url = '%s://%s:%d/%s' % (protocol,
+                             connector._hostname,
+                             connector._port,
+                             cmd)
+    if get is not None:
+        url = '%s?%s' % (url, urllib.urlencode(get))
+    if parameters is not None:
+        parameters = urllib.urlencode(parameters)
+    request = urllib2.Request(url, parameters)
+    base_auth = base64.b64encode("%s:%s" %
+                                 (connector._username, connector._password))
+    request.add_header('Authorization', 'Basic %s' % base_auth)
+    request.add_header('User-Agent', directadmin.api._user_agent)
+    return request
+
+
+def measure(function, number):
+    """Returns the best time per call, in microseconds"""
+    timer = timeit.Timer(function)
+    return min(timer.repeat(3, number)) / number * 1000000
+
+
+def main():
+    """Runs the benchmark and prints the results"""
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('-n', '--number', dest='number', type='int',
+                      help='calls per measure (default: 100000)',
+                      metavar='N', default=100000)
+    (option, args) = parser.parse_args()
+
+    connector = directadmin.ApiConnector('admin', 'password', 'hostname.com')
+    cases = [('GET', 'CMD_API_SHOW_USER_USAGE', None, [('user', 'username')]),
+             ('POST', 'CMD_API_POP', [('action', 'list'),
+                                      ('domain', 'domain.com')], None)]
+
+    print "%-6s %-26s %12s %12s" % ('method', 'command',
+                                    'before (us)', 'after (us)')
+    for method, cmd, parameters, get in cases:
+        before = measure(lambda: legacy_prepare(connector, cmd,
+                                                parameters, get),
+                         option.number)
+        after = measure(lambda: connector._prepare(cmd, parameters, get),
+                        option.number)
+        print "%-6s %-26s %12.2f %12.2f" % (method, cmd, before, after)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Throughput benchmarks of python-directadmin
+
+This file is part of python-directadmin.
+
+python-directadmin is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+python-directadmin is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with python-directadmin.  If not, see <http://www.gnu.org/licenses/>.
+
+Runs representative API commands against a local FakeDirectadmin
+server and reports, for each benchmark:
+
+  ops/s     -- operations per second (users listed, usages fetched...)
+  p50, p99  -- latency percentiles of each call, in milliseconds
+  peak MB   -- growth of the peak resident memory while running
+
+Each benchmark runs in a forked process, so the memory figures
+don't add up from one benchmark to the next. POSIX only.
+
+Usage: suite.py [options] [benchmark ...]
+
+Examples:
+
+./suite.py
+./suite.py --sizes 1000,10000 list_all_users iter_all_users
+"""
+import os
+import sys
+import time
+import pickle
+import resource
+import traceback
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import directadmin
+from fakeserver import FakeDirectadmin
+
+
+def percentile(values, p):
+    """Returns the p percentile (0-100) of a sorted list"""
+    if not values:
+        return 0
+    return values[int(round((len(values) - 1) * p / 100.0))]
+
+
+def max_rss():
+    """Returns the peak resident memory of the process, in bytes"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return rss
+    return rss * 1024
+
+
+def measure(server, function, calls, auth='basic'):
+    """Measure
+
+    Runs function(api) 'calls' times in a forked process,
+    with a new Api connected to the server with the
+    given authentication mode.
+    The function returns the number of operations it did.
+
+    Returns a dictionary with the results
+    """
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        try:
+            baseline = max_rss()
+            api = directadmin.Api(server.username,
+                                  server.password,
+                                  server.hostname,
+                                  server.port,
+                                  pool_size=8,
+                                  auth=auth)
+            latencies = []
+            operations = 0
+            start = time.time()
+            for n in range(calls):
+                call_start = time.time()
+                operations += function(api)
+                latencies.append(time.time() - call_start)
+            elapsed = time.time() - start
+            latencies.sort()
+            result = {'calls': calls,
+                      'ops': operations / elapsed,
+                      'p50': percentile(latencies, 50) * 1000,
+                      'p99': percentile(latencies, 99) * 1000,
+                      'peak': (max_rss() - baseline) / 1048576.0}
+        except:
+            result = {'error': traceback.format_exc()}
+        os.write(write_end, pickle.dumps(result))
+        os._exit(0)
+
+    os.close(write_end)
+    data = []
+    while True:
+        chunk = os.read(read_end, 65536)
+        if not chunk:
+            break
+        data.append(chunk)
+    os.close(read_end)
+    os.waitpid(pid, 0)
+    return pickle.loads(''.join(data))
+
+
+def bench_list_all_users(api):
+    return len(api.list_all_users())
+
+
+def bench_iter_all_users(api):
+    count = 0
+    for user in api.iter_all_users():
+        count += 1
+    return count
+
+
+def bench_get_user_usage(api):
+    api.get_user_usage('user1')
+    return 1
+
+
+def bench_map_user_usage(api):
+    users = ['user%d' % n for n in range(200)]
+    return len(list(api.map('get_user_usage', users, 8)))
+
+
+def bench_suspensions(size):
+    users = ['user%d' % n for n in range(size)]
+
+    def bench(api):
+        api._handle_suspensions(users, True)
+        return size
+    return bench
+
+
+def bench_chunked_suspensions(size):
+    users = ['user%d' % n for n in range(size)]
+
+    def bench(api):
+        api.suspend_accounts(users, chunk_size=500, workers=8)
+        return size
+    return bench
+
+
+def bench_create_users(size):
+    users = [directadmin.EndUser('new%d' % n,
+                                 'new%d@domain.com' % n,
+                                 'password',
+                                 'new%d.com' % n,
+                                 'package_1')
+             for n in range(size)]
+
+    def bench(api):
+        for user, result, error in api.create_users(users, workers=8):
+            if error is not None:
+                raise error
+        return size
+    return bench
+
+
+def bench_usage_report(api):
+    report = directadmin.UsageReport()
+    report.collect(api, workers=8)
+    report.totals('quota', by='package')
+    report.percentiles('bandwidth')
+    report.over_quota()
+    report.top('quota', 10)
+    return len(report)
+
+
+def get_benchmarks(sizes, calls):
+    """Returns the list of benchmarks as tuples
+       (group, name, users on the server, function, calls)"""
+    benchmarks = []
+    for size in sizes:
+        # Keep the big lists from taking forever
+        list_calls = max(3, min(calls, calls * 1000 / size))
+        benchmarks.append(('list_all_users',
+                           'list_all_users (%d users)' % size,
+                           size, bench_list_all_users, list_calls))
+        benchmarks.append(('iter_all_users',
+                           'iter_all_users (%d users)' % size,
+                           size, bench_iter_all_users, list_calls))
+    benchmarks.append(('get_user_usage', 'get_user_usage',
+                       100, bench_get_user_usage, calls * 10))
+    benchmarks.append(('get_user_usage', 'get_user_usage (map, 8 workers)',
+                       100, bench_map_user_usage, max(3, calls / 10)))
+    for size in sizes:
+        suspension_calls = max(3, min(calls, calls * 1000 / size))
+        benchmarks.append(('suspensions',
+                           '_handle_suspensions (%d users)' % size,
+                           100, bench_suspensions(size), suspension_calls))
+        benchmarks.append(('suspensions',
+                           'suspend_accounts (%d users, chunks of 500)' % size,
+                           100, bench_chunked_suspensions(size),
+                           suspension_calls))
+    benchmarks.append(('create_users', 'create_users (200 users, 8 workers)',
+                       100, bench_create_users(200), max(3, calls / 10)))
+    benchmarks.append(('usage_report',
+                       'UsageReport (1000 users, 8 workers)',
+                       1000, bench_usage_report, max(3, calls / 20)))
+    return benchmarks
+
+
+def main():
+    """Runs the benchmarks and prints the results"""
+    parser = OptionParser(usage='%prog [options] [benchmark ...]',
+                          description='Benchmarks python-directadmin '
+                                      'against a local fake server. '
+                                      'Benchmarks: list_all_users, '
+                                      'iter_all_users, get_user_usage, '
+                                      'suspensions, create_users, '
+                                      'usage_report')
+    parser.add_option('-s', '--sizes', dest='sizes',
+                      help='comma separated numbers of users '
+                           '(default: 1000,10000,100000)',
+                      metavar='SIZES', default='1000,10000,100000')
+    parser.add_option('-n', '--calls', dest='calls', type='int',
+                      help='base number of calls of each benchmark '
+                           '(default: 100)',
+                      metavar='N', default=100)
+    parser.add_option('-l', '--latency', dest='latency', type='float',
+                      help='server latency per request, in milliseconds '
+                           '(default: 0)',
+                      metavar='MS', default=0)
+    parser.add_option('-z', '--compression', dest='compression',
+                      help='compress the responses: gzip or deflate '
+                           '(default: no compression)',
+                      metavar='ENCODING', default=None)
+    parser.add_option('-a', '--auth', dest='auth',
+                      help='authentication mode: basic or session '
+                           '(default: basic)',
+                      metavar='MODE', default='basic')
+    parser.add_option('-p', '--password-cost', dest='password_cost',
+                      type='float',
+                      help='time the server takes to check the password, '
+                           'in milliseconds (default: 0)',
+                      metavar='MS', default=0)
+    (option, args) = parser.parse_args()
+    sizes = [int(size) for size in option.sizes.split(',')]
+
+    server = FakeDirectadmin(latency=option.latency / 1000.0,
+                             compression=option.compression,
+                             password_cost=option.password_cost / 1000.0)
+    server.start()
+
+    print "%-45s %7s %12s %9s %9s %9s" % ('benchmark', 'calls', 'ops/s',
+                                         'p50 ms', 'p99 ms', 'peak MB')
+    for group, name, users, function, calls in get_benchmarks(sizes,
+                                                              option.calls):
+        if args and group not in args:
+            continue
+        server.set_users(users)
+        result = measure(server, function, calls, option.auth)
+        if 'error' in result:
+            print "%-45s failed:\n%s" % (name, result['error'])
+            continue
+        print "%-45s %7d %12.1f %9.2f %9.2f %9.1f" % (name,
+                                                     result['calls'],
+                                                     result['ops'],
+                                                     result['p50'],
+                                                     result['p99'],
+                                                     result['peak'])
+    server.stop()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
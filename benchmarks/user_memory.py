@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Memory benchmark of the user records
+
+This file is part of python-directadmin.
+
+python-directadmin is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+python-directadmin is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with python-directadmin.  If not, see <http://www.gnu.org/licenses/>.
+
+Builds many EndUser objects, as a bulk provisioning job would,
+and reports the growth of the peak resident memory and the time
+it took. The records are compared with a dictionary per user,
+which is what the old User class needed to be used safely.
+
+Each case runs in a forked process. POSIX only.
+
+Usage: user_memory.py [options]
+"""
+import os
+import sys
+import time
+import pickle
+import resource
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import directadmin
+
+
+class LegacyEndUser(object):
+    """An end user with its properties in a dictionary of its own"""
+
+    def __init__(self, username, email, password, domain, package=None,
+                 ip=None):
+        self._properties = {'username': username,
+                            'email': email,
+                            'passwd': password,
+                            'passwd2': password,
+                            'domain': domain,
+                            'ip': ip}
+        if package is not None:
+            self._properties['package'] = package
+        else:
+            self._properties.update(dict(
+                directadmin.EndUser._default_config))
+
+    def __setitem__(self, key, value):
+        self._properties[key] = value
+
+
+def max_rss():
+    """Returns the peak resident memory of the process, in bytes"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return rss
+    return rss * 1024
+
+
+def build(cls, names, package, custom):
+    """Returns a list of users of a class, one for each
+       tuple (username, email, password, domain)"""
+    users = []
+    for username, email, password, domain in names:
+        user = cls(username, email, password, domain, package, '10.0.0.1')
+        if custom:
+            user['bandwidth'] = 1024
+        users.append(user)
+    return users
+
+
+def measure(cls, count, package, custom):
+    """Builds the users in a forked process and
+       returns (bytes per user, seconds)"""
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        # Build the strings first, to leave them out of the figures
+        names = [('user%d' % n, 'user%d@domain.com' % n,
+                  'password%d' % n, 'domain%d.com' % n)
+                 for n in range(count)]
+        baseline = max_rss()
+        start = time.time()
+        users = build(cls, names, package, custom)
+        elapsed = time.time() - start
+        result = ((max_rss() - baseline) / float(count), elapsed)
+        os.write(write_end, pickle.dumps(result))
+        os._exit(0)
+
+    os.close(write_end)
+    data = []
+    while True:
+        chunk = os.read(read_end, 65536)
+        if not chunk:
+            break
+        data.append(chunk)
+    os.close(read_end)
+    os.waitpid(pid, 0)
+    return pickle.loads(''.join(data))
+
+
+def main():
+    """Runs the benchmark and prints the results"""
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('-n', '--number', dest='number', type='int',
+                      help='users to build (default: 100000)',
+                      metavar='N', default=100000)
+    (option, args) = parser.parse_args()
+
+    cases = [('default config', None, False),
+             ('changed config', None, True),
+             ('package', 'package_1', False)]
+
+    print "%d users" % option.number
+    print "%-16s %-14s %12s %12s %10s" % ('users', 'class', 'bytes/user',
+                                          'total MB', 'seconds')
+    for name, package, custom in cases:
+        for cls in (LegacyEndUser, directadmin.EndUser):
+            per_user, elapsed = measure(cls, option.number, package, custom)
+            print "%-16s %-14s %12.0f %12.1f %10.2f" % \
+                  (name, cls.__name__, per_user,
+                   per_user * option.number / 1048576.0, elapsed)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,2 +1,12 @@
 # -*- coding: utf-8 -*-
 from api import *
+from workers import *
+from fleet import *
+from cache import *
+from metrics import *
+from policy import *
+from scheduler import *
+from records import *
+from sync import *
+from inventory import *
+from report import *
@@ -35,13 +35,153 @@ $Id$
 __author__ = "Andrés Gattinoni <andresgattinoni@gmail.com>"
 __version__ = "$Revision$"
 
-import urllib2
 import urllib
 import urlparse
 import base64
+import re
+import Cookie
+import errno
+import httplib
+import collections
+import copy
+import socket
+import threading
+import time
+import zlib
+import Queue
+
+from workers import WorkerPool
+from metrics import CommandMetrics
+from policy import CircuitBreaker
+from scheduler import RequestScheduler, NORMAL
+from records import UserUsage, UserLimits, ServerStats
+from cache import freeze_parameters, copy_response
+from workers import TimeoutError, as_completed
+
+__all__ = ['ApiError', 'AuthenticationError', 'ApiConnectionError',
+           'CircuitOpenError', 'ApiTimeoutError', 'QueueTimeoutError',
+           'ValidationError', 'User', 'AdminUser', 'ResellerUser', 'EndUser',
+           'ConnectionPool', 'ApiConnector', 'Api', 'AsyncApiConnector',
+           'AsyncApi']
 
 _user_agent = "Python Directadmin"
 
+# Separators of the pairs of a query string, as in urlparse
+_pair_separator = re.compile('[&;]')
+
+# Read-only commands being sent, shared by the threads that
+# ask for them at the same time (see ApiConnector)
+_flights = {}
+_flights_lock = threading.Lock()
+
+# What every request to a server shares: the base URL and the
+# headers for GET and POST requests
+_RequestTemplate = collections.namedtuple('RequestTemplate',
+                                          'base_url get_headers post_headers')
+
+# Commands that only query the server, whatever their parameters
+_read_only_commands = ('CMD_API_ADMIN_STATS',
+                       'CMD_API_DOMAIN_OWNERS',
+                       'CMD_API_PACKAGES_RESELLER',
+                       'CMD_API_PACKAGES_USER',
+                       'CMD_API_EMAIL_VACATION_MODIFY',
+                       'CMD_API_EMAIL_AUTORESPONDER_MODIFY')
+
+# Commands that only query the server when they get no 'action'
+# parameter, or one of _read_only_actions
+_action_commands = ('CMD_API_SUBDOMAINS',
+                    'CMD_API_DATABASES',
+                    'CMD_API_POP',
+                    'CMD_API_EMAIL_VACATION',
+                    'CMD_API_EMAIL_LIST',
+                    'CMD_API_EMAIL_AUTORESPONDER')
+_read_only_actions = (None, 'list', 'view')
+
+# Fields of the answers that report the status of a command,
+# instead of holding data
+_status_fields = ('error', 'text', 'details')
+
+# Usernames Directadmin accepts
+_username_pattern = re.compile('^[a-zA-Z0-9]{4,8}$')
+_min_password_length = 5
+
+
+def _is_read_only(cmd, parameters=None):
+    """Returns True if a command with the given
+       parameters doesn't change anything on the server"""
+    if cmd.startswith('CMD_API_SHOW_') or cmd in _read_only_commands:
+        return True
+    if cmd in _action_commands:
+        action = dict(parameters or ()).get('action')
+        return action in _read_only_actions
+    return False
+
+
+# Errors of a kept-alive connection the server closed while it was idle
+_stale_errors = (errno.ECONNRESET, errno.EPIPE, errno.ECONNABORTED)
+
+
+def _is_stale(error):
+    """Returns True if a request failed because its kept-alive
+       connection had been closed, before any response arrived"""
+    if isinstance(error, socket.timeout):
+        return False
+    if isinstance(error, httplib.BadStatusLine):
+        return True
+    return isinstance(error, socket.error) and \
+        error.errno in _stale_errors
+
+
+class _Shared(object):
+    """What a connector shares with its copies (see
+       with_priority and login_as): the metrics sinks
+       and the number of coalesced calls"""
+    __slots__ = ('sinks', 'coalesced_calls', 'lock')
+
+    def __init__(self):
+        self.sinks = []
+        self.coalesced_calls = 0
+        self.lock = threading.Lock()
+
+
+class _Flight(object):
+    """A request in flight and its outcome"""
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _Decompressor(object):
+    """Incremental decoder of gzip and deflate bodies"""
+    __slots__ = ('_encoding', '_object', '_started')
+
+    def __init__(self, encoding):
+        if encoding == 'gzip':
+            wbits = 16 + zlib.MAX_WBITS
+        else:
+            wbits = zlib.MAX_WBITS
+        self._encoding = encoding
+        self._object = zlib.decompressobj(wbits)
+        self._started = False
+
+    def decompress(self, data):
+        try:
+            result = self._object.decompress(data)
+        except zlib.error:
+            # Some servers send raw deflate data, without the zlib header
+            if self._encoding != 'deflate' or self._started:
+                raise
+            self._object = zlib.decompressobj(-zlib.MAX_WBITS)
+            result = self._object.decompress(data)
+        self._started = True
+        return result
+
+    def flush(self):
+        return self._object.flush()
+
 
 class ApiError(Exception):
     """API Error
@@ -51,15 +191,86 @@ class ApiError(Exception):
     pass
 
 
+class AuthenticationError(ApiError):
+    """Authentication Error
+
+    Raised when the server rejects the credentials
+    (X-DirectAdmin: unauthorized)
+    """
+    pass
+
+
+class ApiConnectionError(ApiError):
+    """API Connection Error
+
+    Raised when the server can't be reached or fails
+    to answer (HTTP 5xx)
+    """
+    pass
+
+
+class CircuitOpenError(ApiError):
+    """Circuit Open Error
+
+    Raised without contacting the server when its
+    circuit breaker is open
+    """
+    pass
+
+
+class ApiTimeoutError(ApiConnectionError):
+    """API Timeout Error
+
+    Raised when the server doesn't answer in time
+    """
+    pass
+
+
+class QueueTimeoutError(ApiError):
+    """Queue Timeout Error
+
+    Raised when a command waits longer than its timeout
+    for a slot of the RequestScheduler. The command wasn't
+    sent, so it isn't a failure of the server.
+    """
+    pass
+
+
+class ValidationError(ApiError):
+    """Validation Error
+
+    Raised when the information of a user is checked
+    locally and found invalid, before contacting the server
+    """
+    pass
+
+
+# Marks the properties a user doesn't have
+_missing = object()
+
+
 class User(object):
     """User
 
     Abstract representation of a Directadmin Panel User
+
+    Users are compact records: the properties every user has
+    are kept in a list, in the order of _fields. The default
+    configuration of a class is a tuple shared by all its
+    instances, which is only copied when one of its values
+    is changed. Any other property goes to a dictionary
+    created on demand.
     """
-    _properties = {'username': None,
-                   'email': None,
-                   'passwd': None,
-                   'passwd2': None}
+    __slots__ = ('_values', '_config', '_extra')
+
+    _fields = ('username', 'email', 'passwd', 'passwd2')
+    _field_index = dict((key, n) for n, key in enumerate(_fields))
+
+    # Pairs (property, value) with the default configuration
+    _default_config = ()
+    _config_keys = ()
+    _config_values = ()
+    _config_index = {}
 
     def __init__(self, username, email, password):
         """Constructor
@@ -72,38 +283,121 @@ class User(object):
         email -- a valid email address
         password -- Admin's password, +5 ascii characters
         """
-        self._properties['username'] = username
-        self._properties['email'] = email
-        self._properties['passwd'] = password
-        self._properties['passwd2'] = password
+        self._values = [_missing] * len(self._fields)
+        self._config = None
+        self._extra = None
+        self['username'] = username
+        self['email'] = email
+        self['passwd'] = password
+        self['passwd2'] = password
 
     def __getitem__(self, key):
         """Returns a user property"""
-        return self._properties[key]
+        index = self._field_index.get(key)
+        if index is not None:
+            value = self._values[index]
+            if value is not _missing:
+                return value
+        elif self._config is not None and key in self._config_index:
+            return self._config[self._config_index[key]]
+        elif self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
 
     def __setitem__(self, key, value):
         """Sets a user property"""
-        self._properties[key] = value
+        index = self._field_index.get(key)
+        if index is not None:
+            self._values[index] = value
+            return
+        if self._config is not None:
+            index = self._config_index.get(key)
+            if index is not None:
+                if isinstance(self._config, tuple):
+                    # The defaults are shared, copy them on the first change
+                    self._config = list(self._config)
+                self._config[index] = value
+                return
+        if self._extra is None:
+            self._extra = {}
+        self._extra[key] = value
+
+    def __contains__(self, key):
+        """Returns True if the user has a property"""
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
 
     def update(self, properties):
-        """Updates the properties dictionary"""
-        return self._properties.update(properties)
+        """Updates the properties with a dictionary"""
+        for key, value in properties.items():
+            self[key] = value
+
+    def validate(self):
+        """Validate
+
+        Checks the properties of the user locally, without
+        contacting the server
+
+        Raises ValidationError if the user isn't valid
+        """
+        username = self._values[self._field_index['username']]
+        if not isinstance(username, basestring) or \
+           not _username_pattern.match(username):
+            raise ValidationError("Invalid username %r: it must have "
+                                  "4-8 alphanumeric characters" % (username,))
+        email = self._values[self._field_index['email']]
+        if not isinstance(email, basestring) or '@' not in email:
+            raise ValidationError("Invalid email address for %s: %r" %
+                                  (username, email))
+        password = self._values[self._field_index['passwd']]
+        if not isinstance(password, basestring) or \
+           len(password) < _min_password_length:
+            raise ValidationError("Invalid password for %s: it must have "
+                                  "at least %d characters" %
+                                  (username, _min_password_length))
+        if password != self._values[self._field_index['passwd2']]:
+            raise ValidationError("Passwords of %s don't match" % username)
+
+        # Resellers and end users also need a domain,
+        # and a package or a custom configuration
+        if 'domain' in self._field_index:
+            domain = self._values[self._field_index['domain']]
+            if not isinstance(domain, basestring) or '.' not in domain:
+                raise ValidationError("Invalid domain for %s: %r" %
+                                      (username, domain))
+        if 'package' in self._field_index and self._config is None:
+            package = self._values[self._field_index['package']]
+            if package is _missing or not package:
+                raise ValidationError("%s has no package nor a custom "
+                                      "configuration" % username)
 
     def get_list(self):
         """Returns a list of tuples with all the
            properties of the User, to be sent in API commands"""
         l = []
-        for key, value in self._properties.items():
-            l.append((key, value))
+        for key, value in zip(self._fields, self._values):
+            if value is not _missing:
+                l.append((key, value))
+        if self._config is not None:
+            l.extend(zip(self._config_keys, self._config))
+        if self._extra is not None:
+            l.extend(self._extra.items())
         return l
 
+    def _use_default_config(self):
+        """Gives the user the default configuration of its class"""
+        self._config = self._config_values
+
 
 class AdminUser(User):
     """AdminUser
 
     Represents a Directadmin's Admin
     """
-    pass
+    __slots__ = ()
 
 
 class ResellerUser(User):
@@ -211,6 +505,47 @@ class ResellerUser(User):
                            to create users using the servers main ip.
     """
 
+    __slots__ = ()
+
+    _fields = User._fields + ('domain', 'ip', 'package')
+    _field_index = dict((key, n) for n, key in enumerate(_fields))
+
+    _default_config = (('bandwidth', 0),
+                       ('ubandwidth', "OFF"),
+                       ('quota', 0),
+                       ('uquota', "OFF"),
+                       ('vdomains', 0),
+                       ('uvdomains', "OFF"),
+                       ('nsubdomains', 0),
+                       ('unsubdomains', "OFF"),
+                       ('ips', 0),
+                       ('nemails', 0),
+                       ('unemails', "OFF"),
+                       ('nemailf', 0),
+                       ('unemailf', "OFF"),
+                       ('nemailml', 0),
+                       ('unemailml', "OFF"),
+                       ('nemailr', 0),
+                       ('unemailr', "OFF"),
+                       ('mysql', 0),
+                       ('umysql', "OFF"),
+                       ('domainptr', 0),
+                       ('udomainptr', "OFF"),
+                       ('ftp', 0),
+                       ('uftp', "OFF"),
+                       ('aftp', "OFF"),
+                       ('php', "ON"),
+                       ('cgi', "ON"),
+                       ('ssl', "OFF"),
+                       ('ssh', "OFF"),
+                       ('userssh', "OFF"),
+                       ('dnscontrol', "OFF"),
+                       ('dns', "OFF"),
+                       ('serverip', "OFF"))
+    _config_keys = tuple(key for key, value in _default_config)
+    _config_values = tuple(value for key, value in _default_config)
+    _config_index = dict((key, n) for n, key in enumerate(_config_keys))
+
     def __init__(self,
                  username,
                  email,
@@ -239,7 +574,7 @@ class ResellerUser(User):
         if package is not None:
             self['package'] = package
         else:
-            self.update(self._get_default_config())
+            self._use_default_config()
 
     def _get_default_config(self):
         """Get dafault config
@@ -247,38 +582,7 @@ class ResellerUser(User):
         Returns a dictionary with the default
         configuration for a reseller user
         """
-        return {'bandwidth': 0,
-                'ubandwidth': "OFF",
-                'quota': 0,
-                'uquota': "OFF",
-                'vdomains': 0,
-                'uvdomains': "OFF",
-                'nsubdomains': 0,
-                'unsubdomains': "OFF",
-                'ips': 0,
-                'nemails': 0,
-                'unemails': "OFF",
-                'nemailf': 0,
-                'unemailf': "OFF",
-                'nemailml': 0,
-                'unemailml': "OFF",
-                'nemailr': 0,
-                'unemailr': "OFF",
-                'mysql': 0,
-                'umysql': "OFF",
-                'domainptr': 0,
-                'udomainptr': "OFF",
-                'ftp': 0,
-                'uftp': "OFF",
-                'aftp': "OFF",
-                'php': "ON",
-                'cgi': "ON",
-                'ssl': "OFF",
-                'ssh': "OFF",
-                'userssh': "OFF",
-                'dnscontrol': "OFF",
-                'dns': "OFF",
-                'serverip': "OFF"}
+        return dict(self._default_config)
 
 
 class EndUser(User):
@@ -377,6 +681,47 @@ class EndUser(User):
                            his/her dns records.
     """
 
+    __slots__ = ()
+
+    _fields = User._fields + ('domain', 'ip', 'package')
+    _field_index = dict((key, n) for n, key in enumerate(_fields))
+
+    _default_config = (('bandwidth', 0),
+                       ('ubandwidth', "OFF"),
+                       ('quota', 0),
+                       ('uquota', "OFF"),
+                       ('vdomains', 0),
+                       ('uvdomains', "OFF"),
+                       ('nsubdomains', 0),
+                       ('unsubdomains', "OFF"),
+                       ('nemails', 0),
+                       ('unemails', "OFF"),
+                       ('nemailf', 0),
+                       ('unemailf', "OFF"),
+                       ('nemailml', 0),
+                       ('unemailml', "OFF"),
+                       ('nemailr', 0),
+                       ('unemailr', "OFF"),
+                       ('mysql', 0),
+                       ('umysql', "OFF"),
+                       ('domainptr', 0),
+                       ('udomainptr', "OFF"),
+                       ('ftp', 0),
+                       ('uftp', "OFF"),
+                       ('aftp', "OFF"),
+                       ('cgi', "ON"),
+                       ('php', "ON"),
+                       ('spam', "ON"),
+                       ('cron', "ON"),
+                       ('catchall', "OFF"),
+                       ('ssl', "OFF"),
+                       ('ssh', "OFF"),
+                       ('sysinfo', "OFF"),
+                       ('dnscontrol', "OFF"))
+    _config_keys = tuple(key for key, value in _default_config)
+    _config_values = tuple(value for key, value in _default_config)
+    _config_index = dict((key, n) for n, key in enumerate(_config_keys))
+
     def __init__(self,
                  username,
                  email,
@@ -404,7 +749,7 @@ class EndUser(User):
         if package is not None:
             self['package'] = package
         else:
-            self.update(self._get_default_config())
+            self._use_default_config()
 
     def _get_default_config(self):
         """Get dafault config
@@ -412,38 +757,123 @@ class EndUser(User):
         Returns a dictionary with the default
         configuration for a reseller user
         """
-        return {'bandwidth': 0,
-                'ubandwidth': "OFF",
-                'quota': 0,
-                'uquota': "OFF",
-                'vdomains': 0,
-                'uvdomains': "OFF",
-                'nsubdomains': 0,
-                'unsubdomains': "OFF",
-                'nemails': 0,
-                'unemails': "OFF",
-                'nemailf': 0,
-                'unemailf': "OFF",
-                'nemailml': 0,
-                'unemailml': "OFF",
-                'nemailr': 0,
-                'unemailr': "OFF",
-                'mysql': 0,
-                'umysql': "OFF",
-                'domainptr': 0,
-                'udomainptr': "OFF",
-                'ftp': 0,
-                'uftp': "OFF",
-                'aftp': "OFF",
-                'cgi': "ON",
-                'php': "ON",
-                'spam': "ON",
-                'cron': "ON",
-                'catchall': "OFF",
-                'ssl': "OFF",
-                'ssh': "OFF",
-                'sysinfo': "OFF",
-                'dnscontrol': "OFF"}
+        return dict(self._default_config)
+
+
+class ConnectionPool(object):
+    """Connection Pool
+
+    Keeps a set of persistent HTTP/1.1 (keep-alive) connections
+    to a Directadmin server, so consecutive commands reuse the
+    same sockets instead of paying a new TCP (and TLS) handshake
+    on every request.
+
+    Connections are checked out with get() and handed back
+    with put(). Both operations are thread-safe, and get()
+    blocks while all the connections of the pool are busy.
+
+    A few spare connections, beyond the size of the pool, are
+    kept for hedged requests: they are taken with reserve()
+    and never wait for a busy pool.
+    """
+
+    def __init__(self,
+                 hostname,
+                 port,
+                 https=False,
+                 size=4,
+                 idle_timeout=60,
+                 spare=1):
+        """Constructor
+
+        Parameters:
+        hostname -- Directadmin's hostname
+        port -- port on which Directadmin listens
+        https -- boolean, if True connections will use HTTPS
+                 (default: False)
+        size -- maximum number of connections to open at the
+                same time (default: 4)
+        idle_timeout -- seconds a connection can stay unused
+                        before it is closed and reopened on its
+                        next checkout (default: 60)
+        spare -- number of extra connections for hedged
+                 requests (default: 1)
+        """
+        self._hostname = hostname
+        self._port = int(port)
+        self._https = bool(https)
+        self._size = int(size)
+        self._idle_timeout = idle_timeout
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self._size)
+        self._spare = threading.BoundedSemaphore(int(spare))
+
+    def _new_connection(self):
+        """Returns a new (not yet connected) connection object"""
+        if self._https:
+            return httplib.HTTPSConnection(self._hostname, self._port)
+        return httplib.HTTPConnection(self._hostname, self._port)
+
+    def reserve(self):
+        """Reserve
+
+        Takes a spare connection slot without waiting.
+        Returns False if all of them are in use, otherwise
+        the slot must be freed with unreserve() once done.
+        """
+        return self._spare.acquire(False)
+
+    def unreserve(self):
+        """Frees a spare connection slot taken with reserve()"""
+        self._spare.release()
+
+    def get(self, spare=False):
+        """Get connection
+
+        Checks out a connection from the pool, waiting
+        for one to be returned if all of them are in use.
+        Connections that have been idle for too long are
+        closed, so they will reconnect on their next request.
+
+        Parameters:
+        spare -- if True, the connection uses a spare slot
+                 already taken with reserve() and doesn't
+                 wait (default: False)
+        """
+        if not spare:
+            self._slots.acquire()
+        with self._lock:
+            if self._idle:
+                connection, last_used = self._idle.pop()
+            else:
+                connection, last_used = None, None
+        if connection is None:
+            return self._new_connection()
+        if time.time() - last_used > self._idle_timeout:
+            connection.close()
+        return connection
+
+    def put(self, connection, spare=False):
+        """Put connection
+
+        Returns a connection to the pool. The connection
+        must not have a pending response.
+
+        Parameters:
+        spare -- True if it was checked out with get(spare=True)
+                 (default: False)
+        """
+        with self._lock:
+            self._idle.append((connection, time.time()))
+        if not spare:
+            self._slots.release()
+
+    def close(self):
+        """Closes all the idle connections of the pool"""
+        with self._lock:
+            for connection, last_used in self._idle:
+                connection.close()
 
 
 class ApiConnector(object):
@@ -451,19 +881,48 @@ class ApiConnector(object):
 
     Basic object to handle API connection.
     Connect and send commands.
+
+    Requests are sent through a ConnectionPool, so the
+    connections to the server are kept alive and reused.
     """
     _hostname = None
     _port = 0
     _username = None
     _password = None
     _https = False
+    _pool = None
+    _template = None
+    _shared = None
+    _compression = True
+    _retry_policy = None
+    _breaker = None
+    _hedge_workers = None
+    _scheduler = None
+    _priority = NORMAL
+    _coalesce = False
+    _auth = 'basic'
+    _login_key = None
+    _session = None
+    _fallback = False
 
     def __init__(self,
                  username,
                  password,
                  hostname="localhost",
                  port=2222,
-                 https=False):
+                 https=False,
+                 pool_size=4,
+                 pool_idle_timeout=60,
+                 timeout=None,
+                 connect_timeout=None,
+                 retry_policy=None,
+                 circuit_breaker=None,
+                 scheduler=None,
+                 priority=NORMAL,
+                 coalesce=False,
+                 compression=True,
+                 auth='basic',
+                 login_key=None):
         """Constructor
 
         Parameters:
@@ -473,12 +932,88 @@ class ApiConnector(object):
         port = port on which Directadmin listens (default: 2222)
         https -- boolean, if True all transactions will
                  be performed using HTTPS (default: False)
+        pool_size -- maximum number of simultaneous connections
+                     to the server (default: 4)
+        pool_idle_timeout -- seconds an unused connection is kept
+                             alive (default: 60)
+        timeout -- seconds to wait for the server to answer on each
+                   request, None uses the global socket timeout
+                   (default: None)
+        connect_timeout -- seconds to wait for a new connection to be
+                           established, None uses timeout (default: None)
+        retry_policy -- a RetryPolicy to retry or hedge read-only
+                        commands on connection problems, None sends
+                        every command once (default: None)
+        circuit_breaker -- a CircuitBreaker to fail fast while the
+                           server is down, or True to use the one
+                           shared by all the connectors to this
+                           host (default: None)
+        scheduler -- a RequestScheduler to queue the requests by
+                     priority, or True to use the one shared by all
+                     the connectors to this host. A command that
+                     can't get a slot within the timeout raises
+                     QueueTimeoutError (default: None)
+        priority -- priority class of the commands sent by this
+                    connector: INTERACTIVE, NORMAL or BULK
+                    (default: NORMAL)
+        coalesce -- boolean, if True a read-only command asked for
+                    while the same one (same host, credentials and
+                    parameters) is being sent by another thread
+                    waits for that request and shares its result,
+                    instead of sending its own (default: False)
+        compression -- boolean, if True the server is asked to
+                       compress the responses with gzip or deflate,
+                       which are decompressed while they are read
+                       (default: True)
+        auth -- 'basic' to send the credentials with every request,
+                or 'session' to login once and send the cookie of
+                the session instead, so the server doesn't check
+                the password on every call (default: 'basic')
+        login_key -- a login key of the user, to login with instead
+                     of the password (default: None)
+
+        Sessions are shared by the pooled connections. When the
+        server answers with X-DirectAdmin: unauthorized, an expired
+        session is opened again, and if that doesn't work either
+        the connector falls back to Basic authentication with the
+        password.
         """
+        if auth not in ('basic', 'session'):
+            raise ValueError("Unknown authentication mode: %s" % auth)
         self._hostname = hostname
         self._port = int(port)
         self._username = username
         self._password = password
         self._https = bool(https)
+        self._timeout = timeout
+        self._connect_timeout = connect_timeout
+        self._compression = bool(compression)
+        self._auth = auth
+        self._login_key = login_key
+        self._auth_lock = threading.Lock()
+        self._shared = _Shared()
+        self._build_template()
+        self._pool = ConnectionPool(self._hostname,
+                                    self._port,
+                                    self._https,
+                                    pool_size,
+                                    pool_idle_timeout)
+        self._retry_policy = retry_policy
+        if circuit_breaker is True:
+            circuit_breaker = CircuitBreaker.for_host(self._hostname,
+                                                      self._port)
+        self._breaker = circuit_breaker
+        if scheduler is True:
+            scheduler = RequestScheduler.for_host(self._hostname,
+                                                  self._port,
+                                                  pool_size)
+        self._scheduler = scheduler
+        self._priority = priority
+        self._coalesce = bool(coalesce)
+        if retry_policy is not None and retry_policy.hedge_after is not None:
+            # Hedged requests run on their own threads, so
+            # the caller can wait for whichever answers first
+            self._hedge_workers = WorkerPool(int(pool_size) * 2)
 
     def execute(self, cmd, parameters=None, get=None):
         """Execute command
@@ -490,47 +1025,698 @@ class ApiConnector(object):
         cmd = command name
         parameters = list of tuples with parameters (default: None)
         get = list of tuples or dict with get parameters (default: None)
+
+        Read-only commands are retried and hedged according to
+        the retry policy of the connector, if it has one.
         """
-        url = self._get_url(cmd)
+        if self._coalesce and _is_read_only(cmd, parameters):
+            return self._execute_shared(cmd, parameters, get)
+        return self._execute_policy(cmd, parameters, get)
+
+    def _execute_shared(self, cmd, parameters, get):
+        """Execute shared
+
+        Executes a read-only command, or waits for the identical
+        one being sent by another thread and returns a copy of
+        its result (single flight). The wait is bounded by the
+        timeout of the connector, or the deadline of the call,
+        and raises ApiTimeoutError when it runs out.
+        """
+        key = (self._template.base_url,
+               self._username,
+               self._password,
+               cmd,
+               freeze_parameters(parameters),
+               freeze_parameters(get))
+        with _flights_lock:
+            flight = _flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _flights[key] = _Flight()
+            else:
+                self._shared.coalesced_calls += 1
+
+        if not leader:
+            if not flight.done.wait(self._get_timeout()):
+                raise ApiTimeoutError("Timed out waiting for the "
+                                      "shared request of %s" % cmd)
+            if flight.error is not None:
+                raise flight.error
+            return copy_response(flight.result)
+
+        try:
+            result = self._execute_policy(cmd, parameters, get)
+            # The followers get their own copy, so the leader
+            # can change its result while they read theirs
+            flight.result = copy_response(result)
+            return result
+        except Exception, e:
+            flight.error = e
+            raise
+        finally:
+            with _flights_lock:
+                del _flights[key]
+            flight.done.set()
+
+    def _execute_policy(self, cmd, parameters=None, get=None):
+        """Execute policy
+
+        Executes a command applying the retry
+        policy and the circuit breaker
+        """
+        policy = self._retry_policy
+        if policy is None or not _is_read_only(cmd, parameters):
+            return self._guard(self._execute_once, cmd, parameters, get)
+
+        attempt = 0
+        while True:
+            try:
+                if policy.hedge_after is None:
+                    return self._guard(self._execute_once,
+                                       cmd,
+                                       parameters,
+                                       get)
+                return self._guard(self._execute_hedged,
+                                   cmd,
+                                   parameters,
+                                   get,
+                                   policy.hedge_after)
+            except ApiConnectionError:
+                if attempt >= policy.retries:
+                    raise
+            # Fail now if the deadline of the call already passed
+            self._get_timeout()
+            time.sleep(policy.delay(attempt))
+            attempt += 1
+
+    def _guard(self, function, *args):
+        """Guard
+
+        Runs a call through the circuit breaker: fails
+        fast while it is open, and tells it whether the
+        server could be reached
+        """
+        if self._breaker is None:
+            return function(*args)
+        if not self._breaker.allow():
+            raise CircuitOpenError("Circuit open for %s:%d" %
+                                   (self._hostname, self._port))
+        try:
+            result = function(*args)
+        except ApiConnectionError:
+            self._breaker.failure()
+            raise
+        except QueueTimeoutError:
+            # Nothing was sent, the server may still be tried
+            self._breaker.cancel()
+            raise
+        except:
+            self._breaker.success()
+            raise
+        self._breaker.success()
+        return result
+
+    def _execute_hedged(self, cmd, parameters, get, delay):
+        """Execute hedged
+
+        Executes a command and, if it isn't answered within
+        'delay' seconds, sends a duplicate request.
+        Returns the first answer, the slower request is
+        left to finish in the background.
+
+        The duplicate uses a spare connection of the pool
+        and skips the scheduler, so it isn't queued behind
+        the requests it should overtake. If no spare
+        connection is free, no duplicate is sent.
+        """
+        first = self._submit_hedge(self._execute_once, cmd, parameters, get)
+        try:
+            return first.result(delay)
+        except TimeoutError:
+            pass
+        if not self._pool.reserve():
+            return first.result()
+        second = self._submit_hedge(self._execute_spare, cmd, parameters, get)
+        error = None
+        for future in as_completed([first, second]):
+            try:
+                return future.result()
+            except ApiConnectionError, e:
+                error = e
+        raise error
+
+    def _submit_hedge(self, function, cmd, parameters, get):
+        """Runs a request of a hedged command on a hedge
+           worker and returns its Future"""
+        return self._hedge_workers.submit(function, cmd, parameters, get)
+
+    def _execute_spare(self, cmd, parameters, get):
+        """Execute spare
+
+        Sends the duplicate of a hedged command through the
+        spare connection reserved for it, and frees it
+        """
+        try:
+            return self._execute_once(cmd, parameters, get, True)
+        finally:
+            self._pool.unreserve()
+
+    def _execute_once(self, cmd, parameters=None, get=None, spare=False):
+        """Execute once
+
+        Sends a command, processes the result and returns it.
+        If the server rejects the credentials, the command is
+        sent again after renewing the session or falling back
+        to Basic authentication.
+        """
+        renewed = False
+        while True:
+            template = self._authenticate()
+            try:
+                return self._execute_request(cmd, parameters, get, spare)
+            except AuthenticationError:
+                if not self._reauthenticate(template, renewed):
+                    raise
+                renewed = True
+
+    def _execute_request(self, cmd, parameters=None, get=None, spare=False):
+        """Execute request
+
+        Sends a command a single time, processes
+        the result and returns it
+        """
+        metrics = CommandMetrics(cmd)
+        start = time.time()
+        try:
+            connection, response = self._open(cmd,
+                                               parameters,
+                                               get,
+                                               metrics,
+                                               spare=spare)
+            try:
+                try:
+                    return self._handle_response(response, metrics)
+                except socket.timeout, e:
+                    raise ApiTimeoutError("HTTP Error: %s" % e)
+                except (httplib.HTTPException, socket.error), e:
+                    raise ApiConnectionError("HTTP Error: %s" % e)
+            finally:
+                self._release(connection, response, spare)
+        except Exception, e:
+            metrics.error = e.__class__.__name__
+            raise
+        finally:
+            metrics.total_time = time.time() - start
+            self._record(metrics)
+
+    def stream(self,
+               cmd,
+               parameters=None,
+               get=None,
+               chunk_size=65536,
+               field='list[]'):
+        """Stream command
+
+        Executes a command of the API that returns a list
+        and yields the items of the list one at a time,
+        while the response is read from the server in chunks.
+        Memory usage stays the same no matter how long the
+        list is.
+
+        The connection is held until the generator is
+        exhausted or closed. Streamed commands go through
+        the circuit breaker, but they are never retried.
+
+        Parameters:
+        cmd = command name
+        parameters = list of tuples with parameters (default: None)
+        get = list of tuples or dict with get parameters (default: None)
+        chunk_size = bytes to read from the server at a time
+                     (default: 65536)
+        field = name of the field whose values are yielded. None
+                yields the values of all the fields, but the ones
+                of the error status (default: 'list[]')
+        """
+        renewed = False
+        while True:
+            template = self._authenticate()
+            try:
+                # The credentials are checked before the
+                # first item, so none is yielded twice
+                for item in self._stream_request(cmd,
+                                                 parameters,
+                                                 get,
+                                                 chunk_size,
+                                                 field):
+                    yield item
+                return
+            except AuthenticationError:
+                if not self._reauthenticate(template, renewed):
+                    raise
+                renewed = True
+
+    def _stream_request(self, cmd, parameters, get, chunk_size, field):
+        """Stream request
+
+        Sends a command a single time and yields
+        the values of a field of its response
+        """
+        metrics = CommandMetrics(cmd)
+        start = time.time()
+        try:
+            connection, response = self._guard(self._open,
+                                               cmd,
+                                               parameters,
+                                               get,
+                                               metrics)
+            try:
+                try:
+                    self._check_response(response, metrics)
+                    fields = {}
+                    chunks = self._read_chunks(response, chunk_size, metrics)
+                    for name, value in self._iter_pairs(chunks):
+                        if name == field or \
+                           (field is None and name not in _status_fields):
+                            yield value
+                        else:
+                            fields.setdefault(name, []).append(value)
+                    # Raise the error if the server sent one
+                    if 'error' in fields:
+                        self._handle_fields(fields)
+                except socket.timeout, e:
+                    raise ApiTimeoutError("HTTP Error: %s" % e)
+                except (httplib.HTTPException, socket.error), e:
+                    raise ApiConnectionError("HTTP Error: %s" % e)
+            finally:
+                self._release(connection, response)
+        except Exception, e:
+            metrics.error = e.__class__.__name__
+            raise
+        finally:
+            metrics.total_time = time.time() - start
+            self._record(metrics)
+
+    def with_priority(self, priority):
+        """With priority
+
+        Returns a copy of the connector that sends its commands
+        with another priority class. The copy shares the
+        connections, scheduler and metrics sinks of this one.
+        """
+        connector = copy.copy(self)
+        connector._priority = priority
+        return connector
+
+    def login_as(self, username):
+        """Login as
+
+        Returns a copy of the connector that sends its commands
+        as one of the users of the logged admin or reseller,
+        with Directadmin's 'admin|user' login. The copy shares
+        the connections, scheduler and metrics sinks of this one.
+        """
+        connector = copy.copy(self)
+        connector._username = '%s|%s' % (self._username.split('|')[0],
+                                         username)
+        connector._session = None
+        connector._fallback = False
+        connector._build_template()
+        return connector
+
+    def add_metrics_sink(self, sink):
+        """Add metrics sink
+
+        Registers an object to be told about every command
+        sent by the connector. After each command, the sink's
+        record() method is called with a CommandMetrics object
+        holding its timings, response size and outcome.
+
+        See MetricsAggregator for a ready to use sink.
+        """
+        # Replace the list instead of changing it,
+        # so commands running on other threads aren't affected.
+        # It's kept in the state shared with the copies of the
+        # connector, which see the sink too
+        shared = self._shared
+        with shared.lock:
+            shared.sinks = shared.sinks + [sink]
+
+    def remove_metrics_sink(self, sink):
+        """Unregisters a metrics sink"""
+        shared = self._shared
+        with shared.lock:
+            shared.sinks = [s for s in shared.sinks if s is not sink]
+
+    def get_coalesced_calls(self):
+        """Returns the number of calls that shared the
+           request of another thread instead of sending
+           their own (see the coalesce option), counting
+           the ones of the copies of the connector"""
+        return self._shared.coalesced_calls
+
+    def _record(self, metrics):
+        """Hands the metrics of a command to the sinks"""
+        for sink in self._shared.sinks:
+            sink.record(metrics)
+
+    def _open(self, cmd, parameters, get, metrics, headers=None,
+              spare=False):
+        """Open
+
+        Sends a command through a pooled connection,
+        measuring it on the given CommandMetrics. The
+        headers of the template can be replaced. With
+        'spare', the spare connection reserved in the
+        pool is used and the scheduler is skipped.
+
+        Returns a tuple (connection, response), the
+        connection must be handed to _release() once
+        the response has been read
+        """
+        method, path, body, template_headers = self._prepare(cmd,
+                                                             parameters,
+                                                             get)
+        if headers is None:
+            headers = template_headers
+        metrics.priority = self._priority
+        if self._scheduler is not None and not spare:
+            try:
+                metrics.queue_time = self._scheduler.acquire(
+                    self._priority, self._get_timeout())
+            except TimeoutError, e:
+                raise QueueTimeoutError("Queue Error: %s" % e)
+        connection = self._pool.get(spare)
+        response = None
+        try:
+            response = self._send(connection,
+                                  method,
+                                  path,
+                                  body,
+                                  headers,
+                                  metrics,
+                                  _is_read_only(cmd, parameters))
+            if response.status >= 500:
+                raise ApiConnectionError("HTTP Error: %s" % response.reason)
+            if response.status >= 400:
+                raise ApiError("HTTP Error: %s" % response.reason)
+        except socket.timeout, e:
+            self._release(connection, response, spare)
+            raise ApiTimeoutError("HTTP Error: %s" % e)
+        except (httplib.HTTPException, socket.error), e:
+            self._release(connection, response, spare)
+            raise ApiConnectionError("HTTP Error: %s" % e)
+        except:
+            self._release(connection, response, spare)
+            raise
+        return connection, response
+
+    def _prepare(self, cmd, parameters=None, get=None):
+        """Prepare
+
+        Builds a request for a command from the template
+
+        Returns a tuple (method, path, body, headers)
+        """
+        path = self._get_path(cmd)
 
         if get is not None:
-            url = '%s?%s' % (url, urllib.urlencode(get))
+            path = '%s?%s' % (path, urllib.urlencode(get))
 
         if parameters is not None:
-            parameters = urllib.urlencode(parameters)
+            return ('POST',
+                    path,
+                    urllib.urlencode(parameters),
+                    self._template.post_headers)
+        return ('GET', path, None, self._template.get_headers)
 
-        request = urllib2.Request(url, parameters)
+    def _build_template(self):
+        """Build template
 
-        # Directadmin's API requires Basic HTTP Authentication
-        base_auth = base64.b64encode("%s:%s" %
-                                     (self._username, self._password))
-        request.add_header('Authorization', 'Basic %s' % base_auth)
+        Precomputes the parts shared by every request,
+        so they aren't rebuilt for each command
+        """
+        if self._https:
+            protocol = "https"
+        else:
+            protocol = "http"
+        base_url = '%s://%s:%d' % (protocol, self._hostname, self._port)
 
         # Identify our app with a custom User-Agent
-        request.add_header('User-Agent', _user_agent)
+        get_headers = {'User-Agent': _user_agent}
+        if self._session is not None:
+            # Directadmin checks the referer of session requests
+            get_headers['Cookie'] = self._session
+            get_headers['Referer'] = base_url + '/'
+        else:
+            # Directadmin's API requires Basic HTTP Authentication
+            base_auth = base64.b64encode("%s:%s" %
+                                         (self._username,
+                                          self._get_secret()))
+            get_headers['Authorization'] = 'Basic %s' % base_auth
+        if self._compression:
+            get_headers['Accept-Encoding'] = 'gzip, deflate'
+        post_headers = dict(get_headers)
+        post_headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+        # Replace the template at once, so threads
+        # using the connector never see half of it
+        self._template = _RequestTemplate(base_url, get_headers, post_headers)
+
+    def set_credentials(self, username, password, login_key=None):
+        """Set credentials
+
+        Changes the username, password and login key
+        used to login on Directadmin. The session, if
+        there is one, is opened again with them.
+        """
+        with self._auth_lock:
+            self._username = username
+            self._password = password
+            self._login_key = login_key
+            self._session = None
+            self._fallback = False
+            self._build_template()
+
+    def _get_secret(self):
+        """Returns the login key or password to login with"""
+        if self._login_key is not None and \
+           (not self._fallback or self._password is None):
+            return self._login_key
+        return self._password
+
+    def _authenticate(self):
+        """Authenticate
+
+        Opens the session of the connector if it uses
+        one and it isn't open yet
+
+        Returns the template for the next request
+        """
+        if self._auth == 'session' and self._session is None and \
+           not self._fallback:
+            with self._auth_lock:
+                if self._session is None and not self._fallback:
+                    self._session = self._login()
+                    if self._session is None:
+                        self._fallback = True
+                    self._build_template()
+        return self._template
+
+    def _reauthenticate(self, template, renewed):
+        """Reauthenticate
+
+        Called when the server rejected the credentials of a
+        request sent with a template. Opens the session again,
+        unless it was already renewed for this request, or
+        falls back to Basic authentication with the password.
+
+        Returns False if there is nothing left to try
+        """
+        with self._auth_lock:
+            if self._template is not template:
+                # Another thread already took care of it
+                return True
+            if self._session is not None and not renewed:
+                session = self._login()
+                if session is not None:
+                    self._session = session
+                    self._build_template()
+                    return True
+            if self._fallback:
+                return False
+            if self._auth == 'basic' and \
+               (self._login_key is None or self._password is None):
+                # The password is being sent already
+                return False
+            self._session = None
+            self._fallback = True
+            self._build_template()
+            return True
+
+    def _login(self):
+        """Login
+
+        Opens a session on Directadmin (CMD_LOGIN)
+
+        Returns the Cookie header of the session, or
+        None if the server didn't open one
+        """
+        parameters = [('username', self._username),
+                      ('password', self._get_secret()),
+                      ('referer', '/')]
+        headers = {'User-Agent': _user_agent,
+                   'Content-Type': 'application/x-www-form-urlencoded'}
+        metrics = CommandMetrics('CMD_LOGIN')
+        start = time.time()
+        try:
+            connection, response = self._open('CMD_LOGIN',
+                                              parameters,
+                                              None,
+                                              metrics,
+                                              headers)
+            try:
+                try:
+                    response.read()
+                except socket.timeout, e:
+                    raise ApiTimeoutError("HTTP Error: %s" % e)
+                except (httplib.HTTPException, socket.error), e:
+                    raise ApiConnectionError("HTTP Error: %s" % e)
+            finally:
+                self._release(connection, response)
+            cookies = Cookie.SimpleCookie()
+            for header in response.msg.getheaders('Set-Cookie'):
+                try:
+                    cookies.load(header)
+                except Cookie.CookieError:
+                    continue
+            if 'session' not in cookies:
+                metrics.error = AuthenticationError.__name__
+                return None
+            return '; '.join('%s=%s' % (name, cookies[name].value)
+                             for name in sorted(cookies))
+        except Exception, e:
+            metrics.error = e.__class__.__name__
+            raise
+        finally:
+            metrics.total_time = time.time() - start
+            self._record(metrics)
+
+    def _release(self, connection, response, spare=False):
+        """Release
+
+        Hands a connection back to the pool
+        """
+        # A connection with unread data can't be reused,
+        # so it gets closed and will reconnect next time
+        if response is None or not response.isclosed():
+            connection.close()
+        self._pool.put(connection, spare)
+        if self._scheduler is not None and not spare:
+            self._scheduler.release()
+
+    def _send(self,
+              connection,
+              method,
+              path,
+              body,
+              headers,
+              metrics,
+              retry=False):
+        """Send
+
+        Sends a request through a pooled connection
+        and returns the response object
 
-        # Open the URL and handle the response
+        Parameters:
+        retry -- retry once on a fresh socket if a kept-alive
+                 connection turns out to be closed. Only safe
+                 for commands that don't change anything
+        """
+        timeout = self._get_timeout()
+        connection.timeout = timeout
+        reused = connection.sock is not None
+        if reused:
+            connection.sock.settimeout(timeout)
         try:
-            return self._handle_response(urllib2.urlopen(request))
-        except urllib2.URLError, e:
-            raise ApiError("HTTP Error: %s" % e.reason)
+            return self._request(connection,
+                                 method,
+                                 path,
+                                 body,
+                                 headers,
+                                 timeout,
+                                 metrics)
+        except (httplib.HTTPException, socket.error), e:
+            # The server may have dropped a kept-alive connection
+            # while it was idle: retry once on a fresh socket, but
+            # never after a timeout, which may mean the request is
+            # still being handled
+            connection.close()
+            if not (reused and retry and _is_stale(e)):
+                raise
+        return self._request(connection,
+                             method,
+                             path,
+                             body,
+                             headers,
+                             timeout,
+                             metrics)
+
+    def _request(self,
+                 connection,
+                 method,
+                 path,
+                 body,
+                 headers,
+                 timeout,
+                 metrics):
+        """Request
+
+        Sends a request on a connection, connecting it first
+        if needed, and waits for the response headers
+        """
+        if connection.sock is None:
+            if self._connect_timeout is not None:
+                connection.timeout = self._connect_timeout
+            start = time.time()
+            connection.connect()
+            metrics.connect_time += time.time() - start
+            connection.sock.settimeout(timeout)
+        start = time.time()
+        connection.request(method, path, body, headers)
+        response = connection.getresponse()
+        metrics.first_byte_time = time.time() - start
+        return response
+
+    def _get_timeout(self):
+        """Get timeout
+
+        Returns the socket timeout for the next request
+        """
+        if self._timeout is None:
+            return socket.getdefaulttimeout()
+        return self._timeout
+
+    def _get_path(self, cmd):
+        """Get path
+
+        Returns the request path for a specific command
+        """
+        return '/%s' % cmd
 
     def _get_url(self, cmd):
         """Get URL
 
         Returns the URL for a specific command
         """
-        if self._https:
-            protocol = "https"
-        else:
-            protocol = "http"
-        return '%s://%s:%d/%s' % \
-               (protocol,
-                self._hostname,
-                self._port,
-                cmd)
+        return self._template.base_url + self._get_path(cmd)
+
+    def close(self):
+        """Closes the idle connections to the server"""
+        if self._hedge_workers is not None:
+            self._hedge_workers.shutdown(False)
+        self._pool.close()
 
-    def _handle_response(self, response):
+    def _handle_response(self, response, metrics):
         """Handle response
 
         Takes the response string returned by
@@ -539,23 +1725,58 @@ class ApiConnector(object):
 
         Parameters:
         response -- response object
+        metrics -- CommandMetrics of the command
 
         Returns a list or dictionary according
         to the method
 
+        Raises ApiError on errors
+        """
+        self._check_response(response, metrics)
+
+        if response.getheader('Content-Encoding') in ('gzip', 'deflate'):
+            # Parse the body while it is decompressed, so the
+            # whole of it is never held in memory. The parse
+            # time includes the decompression
+            start = time.time()
+            fields = {}
+            chunks = self._read_chunks(response, 65536, metrics)
+            for name, value in self._iter_pairs(chunks):
+                fields.setdefault(name, []).append(value)
+            metrics.parse_time = time.time() - start - metrics.transfer_time
+        else:
+            start = time.time()
+            body = response.read()
+            metrics.transfer_time = time.time() - start
+            metrics.response_bytes = len(body)
+            start = time.time()
+            fields = urlparse.parse_qs(body)
+            metrics.parse_time = time.time() - start
+
+        start = time.time()
+        try:
+            return self._handle_fields(fields)
+        finally:
+            metrics.parse_time += time.time() - start
+
+    def _check_response(self, response, metrics):
+        """Check response
+
+        Checks the headers of a response for errors,
+        before reading its body
+
         Raises ApiError on errors
         """
         # Get response headers to check if there
         # was any problem with login
-        info = response.info()
-        if info.getheader('X-DirectAdmin') == 'unauthorized':
-            raise ApiError("Invalid username or password")
+        if response.getheader('X-DirectAdmin') == 'unauthorized':
+            raise AuthenticationError("Invalid username or password")
 
         # If we're getting HTML content we'll search for known
         # error messages.
-        if info.getheader('Content-Type') == 'text/html':
+        if response.getheader('Content-Type') == 'text/html':
             errors = ['You cannot execute that command']
-            response = response.read()
+            response = ''.join(self._read_chunks(response, 65536, metrics))
             for msg in errors:
                 if response.find(msg) > -1:
                     raise ApiError(msg)
@@ -563,9 +1784,15 @@ class ApiConnector(object):
             # we exit anyway, because we can't handle this
             raise ApiError('Got unexpected HTML response from server')
 
-        # Parse the response query string
-        response = urlparse.parse_qs(response.read())
+    def _handle_fields(self, response):
+        """Handle fields
 
+        Takes the parsed query string of a response,
+        checks for errors and returns a python-friendly
+        object
+
+        Raises ApiError on errors
+        """
         # Check for 'error' flag
         if 'error' in response:
             # If 'error' is 0, the operation was successful
@@ -586,6 +1813,62 @@ class ApiConnector(object):
         else:
             return response
 
+    def _read_chunks(self, response, chunk_size, metrics):
+        """Read chunks
+
+        Yields the body of a response in chunks,
+        decompressing them if it is compressed
+        """
+        encoding = response.getheader('Content-Encoding')
+        decompressor = None
+        if encoding in ('gzip', 'deflate'):
+            decompressor = _Decompressor(encoding)
+        while True:
+            start = time.time()
+            chunk = response.read(chunk_size)
+            metrics.transfer_time += time.time() - start
+            metrics.response_bytes += len(chunk)
+            if decompressor is None:
+                if not chunk:
+                    return
+                yield chunk
+                continue
+
+            start = time.time()
+            try:
+                if chunk:
+                    data = decompressor.decompress(chunk)
+                else:
+                    data = decompressor.flush()
+            except zlib.error, e:
+                raise ApiError("Invalid %s response: %s" % (encoding, e))
+            finally:
+                metrics.parse_time += time.time() - start
+            if data:
+                yield data
+            if not chunk:
+                return
+
+    def _iter_pairs(self, chunks):
+        """Iter pairs
+
+        Parses a query string which arrives in chunks and
+        yields its (name, value) pairs, skipping blank
+        values like urlparse.parse_qs does
+        """
+        buffered = ''
+        for chunk in chunks:
+            pairs = _pair_separator.split(buffered + chunk)
+            # The last pair may continue in the next chunk
+            buffered = pairs.pop()
+            for pair in pairs:
+                name, sep, value = pair.partition('=')
+                if value:
+                    yield urllib.unquote_plus(name), urllib.unquote_plus(value)
+        name, sep, value = buffered.partition('=')
+        if value:
+            yield urllib.unquote_plus(name), urllib.unquote_plus(value)
+
 
 class Api(object):
     """API
@@ -593,13 +1876,28 @@ class Api(object):
     Directadmin API implementation
     """
     _connector = None
+    _cache = None
 
     def __init__(self,
                  username,
                  password,
                  hostname="localhost",
                  port=2222,
-                 https=False):
+                 https=False,
+                 pool_size=4,
+                 pool_idle_timeout=60,
+                 connector=None,
+                 cache=None,
+                 timeout=None,
+                 connect_timeout=None,
+                 retry_policy=None,
+                 circuit_breaker=None,
+                 scheduler=None,
+                 priority=NORMAL,
+                 coalesce=False,
+                 compression=True,
+                 auth='basic',
+                 login_key=None):
         """Constructor
 
         Initializes the connection for the API
@@ -611,19 +1909,254 @@ class Api(object):
         port -- Directadmin server port (default: 2222)
         https -- boolean, if True all transactions will
                  be performed using HTTPS (default: False)
+        pool_size -- maximum number of kept-alive connections
+                     to the server (default: 4)
+        pool_idle_timeout -- seconds an unused connection is kept
+                             alive (default: 60)
+        connector -- an ApiConnector to send the commands through,
+                     instead of creating a new one (default: None)
+        cache -- a ResponseCache to keep the responses of read-only
+                 commands, None disables caching (default: None)
+        timeout -- seconds to wait for the server to answer on each
+                   request, None uses the global socket timeout
+                   (default: None)
+        connect_timeout -- seconds to wait for a new connection to be
+                           established, None uses timeout (default: None)
+        retry_policy -- a RetryPolicy to retry or hedge read-only
+                        commands on connection problems (default: None)
+        circuit_breaker -- a CircuitBreaker, or True to use the one
+                           shared by all the connections to this
+                           host (default: None)
+        scheduler -- a RequestScheduler, or True to use the one
+                     shared by all the connections to this host
+                     (default: None)
+        priority -- priority class of the commands: INTERACTIVE,
+                    NORMAL or BULK (default: NORMAL)
+        coalesce -- boolean, if True identical read-only commands
+                    asked for at the same time by many threads share
+                    a single request (default: False)
+        compression -- boolean, if True the server is asked to
+                       compress the responses (default: True)
+        auth -- 'basic' or 'session', to login once and reuse the
+                session on every request (default: 'basic')
+        login_key -- a login key to login with instead of
+                     the password (default: None)
+        """
+        if connector is None:
+            connector = ApiConnector(username,
+                                     password,
+                                     hostname,
+                                     port,
+                                     https,
+                                     pool_size,
+                                     pool_idle_timeout,
+                                     timeout,
+                                     connect_timeout,
+                                     retry_policy,
+                                     circuit_breaker,
+                                     scheduler,
+                                     priority,
+                                     coalesce,
+                                     compression,
+                                     auth=auth,
+                                     login_key=login_key)
+        self._connector = connector
+        self._cache = cache
+
+    def with_priority(self, priority):
+        """With priority
+
+        Returns a copy of the API that sends its commands with
+        another priority class, sharing the connections, cache
+        and scheduler of this one.
+
+        Usage:
+
+        bulk = api.with_priority(BULK)
+        for user in users:
+            bulk.get_user_usage(user)
         """
-        self._connector = ApiConnector(username,
-                                       password,
-                                       hostname,
-                                       port,
-                                       https)
+        return Api(None,
+                   None,
+                   connector=self._connector.with_priority(priority),
+                   cache=self._cache)
+
+    def login_as(self, username):
+        """Login as
+
+        Returns an API that runs its commands as one of the
+        users of the logged admin or reseller, sharing the
+        connections of this one. The commands of a user (like
+        list_databases) need it.
+
+        The cache isn't shared, as the responses depend
+        on the user.
+
+        Usage:
+
+        for user in api.list_users():
+            print api.login_as(user).list_databases()
+        """
+        return Api(None,
+                   None,
+                   connector=self._connector.login_as(username))
 
     def _execute_cmd(self, cmd, parameters=None, get=None):
         """Execute command
 
-        Executes a command using the Connection object
+        Executes a command using the Connection object,
+        going through the cache if there is one
+        """
+        if self._cache is None:
+            return self._connector.execute(cmd, parameters, get)
+
+        if not _is_read_only(cmd, parameters):
+            try:
+                return self._connector.execute(cmd, parameters, get)
+            finally:
+                self._cache.invalidate(cmd, parameters)
+
+        if not self._cache.caches(cmd):
+            return self._connector.execute(cmd, parameters, get)
+        found, response = self._cache.get(cmd, parameters, get)
+        if found:
+            return response
+        # Read before sending, so a change made meanwhile by
+        # another thread keeps this response out of the cache
+        generation = self._cache.generation(cmd, parameters, get)
+        response = self._connector.execute(cmd, parameters, get)
+        self._cache.put(cmd, parameters, get, response, generation)
+        return response
+
+    def close(self):
+        """Closes the connections kept alive to the server"""
+        self._connector.close()
+
+    def add_metrics_sink(self, sink):
+        """Add metrics sink
+
+        Registers an object whose record() method gets the
+        CommandMetrics of every command sent by the API
+        (see ApiConnector.add_metrics_sink)
+        """
+        self._connector.add_metrics_sink(sink)
+
+    def remove_metrics_sink(self, sink):
+        """Unregisters a metrics sink"""
+        self._connector.remove_metrics_sink(sink)
+
+    def get_coalesced_calls(self):
+        """Returns the number of calls that shared the
+           request of another thread instead of sending
+           their own (see ApiConnector)"""
+        return self._connector.get_coalesced_calls()
+
+    def _iter_cmd(self, cmd, parameters=None, get=None, field='list[]'):
+        """Iter command
+
+        Streams the list returned by a command using the
+        Connection object. Lists are served from the cache
+        if it has them, but aren't stored in it.
+        """
+        if self._cache is not None and self._cache.caches(cmd):
+            found, response = self._cache.get(cmd, parameters, get)
+            if found:
+                if isinstance(response, dict):
+                    return (value
+                            for name, values in response.items()
+                            if field is None or name == field
+                            for value in values)
+                return iter(response)
+        return self._connector.stream(cmd, parameters, get, field=field)
+
+    def map(self, method, arguments, workers=4):
+        """Map
+
+        Calls an API method once for every item of arguments,
+        running up to 'workers' calls at the same time, and
+        yields a tuple (item, result, error) as each call finishes.
+
+        If a call raises ApiError, the exception is returned
+        as 'error' (and 'result' is None) and the other calls
+        go on. Any other exception aborts the whole run.
+
+        Note that the calls share the connection pool of the
+        API, so no more than pool_size requests will be sent
+        at the same time.
+
+        Usage:
+
+        for user, usage, error in api.map('get_user_usage', users):
+            ...
+
+        Parameters:
+        method -- name of the API method to call, or a function
+                  (for calls that need another API, like the
+                  ones returned by login_as())
+        arguments -- iterable of arguments: each item can be
+                     a tuple with all the arguments of a call or
+                     a single value for one-argument methods
+        workers -- maximum number of concurrent calls (default: 4)
         """
-        return self._connector.execute(cmd, parameters, get)
+        if callable(method):
+            function = method
+        else:
+            function = getattr(self, method)
+        pool = WorkerPool(workers)
+        finished = Queue.Queue()
+        items = iter(arguments)
+        pending = 0
+
+        def submit(item):
+            if isinstance(item, tuple):
+                future = pool.submit(function, *item)
+            else:
+                future = pool.submit(function, item)
+            future.add_done_callback(lambda f: finished.put((item, f)))
+
+        try:
+            while True:
+                # Keep the workers busy without reading
+                # the whole iterable in advance
+                while pending < workers * 2:
+                    try:
+                        submit(items.next())
+                    except StopIteration:
+                        break
+                    pending += 1
+                if pending == 0:
+                    break
+                item, future = finished.get()
+                pending -= 1
+                try:
+                    result, error = future.result(), None
+                except ApiError, e:
+                    result, error = None, e
+                yield item, result, error
+        finally:
+            # Once every call is done the workers are idle, so
+            # they are waited for and don't outlive the caller.
+            # If the caller stopped early, the calls running
+            # are left to finish in the background.
+            pool.shutdown(pending == 0, True)
+
+    def gather(self, method, arguments, workers=4):
+        """Gather
+
+        Same as map(), but waits for all the calls to finish.
+
+        Returns a tuple (results, errors) of dictionaries
+        which map each item of arguments to its result or
+        to the ApiError raised by its call.
+        """
+        results = {}
+        errors = {}
+        for item, result, error in self.map(method, arguments, workers):
+            if error is None:
+                results[item] = result
+            else:
+                errors[item] = error
+        return results, errors
 
     def _yes_no(self, b):
         """Translates a boolean to "yes"/"no" """
@@ -702,6 +2235,151 @@ class Api(object):
         parameters.extend(end_user.get_list())
         return self._execute_cmd("CMD_API_ACCOUNT_USER", parameters)
 
+    def create_resellers(self,
+                         reseller_users,
+                         notify=True,
+                         workers=4,
+                         packages=None,
+                         progress=None):
+        """Create resellers
+
+        Implements command CMD_API_ACCOUNT_RESELLER
+
+        Creates many resellers, running up to 'workers'
+        requests at the same time (see create_users)
+
+        Parameters:
+        reseller_users -- iterable of ResellerUser objects
+        notify -- boolean: if true sends notification emails
+        workers -- maximum number of concurrent requests (default: 4)
+        packages -- list of the reseller packages on the server,
+                    if given resellers with any other package are
+                    rejected (default: None)
+        progress -- function called as progress(done, failed, total)
+                    after each account (default: None)
+        """
+        return self._create_accounts('create_reseller',
+                                     ResellerUser,
+                                     reseller_users,
+                                     notify,
+                                     workers,
+                                     packages,
+                                     progress)
+
+    def create_users(self,
+                     end_users,
+                     notify=True,
+                     workers=4,
+                     packages=None,
+                     progress=None):
+        """Create users
+
+        Implements command CMD_API_ACCOUNT_USER
+
+        Creates many end users, running up to 'workers'
+        requests at the same time, and yields a tuple
+        (user, result, error) as each account is done.
+
+        Users are checked locally first (see User.validate),
+        the invalid ones are reported with a ValidationError
+        and never sent to the server. If the server rejects
+        an account, 'error' is the ApiError it raised and the
+        other accounts go on.
+
+        Usage:
+
+        for user, result, error in api.create_users(users):
+            if error is not None:
+                print user['username'], error
+
+        Parameters:
+        end_users -- iterable of EndUser objects
+        notify -- boolean: if true sends notification emails
+        workers -- maximum number of concurrent requests (default: 4)
+        packages -- list of the user packages on the server, if
+                    given users with any other package are rejected
+                    (default: None)
+        progress -- function called as progress(done, failed, total)
+                    after each account. total is None if end_users
+                    has no length (default: None)
+        """
+        return self._create_accounts('create_user',
+                                     EndUser,
+                                     end_users,
+                                     notify,
+                                     workers,
+                                     packages,
+                                     progress)
+
+    def _create_accounts(self,
+                         method,
+                         user_class,
+                         users,
+                         notify,
+                         workers,
+                         packages,
+                         progress):
+        """Create accounts
+
+        Internal generator behind create_users and
+        create_resellers
+        """
+        try:
+            total = len(users)
+        except TypeError:
+            total = None
+        if packages is not None:
+            packages = set(packages)
+        rejected = []
+
+        def valid_arguments():
+            # Checked as map() reads them, so the bad rows
+            # are reported while the good ones are running
+            for user in users:
+                try:
+                    self._check_account(user, user_class, packages)
+                except ValidationError, e:
+                    rejected.append((user, e))
+                    continue
+                yield (user, notify)
+
+        counters = {'done': 0, 'failed': 0}
+
+        def report(user, result, error):
+            counters['done'] += 1
+            if error is not None:
+                counters['failed'] += 1
+            if progress is not None:
+                progress(counters['done'], counters['failed'], total)
+            return user, result, error
+
+        for item, result, error in self.map(method,
+                                            valid_arguments(),
+                                            workers):
+            while rejected:
+                user, rejection = rejected.pop(0)
+                yield report(user, None, rejection)
+            yield report(item[0], result, error)
+        while rejected:
+            user, error = rejected.pop(0)
+            yield report(user, None, error)
+
+    def _check_account(self, user, user_class, packages=None):
+        """Check account
+
+        Validates a user to be created locally
+
+        Raises ValidationError if it isn't valid
+        """
+        if not isinstance(user, user_class):
+            raise ValidationError("%r is not an instance of %s" %
+                                  (user, user_class.__name__))
+        user.validate()
+        if packages is not None and 'package' in user and \
+           user['package'] not in packages:
+            raise ValidationError("Unknown package for %s: %s" %
+                                  (user['username'], user['package']))
+
     def show_ips(self, ip=None):
         """Show IPs
 
@@ -730,16 +2408,33 @@ class Api(object):
         user -- name of the Admin/Reseller/User to delete
                 it can also be a User object
         """
-        if isinstance(user, User):
-            username = user['username']
-        else:
-            username = user
+        return self.delete_accounts([user])
+
+    def delete_accounts(self, users, chunk_size=None, workers=4):
+        """Delete accounts
+
+        Implements command CMD_API_SELECT_USERS
+
+        Deletes a list of accounts of *ANY* type
+
+        By default all the accounts are deleted with a single
+        request. If chunk_size is given, the list is split in
+        chunks of that size which are sent concurrently and a
+        report is returned instead (see _select_users).
+
+        Parameters:
+        users -- list of names or User objects of the
+                 Admins/Resellers/Users to delete
+        chunk_size -- maximum number of accounts per request
+                      (default: None)
+        workers -- maximum number of concurrent requests when
+                   chunk_size is given (default: 4)
+        """
         parameters = [('confirmed', 'Confirm'),
-                      ('delete', 'yes'),
-                      ('select0', username)]
-        return self._execute_cmd("CMD_API_SELECT_USERS", parameters)
+                      ('delete', 'yes')]
+        return self._select_users(users, parameters, chunk_size, workers)
 
-    def _handle_suspensions(self, users, suspend):
+    def _handle_suspensions(self, users, suspend, chunk_size=None, workers=4):
         """Handle suspension
 
         Internal method to handle suspensions/unsuspensions
@@ -749,25 +2444,70 @@ class Api(object):
         users -- list of users to apply the suspension/unsuspension
                  the list can contain either usernames or User objects
         suspend -- boolean (suspend/unsuspend)
+        chunk_size -- maximum number of accounts per request, None
+                      sends them all at once (default: None)
+        workers -- maximum number of concurrent requests when
+                   chunk_size is given (default: 4)
         """
-        # Init params
-        parameters = []
-
         # Define if we're suspending or unsuspending
         if suspend:
-            parameters.append(('dosuspend', 'yes'))
+            parameters = [('dosuspend', 'yes')]
         else:
-            parameters.append(('dounsuspend', 'yes'))
+            parameters = [('dounsuspend', 'yes')]
 
-        # Add all the users to the list
-        for n, user in enumerate(users):
+        # Do the magic
+        return self._select_users(users, parameters, chunk_size, workers)
+
+    def _select_users(self, users, parameters, chunk_size=None, workers=4):
+        """Select users
+
+        Internal method to send a CMD_API_SELECT_USERS
+        action for many users
+
+        Parameters:
+        users -- list of usernames or User objects
+        parameters -- list of tuples with the parameters of the action
+        chunk_size -- maximum number of accounts per request, None
+                      sends them all at once (default: None)
+        workers -- maximum number of concurrent requests when
+                   chunk_size is given (default: 4)
+
+        Without chunk_size, returns the result of the single request.
+
+        With chunk_size, returns a dictionary mapping each username
+        to None if its chunk succeeded, or to the ApiError raised by
+        its chunk. Directadmin reports errors by request, so a failed
+        chunk marks all of its users as failed.
+        """
+        usernames = []
+        for user in users:
             if isinstance(user, User):
-                username = user['username']
+                usernames.append(user['username'])
             else:
-                username = user
+                usernames.append(user)
+
+        if chunk_size is None:
+            return self._execute_select(parameters, usernames)
+
+        chunk_size = int(chunk_size)
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be greater than zero")
+        chunks = [(parameters, usernames[i:i + chunk_size])
+                  for i in range(0, len(usernames), chunk_size)]
+
+        report = {}
+        for item, result, error in self.map('_execute_select',
+                                            chunks,
+                                            workers):
+            for username in item[1]:
+                report[username] = error
+        return report
+
+    def _execute_select(self, parameters, usernames):
+        """Sends one CMD_API_SELECT_USERS request"""
+        parameters = list(parameters)
+        for n, username in enumerate(usernames):
             parameters.append(('select%d' % n, username))
-
-        # Do the magic
         return self._execute_cmd("CMD_API_SELECT_USERS", parameters)
 
     def suspend_account(self, user):
@@ -783,18 +2523,27 @@ class Api(object):
         """
         return self._handle_suspensions([user], True)
 
-    def suspend_accounts(self, users):
+    def suspend_accounts(self, users, chunk_size=None, workers=4):
         """Suspend accounts
 
         Implements command CMD_API_SELECT_USERS
 
         Suspends a list of accounts of *ANY* type
 
+        By default all the accounts are suspended with a single
+        request. If chunk_size is given, the list is split in
+        chunks of that size which are sent concurrently and a
+        report is returned instead (see _select_users).
+
         Parameters:
         users -- list of names or User objects of the
                  Admins/Resellers/Users to suspend
+        chunk_size -- maximum number of accounts per request
+                      (default: None)
+        workers -- maximum number of concurrent requests when
+                   chunk_size is given (default: 4)
         """
-        return self._handle_suspensions(users, True)
+        return self._handle_suspensions(users, True, chunk_size, workers)
 
     def unsuspend_account(self, user):
         """Unsuspend account
@@ -809,18 +2558,27 @@ class Api(object):
         """
         return self._handle_suspensions([user], False)
 
-    def unsuspend_accounts(self, users):
+    def unsuspend_accounts(self, users, chunk_size=None, workers=4):
         """Unsuspend accounts
 
         Implements command CMD_API_SELECT_USERS
 
         Unsuspends a list of accounts of *ANY* type
 
+        By default all the accounts are unsuspended with a single
+        request. If chunk_size is given, the list is split in
+        chunks of that size which are sent concurrently and a
+        report is returned instead (see _select_users).
+
         Parameters:
         users -- list of names or User objects of the
                  Admins/Resellers/Users to suspend
+        chunk_size -- maximum number of accounts per request
+                      (default: None)
+        workers -- maximum number of concurrent requests when
+                   chunk_size is given (default: 4)
         """
-        return self._handle_suspensions(users, False)
+        return self._handle_suspensions(users, False, chunk_size, workers)
 
     def save_user_email(self, email, domain):
         """Save user email
@@ -867,6 +2625,31 @@ class Api(object):
 
         return self._execute_cmd("CMD_API_SHOW_USERS", parameters)
 
+    def iter_all_users(self):
+        """Iter All Users
+
+        Implements command CMD_API_SHOW_ALL_USERS
+
+        Same as list_all_users, but yields the users one at
+        a time while the response is read from the server,
+        keeping memory usage flat on servers with many accounts
+        """
+        return self._iter_cmd("CMD_API_SHOW_ALL_USERS")
+
+    def iter_users(self, reseller=None):
+        """Iter Users
+
+        Implements command CMD_API_SHOW_USERS
+
+        Same as list_users, but yields the users one at
+        a time while the response is read from the server
+        """
+        parameters = None
+        if reseller is not None:
+            parameters = [('reseller', reseller)]
+
+        return self._iter_cmd("CMD_API_SHOW_USERS", parameters)
+
     def list_resellers(self):
         """List Resellers
 
@@ -894,9 +2677,10 @@ class Api(object):
 
         Implements command CMD_API_ADMIN_STATS
 
-        Returns a dictionary with information of the server.
-        Note that disk info is also returned as a dictionary
-        with the following keys:
+        Returns a ServerStats record with information of the
+        server, which can also be read as the dictionary returned
+        by Directadmin. Note that disk info is also returned as
+        a dictionary with the following keys:
         - 'filesystem'
         - 'blocks'
         - 'used'
@@ -922,32 +2706,35 @@ class Api(object):
                 stats[key][0] = {}
                 for option in options:
                     stats[key][0][option] = items.pop(0)
-        return stats
+        return ServerStats(stats)
 
     def get_user_usage(self, user):
         """Get User Usage
 
         Implements command CMD_API_SHOW_USER_USAGE
 
-        Returns a dictionary with the usage information for a user
+        Returns a UserUsage record with the usage information
+        for a user, which can also be read as the dictionary
+        returned by Directadmin
 
         Method info: http://www.directadmin.com/api.html#info
         """
-        return self._execute_cmd("CMD_API_SHOW_USER_USAGE",
-                                 get=[('user', user)])
+        return UserUsage(self._execute_cmd("CMD_API_SHOW_USER_USAGE",
+                                           get=[('user', user)]))
 
     def get_user_limits(self, user):
         """Get User Limits
 
         Implements command CMD_API_SHOW_USER_CONFIG
 
-        Returns a dictionary with the user's upper limits
-        and settings that defines their account
+        Returns a UserLimits record with the user's upper limits
+        and settings that defines their account, which can also
+        be read as the dictionary returned by Directadmin
 
         Method info: http://www.directadmin.com/api.html#info
         """
-        return self._execute_cmd("CMD_API_SHOW_USER_CONFIG",
-                                 get=[('user', user)])
+        return UserLimits(self._execute_cmd("CMD_API_SHOW_USER_CONFIG",
+                                            get=[('user', user)]))
 
     def get_user_domains(self, user):
         """Get User Domains
@@ -961,6 +2748,18 @@ class Api(object):
         return self._execute_cmd("CMD_API_SHOW_USER_DOMAINS",
                                  get=[('user', user)])
 
+    def list_domain_owners(self):
+        """List Domain Owners
+
+        Implements command CMD_API_DOMAIN_OWNERS
+
+        Returns a dictionary of all the domains of the
+        server and the users that own them
+
+        Method info: http://www.directadmin.com/api.html#info
+        """
+        return self._execute_cmd("CMD_API_DOMAIN_OWNERS")
+
     def list_reseller_packages(self):
         """List Reseller Packages
 
@@ -1018,6 +2817,16 @@ class Api(object):
         """
         return self._execute_cmd("CMD_API_SHOW_DOMAINS")
 
+    def iter_domains(self):
+        """Iter domains
+
+        Implements command CMD_API_SHOW_DOMAINS
+
+        Same as list_domains, but yields the domains one at
+        a time while the response is read from the server
+        """
+        return self._iter_cmd("CMD_API_SHOW_DOMAINS")
+
     def list_subdomains(self, domain):
         """List subdomains
 
@@ -1434,6 +3243,24 @@ class Api(object):
                       ('name', name)]
         return self._execute_cmd("CMD_API_EMAIL_LIST", parameters)
 
+    def iter_email_list_member(self, domain, name):
+        """Iter members of email list
+
+        Implements command CMD_API_EMAIL_LIST
+
+        Same as list_email_list_member, but yields the members
+        one at a time while the response is read from the
+        server, so long lists are never held in memory
+
+        Parameters:
+        domain - the domain to be shown
+        name - the list name to be shown
+        """
+        parameters = [('action', 'view'),
+                      ('domain', domain),
+                      ('name', name)]
+        return self._iter_cmd("CMD_API_EMAIL_LIST", parameters, field=None)
+
     def list_autoresponder(self, domain):
         """List autoresponders info
 
@@ -1507,3 +3334,290 @@ class Api(object):
         parameters = [('domain', domain),
                       ('user', user)]
         return self._execute_cmd("CMD_API_EMAIL_AUTORESPONDER_MODIFY", parameters)
+
+
+class AsyncApiConnector(ApiConnector):
+    """Asynchronous API Connector
+
+    ApiConnector that runs commands in the background on a pool
+    of worker threads, returning a Future for each of them.
+
+    Each worker owns at most one pooled connection at a time,
+    so the number of requests in flight equals the number
+    of workers.
+    """
+    _workers = None
+
+    def __init__(self,
+                 username,
+                 password,
+                 hostname="localhost",
+                 port=2222,
+                 https=False,
+                 workers=8,
+                 pool_idle_timeout=60,
+                 timeout=None,
+                 retry_policy=None,
+                 circuit_breaker=None,
+                 auth='basic',
+                 login_key=None):
+        """Constructor
+
+        Parameters:
+        username = username to login on Directadmin
+        password = password to login on Directadmin
+        hostname = Directadmin's hostname (default: localhost)
+        port = port on which Directadmin listens (default: 2222)
+        https -- boolean, if True all transactions will
+                 be performed using HTTPS (default: False)
+        workers -- number of requests to run at the same
+                   time (default: 8)
+        pool_idle_timeout -- seconds an unused connection is kept
+                             alive (default: 60)
+        timeout -- default time limit in seconds for every call,
+                   None means no limit (default: None)
+        retry_policy -- a RetryPolicy for read-only commands
+                        (default: None)
+        circuit_breaker -- a CircuitBreaker, or True to use the
+                           one shared for the host (default: None)
+        auth -- 'basic' or 'session', to login once and reuse the
+                session on every request (default: 'basic')
+        login_key -- a login key to login with instead of
+                     the password (default: None)
+        """
+        super(AsyncApiConnector, self).__init__(username,
+                                                password,
+                                                hostname,
+                                                port,
+                                                https,
+                                                workers,
+                                                pool_idle_timeout,
+                                                timeout,
+                                                None,
+                                                retry_policy,
+                                                circuit_breaker,
+                                                auth=auth,
+                                                login_key=login_key)
+        self._workers = WorkerPool(workers)
+        self._local = threading.local()
+
+    def submit(self, cmd, parameters=None, get=None, timeout=None):
+        """Submit command
+
+        Executes a command of the API in the background
+
+        Parameters:
+        cmd = command name
+        parameters = list of tuples with parameters (default: None)
+        get = list of tuples or dict with get parameters (default: None)
+        timeout = time limit in seconds for the call, None uses
+                  the connector's timeout (default: None)
+
+        Returns a Future for the result of the command
+        """
+        return self.spawn(self.execute, (cmd, parameters, get), {}, timeout)
+
+    def spawn(self, function, args=(), kwargs=None, timeout=None):
+        """Spawn
+
+        Runs function(*args, **kwargs) in the background,
+        applying the time limit to every command it sends
+        through this connector.
+
+        Returns a Future for the result of the call
+        """
+        if kwargs is None:
+            kwargs = {}
+        if timeout is None:
+            timeout = self._timeout
+        return self._workers.submit(self._run, function, args, kwargs, timeout)
+
+    def _run(self, function, args, kwargs, timeout):
+        """Runs a call on a worker thread with its deadline set"""
+        deadline = None
+        if timeout is not None:
+            deadline = time.time() + timeout
+        return self._run_until(deadline, function, args, kwargs)
+
+    def _run_until(self, deadline, function, args, kwargs):
+        """Runs a call on this thread with the given deadline"""
+        self._local.deadline = deadline
+        try:
+            return function(*args, **kwargs)
+        finally:
+            self._local.deadline = None
+
+    def _submit_hedge(self, function, cmd, parameters, get):
+        """Runs a request of a hedged command on a hedge worker,
+           with the deadline of the call that sends it"""
+        return self._hedge_workers.submit(self._run_until,
+                                          getattr(self._local,
+                                                  'deadline',
+                                                  None),
+                                          function,
+                                          (cmd, parameters, get),
+                                          {})
+
+    def _get_timeout(self):
+        """Get timeout
+
+        Returns the time left to the deadline
+        of the call being run by this thread
+
+        Raises ApiTimeoutError if the deadline passed
+        """
+        deadline = getattr(self._local, 'deadline', None)
+        if deadline is None:
+            return super(AsyncApiConnector, self)._get_timeout()
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise ApiTimeoutError("Call timed out")
+        return remaining
+
+    def close(self, cancel=True):
+        """Close
+
+        Stops the workers and closes the idle connections
+
+        Parameters:
+        cancel -- boolean, if True the calls that haven't
+                  started are cancelled (default: True)
+        """
+        self._workers.shutdown(True, cancel)
+        super(AsyncApiConnector, self).close()
+
+
+class AsyncApi(object):
+    """Asynchronous API
+
+    Mirrors every method of Api, but runs the commands in the
+    background and returns a Future instead of the result.
+    All the methods accept an extra 'timeout' keyword argument
+    with a time limit (in seconds) for the whole call.
+
+    Usage:
+
+    api = AsyncApi("admin", "password", "hostname.com", workers=16)
+    futures = [api.get_user_usage(user)
+               for user in api.list_all_users().result()]
+    for future in as_completed(futures):
+        print future.result()
+    """
+    _connector = None
+    _api = None
+
+    def __init__(self,
+                 username,
+                 password,
+                 hostname="localhost",
+                 port=2222,
+                 https=False,
+                 workers=8,
+                 pool_idle_timeout=60,
+                 timeout=None,
+                 retry_policy=None,
+                 circuit_breaker=None,
+                 auth='basic',
+                 login_key=None):
+        """Constructor
+
+        Initializes the connection for the API
+
+        Parameters:
+        username -- Directadmin username
+        password -- Directadmin password
+        hostname -- Directadmin server host (default: localhost)
+        port -- Directadmin server port (default: 2222)
+        https -- boolean, if True all transactions will
+                 be performed using HTTPS (default: False)
+        workers -- number of requests to run at the same
+                   time (default: 8)
+        pool_idle_timeout -- seconds an unused connection is kept
+                             alive (default: 60)
+        timeout -- default time limit in seconds for every call,
+                   None means no limit (default: None)
+        retry_policy -- a RetryPolicy for read-only commands
+                        (default: None)
+        circuit_breaker -- a CircuitBreaker, or True to use the
+                           one shared for the host (default: None)
+        auth -- 'basic' or 'session', to login once and reuse the
+                session on every request (default: 'basic')
+        login_key -- a login key to login with instead of
+                     the password (default: None)
+        """
+        self._connector = AsyncApiConnector(username,
+                                            password,
+                                            hostname,
+                                            port,
+                                            https,
+                                            workers,
+                                            pool_idle_timeout,
+                                            timeout,
+                                            retry_policy,
+                                            circuit_breaker,
+                                            auth,
+                                            login_key)
+        self._api = Api(username,
+                        password,
+                        hostname,
+                        port,
+                        https,
+                        connector=self._connector)
+
+    def close(self, cancel=True):
+        """Close
+
+        Stops the workers and closes the connections
+        kept alive to the server
+
+        Parameters:
+        cancel -- boolean, if True the calls that haven't
+                  started are cancelled (default: True)
+        """
+        self._connector.close(cancel)
+
+    def add_metrics_sink(self, sink):
+        """Add metrics sink
+
+        Registers an object whose record() method gets the
+        CommandMetrics of every command sent by the API
+        (see ApiConnector.add_metrics_sink)
+        """
+        self._connector.add_metrics_sink(sink)
+
+    def remove_metrics_sink(self, sink):
+        """Unregisters a metrics sink"""
+        self._connector.remove_metrics_sink(sink)
+
+    def get_coalesced_calls(self):
+        """Returns the number of calls that shared the
+           request of another thread instead of sending
+           their own (see ApiConnector)"""
+        return self._connector.get_coalesced_calls()
+
+
+def _async_method(name):
+    """Builds the AsyncApi counterpart of an Api method"""
+    def method(self, *args, **kwargs):
+        timeout = kwargs.pop('timeout', None)
+        return self._connector.spawn(getattr(self._api, name),
+                                     args,
+                                     kwargs,
+                                     timeout)
+    method.__name__ = name
+    method.__doc__ = "%s\n        Runs in the background and returns a Future" % \
+                     getattr(Api, name).__doc__
+    return method
+
+# Methods returning generators run lazily on the caller's
+# thread, gather() runs a pool of its own, and with_priority()
+# and login_as() return another Api, so they aren't mirrored
+_not_mirrored = ('map', 'gather', 'iter_all_users', 'iter_users',
+                 'iter_domains', 'iter_email_list_member',
+                 'create_users', 'create_resellers',
+                 'with_priority', 'login_as')
+
+for _name, _value in Api.__dict__.items():
+    if not _name.startswith('_') and callable(_value) and \
+       _name not in _not_mirrored and not hasattr(AsyncApi, _name):
+        setattr(AsyncApi, _name, _async_method(_name))
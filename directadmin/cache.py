@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+"""Directadmin API - Python implementation of Directadmin Web API
+
+Copyright (C) 2009, Andrés Gattinoni
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+=======================================================================
+
+Response cache
+
+Keeps the responses of read-only commands for a while, so
+repeated queries don't hit the server every time.
+
+$Id$
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+
+__all__ = ['freeze_parameters', 'copy_response', 'ResponseCache']
+
+# Default time to live (in seconds) of the cached commands.
+# Commands not listed here are not cached unless a TTL is given
+_default_ttls = {'CMD_API_SHOW_ALL_USERS': 300,
+                 'CMD_API_SHOW_USERS': 300,
+                 'CMD_API_SHOW_RESELLERS': 300,
+                 'CMD_API_SHOW_ADMINS': 300,
+                 'CMD_API_SHOW_DOMAINS': 300,
+                 'CMD_API_SHOW_USER_DOMAINS': 300,
+                 'CMD_API_SHOW_RESELLER_IPS': 600,
+                 'CMD_API_PACKAGES_RESELLER': 600,
+                 'CMD_API_PACKAGES_USER': 600,
+                 'CMD_API_SUBDOMAINS': 300,
+                 'CMD_API_POP': 300}
+
+# Cached commands affected by the commands that change the server,
+# as (command, scope) tuples. A scope of 'user' or 'domain' drops
+# only the entries for the users or domain sent in the change.
+# Changes with commands not listed here clear the whole cache
+_accounts = [('CMD_API_SHOW_ALL_USERS', None),
+             ('CMD_API_SHOW_USERS', None),
+             ('CMD_API_SHOW_RESELLERS', None),
+             ('CMD_API_SHOW_ADMINS', None),
+             ('CMD_API_SHOW_DOMAINS', None),
+             ('CMD_API_DOMAIN_OWNERS', None),
+             ('CMD_API_SHOW_RESELLER_IPS', None),
+             ('CMD_API_ADMIN_STATS', None),
+             ('CMD_API_SHOW_USER_CONFIG', 'user'),
+             ('CMD_API_SHOW_USER_DOMAINS', 'user'),
+             ('CMD_API_SHOW_USER_USAGE', 'user')]
+
+_invalidations = {
+    'CMD_API_ACCOUNT_ADMIN': _accounts,
+    'CMD_API_ACCOUNT_RESELLER': _accounts,
+    'CMD_API_ACCOUNT_USER': _accounts,
+    'CMD_API_SELECT_USERS': _accounts,
+    'CMD_API_CHANGE_INFO': [('CMD_API_SHOW_USER_CONFIG', None)],
+    'CMD_API_SUBDOMAINS': [('CMD_API_SUBDOMAINS', 'domain'),
+                           ('CMD_API_SHOW_USER_USAGE', None),
+                           ('CMD_API_ADMIN_STATS', None)],
+    'CMD_API_DATABASES': [('CMD_API_DATABASES', None),
+                          ('CMD_API_SHOW_USER_USAGE', None)],
+    'CMD_API_POP': [('CMD_API_POP', 'domain'),
+                    ('CMD_API_SHOW_USER_USAGE', None)],
+    'CMD_API_CHANGE_EMAIL_PASSWORD': [],
+    # Password checks are POSTed but change nothing, and their
+    # answers are never cached
+    'CMD_API_EMAIL_AUTH': [],
+    'CMD_API_EMAIL_VACATION': [('CMD_API_EMAIL_VACATION', 'domain'),
+                               ('CMD_API_EMAIL_VACATION_MODIFY', 'domain')],
+    'CMD_API_EMAIL_AUTORESPONDER': [
+        ('CMD_API_EMAIL_AUTORESPONDER', 'domain'),
+        ('CMD_API_EMAIL_AUTORESPONDER_MODIFY', 'domain')],
+    'CMD_API_EMAIL_LIST': [('CMD_API_EMAIL_LIST', 'domain')],
+    'CMD_API_SITE_BACKUP': []}
+
+_select_key = re.compile(r'^select\d+$')
+
+
+def freeze_parameters(parameters):
+    """Freeze parameters
+
+    Returns a hashable, sorted tuple of (key, value) string pairs
+    built from a list of tuples or a dictionary of parameters.
+    Used as part of the cache and request coalescing keys
+
+    Parameters:
+    parameters -- list of tuples, dictionary or None
+    """
+    if parameters is None:
+        return ()
+    if isinstance(parameters, dict):
+        parameters = parameters.items()
+    return tuple(sorted((str(k), str(v)) for k, v in parameters))
+
+
+def copy_response(value):
+    """Copy response
+
+    Returns a copy of a response, so callers can modify
+    it without altering a cached or shared result
+
+    Parameters:
+    value -- response returned by a connector
+    """
+    if isinstance(value, list):
+        return list(value)
+    if isinstance(value, dict):
+        return dict((k, list(v) if isinstance(v, list) else v)
+                    for k, v in value.items())
+    return value
+
+
+class ResponseCache(object):
+    """Response Cache
+
+    Least recently used cache with a time to live for the
+    responses of read-only commands. Pass it to an Api object
+    to enable it:
+
+    cache = ResponseCache(size=2048, ttls={'CMD_API_SHOW_USER_USAGE': 60})
+    api = Api("admin", "password", "hostname.com", cache=cache)
+
+    When the Api sends a command that changes the server, like
+    creating an account or a subdomain, the cached responses
+    it affects are dropped.
+
+    The hits, misses, evictions and invalidations attributes
+    count the cache activity.
+
+    Every invalidation also bumps a generation counter for the
+    commands, users and domains it affects. A caller that reads
+    the generation() before sending a command and passes it to
+    put() won't store a response that an invalidation made
+    stale while the command was running.
+    """
+
+    def __init__(self, size=1024, ttls=None):
+        """Constructor
+
+        Parameters:
+        size -- maximum number of responses to keep (default: 1024)
+        ttls -- dictionary of command names and the seconds their
+                responses are kept, updating the defaults. A TTL of
+                zero disables caching of a command (default: None)
+        """
+        self._size = int(size)
+        self._ttls = dict(_default_ttls)
+        if ttls is not None:
+            self._ttls.update(ttls)
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._cleared = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def caches(self, cmd):
+        """Returns True if the responses of a command are cached"""
+        return self._ttls.get(cmd, 0) > 0
+
+    def generation(self, cmd, parameters=None, get=None):
+        """Generation
+
+        Returns the current generation of the responses of
+        a command, to be passed to put() once it finishes
+
+        Parameters:
+        cmd -- command to send to the server
+        parameters -- list of tuples with its parameters
+        get -- list of tuples with its GET parameters
+        """
+        fields = dict(freeze_parameters(parameters) + freeze_parameters(get))
+        with self._lock:
+            return self._generation(cmd, fields)
+
+    def _generation(self, cmd, fields):
+        """Returns the generation of a command for the parameter
+           fields given. Must be called holding the lock"""
+        return (self._cleared,
+                self._generations.get((cmd, None, None), 0),
+                self._generations.get((cmd, 'user', fields.get('user')), 0),
+                self._generations.get((cmd, 'domain', fields.get('domain')),
+                                      0))
+
+    def _bump(self, key):
+        """Bumps a generation counter. Must be called holding
+           the lock"""
+        self._generations[key] = self._generations.get(key, 0) + 1
+
+    def get(self, cmd, parameters=None, get=None):
+        """Get
+
+        Looks for the cached response of a command
+
+        Returns a tuple (found, response)
+        """
+        key = (cmd, freeze_parameters(parameters),
+               freeze_parameters(get))
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None or entry[0] < time.time():
+                self.misses += 1
+                return False, None
+            # Move the entry to the end, as the most recently used
+            self._entries[key] = entry
+            self.hits += 1
+        return True, copy_response(entry[2])
+
+    def put(self, cmd, parameters, get, response, generation=None):
+        """Put
+
+        Stores the response of a command, if it is cached
+
+        Parameters:
+        cmd -- command sent to the server
+        parameters -- list of tuples with its parameters
+        get -- list of tuples with its GET parameters
+        response -- response of the command
+        generation -- value returned by generation() before
+                      sending the command. If an invalidation
+                      changed it since, the response is not
+                      stored (default: None, always store it)
+        """
+        ttl = self._ttls.get(cmd, 0)
+        if ttl <= 0:
+            return
+        key = (cmd, freeze_parameters(parameters),
+               freeze_parameters(get))
+        # Keep the parameters at hand for scoped invalidations
+        fields = dict(key[1] + key[2])
+        with self._lock:
+            if generation is not None and \
+               generation != self._generation(cmd, fields):
+                return
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time() + ttl, fields,
+                                  copy_response(response))
+            while len(self._entries) > self._size:
+                self._entries.popitem(False)
+                self.evictions += 1
+
+    def invalidate(self, cmd, parameters=None):
+        """Invalidate
+
+        Drops the cached responses affected by a command
+        that changes the server
+
+        Parameters:
+        cmd -- command sent to the server
+        parameters -- list of tuples with its parameters
+        """
+        if cmd not in _invalidations:
+            self.clear()
+            return
+        values = {'user': set(), 'domain': set()}
+        for key, value in freeze_parameters(parameters):
+            if key in ('username', 'user') or _select_key.match(key):
+                values['user'].add(value)
+            elif key == 'domain':
+                values['domain'].add(value)
+
+        with self._lock:
+            for command, scope in _invalidations[cmd]:
+                if scope is None:
+                    self._bump((command, None, None))
+                    continue
+                for value in values[scope]:
+                    self._bump((command, scope, value))
+            for key, entry in self._entries.items():
+                for command, scope in _invalidations[cmd]:
+                    if key[0] != command:
+                        continue
+                    if scope is None or entry[1].get(scope) in values[scope]:
+                        del self._entries[key]
+                        self.invalidations += 1
+                        break
+
+    def clear(self):
+        """Drops all the cached responses"""
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._generations.clear()
+            self._cleared += 1
+
+    def stats(self):
+        """Returns a dictionary with the cache counters"""
+        with self._lock:
+            return {'size': len(self._entries),
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'invalidations': self.invalidations}
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""Directadmin API - Python implementation of Directadmin Web API
+
+Copyright (C) 2009, Andrés Gattinoni
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+=======================================================================
+
+Server pool
+
+Runs API commands against many Directadmin servers at once.
+
+$Id$
+"""
+
+import os
+import ConfigParser
+
+from api import Api, ApiConnector, ApiError
+from workers import WorkerPool, as_completed
+
+__all__ = ['ServerPool']
+
+
+class ServerPool(object):
+    """Server Pool
+
+    Holds the Api objects of many Directadmin servers and runs
+    API methods on all (or some) of them concurrently, so a
+    query to the whole fleet takes as long as the slowest
+    server instead of the sum of all of them.
+
+    Usage:
+
+    pool = ServerPool.from_config('~/.daconsole.conf')
+    for server, users, error in pool.run('list_all_users'):
+        ...
+
+    OR
+
+    pool = ServerPool()
+    pool.add_server('web1', Api('admin', 'password', 'web1.com'))
+    pool.add_server('web2', Api('admin', 'password', 'web2.com'))
+    users, errors = pool.merge('list_all_users')
+    """
+
+    def __init__(self, servers=None, workers=16):
+        """Constructor
+
+        Parameters:
+        servers -- dictionary of server names and Api objects
+                   (default: None)
+        workers -- maximum number of servers to query at the
+                   same time (default: 16)
+        """
+        self._servers = {}
+        self._workers = int(workers)
+        if servers is not None:
+            for name, api in servers.items():
+                self.add_server(name, api)
+
+    @classmethod
+    def from_config(cls, filename, workers=16, timeout=None, **options):
+        """From config
+
+        Builds a ServerPool from a configuration file like
+        the one used by da_console, with one section for each
+        server:
+
+        [server_name]
+        hostname = server.domain.com
+        port = 2222
+        username = admin
+        password = secret
+        https = yes
+
+        Parameters:
+        filename -- path of the configuration file
+        workers -- maximum number of servers to query at the
+                   same time (default: 16)
+        timeout -- seconds to wait for each server on every
+                   request, None waits forever (default: None)
+
+        Other keyword arguments, like retry_policy or
+        circuit_breaker, are passed to the ApiConnector
+        of every server.
+        """
+        parser = ConfigParser.SafeConfigParser({'hostname': 'localhost',
+                                                'port': '2222',
+                                                'https': 'no'})
+        with open(os.path.expanduser(filename)) as f:
+            parser.readfp(f)
+        pool = cls(workers=workers)
+        for section in parser.sections():
+            connector = ApiConnector(parser.get(section, 'username'),
+                                     parser.get(section, 'password'),
+                                     parser.get(section, 'hostname'),
+                                     parser.getint(section, 'port'),
+                                     parser.getboolean(section, 'https'),
+                                     timeout=timeout,
+                                     **options)
+            pool.add_server(section, Api(None, None, connector=connector))
+        return pool
+
+    def add_server(self, name, api):
+        """Adds a server to the pool
+
+        Parameters:
+        name -- name to identify the server
+        api -- Api object of the server
+        """
+        if not isinstance(api, Api):
+            raise TypeError("api must be an Api object")
+        self._servers[name] = api
+
+    def remove_server(self, name):
+        """Removes a server from the pool and closes its connections"""
+        self._servers.pop(name).close()
+
+    def get_server(self, name):
+        """Returns the Api object of a server"""
+        return self._servers[name]
+
+    def list_servers(self):
+        """Returns the sorted list of server names"""
+        return sorted(self._servers.keys())
+
+    def _select(self, servers):
+        """Returns the names of the servers selected by a filter"""
+        if servers is None:
+            return self.list_servers()
+        if callable(servers):
+            return [name for name in self.list_servers() if servers(name)]
+        for name in servers:
+            if name not in self._servers:
+                raise KeyError("Unknown server: %s" % name)
+        return list(servers)
+
+    def run(self, method, args=(), kwargs=None, servers=None):
+        """Run
+
+        Calls an API method on every selected server at the
+        same time and yields a tuple (server, result, error)
+        as each server answers.
+
+        If a server raises ApiError, the exception is returned
+        as 'error' (and 'result' is None) and the other servers
+        go on.
+
+        Parameters:
+        method -- name of the API method to call, or a function
+                  that takes the Api object of the server
+                  followed by args
+        args -- tuple of arguments for the method (default: ())
+        kwargs -- dictionary of keyword arguments for the
+                  method (default: None)
+        servers -- servers to run the method on: None for all
+                   of them, a list of server names, or a function
+                   that takes a server name and returns True for
+                   the servers to use (default: None)
+        """
+        if kwargs is None:
+            kwargs = {}
+        names = self._select(servers)
+        if not names:
+            return
+        pool = WorkerPool(min(self._workers, len(names)))
+        futures = {}
+        try:
+            for name in names:
+                api = self._servers[name]
+                if callable(method):
+                    future = pool.submit(method, api, *args, **kwargs)
+                else:
+                    future = pool.submit(getattr(api, method),
+                                         *args,
+                                         **kwargs)
+                futures[future] = name
+            for future in as_completed(futures.keys()):
+                try:
+                    result, error = future.result(), None
+                except ApiError, e:
+                    result, error = None, e
+                yield futures[future], result, error
+        finally:
+            pool.shutdown(False, True)
+
+    def gather(self, method, args=(), kwargs=None, servers=None):
+        """Gather
+
+        Same as run(), but waits for all the servers to answer.
+
+        Returns a tuple (results, errors) of dictionaries
+        which map each server name to its result or to
+        the ApiError it raised.
+        """
+        results = {}
+        errors = {}
+        for name, result, error in self.run(method, args, kwargs, servers):
+            if error is None:
+                results[name] = result
+            else:
+                errors[name] = error
+        return results, errors
+
+    def merge(self, method, args=(), kwargs=None, servers=None):
+        """Merge
+
+        Calls a method that returns a list (like list_all_users
+        or list_resellers) on the selected servers and merges
+        all the lists into one.
+
+        Returns a tuple (items, errors), where items is a list
+        of (server, item) tuples and errors is a dictionary
+        which maps server names to the ApiError they raised.
+        """
+        items = []
+        errors = {}
+        for name, result, error in self.run(method, args, kwargs, servers):
+            if error is not None:
+                errors[name] = error
+            elif isinstance(result, list):
+                items.extend([(name, item) for item in result])
+        return items, errors
+
+    def close(self):
+        """Closes the connections to all the servers"""
+        for api in self._servers.values():
+            api.close()
@@ -0,0 +1,500 @@
+# -*- coding: utf-8 -*-
+"""Directadmin API - Python implementation of Directadmin Web API
+
+Copyright (C) 2009, Andrés Gattinoni
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+=======================================================================
+
+Inventory
+
+Local SQLite index of the accounts, domains and mailboxes of a
+server, to answer questions about them without asking the panel,
+and a crawler that walks everything the server holds.
+
+$Id$
+"""
+
+import json
+import sqlite3
+import Queue
+
+from api import ApiError
+from sync import SyncEngine, UserSnapshot
+from workers import WorkerPool
+
+__all__ = ['InventoryIndex', 'InventoryCrawler']
+
+_schema = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    reseller TEXT,
+    package TEXT,
+    usertype TEXT,
+    email TEXT,
+    suspended INTEGER,
+    snapshot TEXT
+);
+CREATE TABLE IF NOT EXISTS domains (
+    domain TEXT PRIMARY KEY,
+    username TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS subdomains (
+    domain TEXT NOT NULL,
+    subdomain TEXT NOT NULL,
+    PRIMARY KEY (domain, subdomain)
+);
+CREATE TABLE IF NOT EXISTS mailboxes (
+    domain TEXT NOT NULL,
+    account TEXT NOT NULL,
+    PRIMARY KEY (domain, account)
+);
+CREATE INDEX IF NOT EXISTS users_reseller ON users (reseller);
+CREATE INDEX IF NOT EXISTS users_package ON users (package);
+CREATE INDEX IF NOT EXISTS domains_username ON domains (username);
+"""
+
+
+def _names(response):
+    """Returns the sorted names of a list or dictionary response,
+       and an empty list for commands that returned nothing"""
+    if isinstance(response, (list, dict)):
+        return sorted(response)
+    return []
+
+
+class InventoryIndex(object):
+    """Inventory Index
+
+    Crawls a server into a SQLite database and answers
+    lookups from it, without contacting the panel:
+
+        find_domain_owner    -- which user owns a domain
+        list_users_by_package, list_users_by_reseller
+        list_domains         -- domains of a user
+        list_mailboxes       -- mailboxes of a domain, a user
+                                or all the users of a reseller
+
+    refresh() updates the index through a SyncEngine, so only
+    the users that changed since the last refresh are fetched
+    again, even after the process restarts. The mailboxes of a
+    domain are fetched when the domain is new or its user
+    changed; refresh(full=True) fetches them all. The domains
+    whose mailboxes couldn't be fetched keep the ones they had,
+    are listed in the 'errors' attribute, and are fetched again
+    on the next refresh.
+
+    Usage:
+
+    index = InventoryIndex(api, '/var/lib/inventory.db')
+    index.refresh()
+    print index.find_domain_owner('domain.com')
+    """
+
+    def __init__(self, api, filename=':memory:', workers=4):
+        """Constructor
+
+        Parameters:
+        api -- Api object of the server, None to only
+               query an existing index
+        filename -- path of the SQLite database (default: in memory)
+        workers -- maximum number of concurrent requests when
+                   refreshing (default: 4)
+        """
+        self._api = api
+        self._workers = int(workers)
+        self.errors = {}
+        self._db = sqlite3.connect(filename)
+        self._db.executescript(_schema)
+        self._engine = None
+        if api is not None:
+            self._engine = SyncEngine(api, workers)
+            snapshot = {}
+            for username, data in self._db.execute(
+                    "SELECT username, snapshot FROM users"):
+                snapshot[username] = UserSnapshot.from_dict(json.loads(data))
+            self._engine.set_snapshot(snapshot)
+
+    def refresh(self, full=False):
+        """Refresh
+
+        Brings the index up to date with the server
+
+        Parameters:
+        full -- boolean, if True the mailboxes of every domain
+                are fetched again (default: False)
+
+        Returns the ChangeSet of the sync. The domains whose
+        mailboxes couldn't be fetched are left in 'errors', a
+        dictionary of domains and the ApiError raised.
+        """
+        if self._engine is None:
+            raise ValueError("The index has no Api to refresh from")
+        changes = self._engine.sync()
+
+        # Domains whose mailboxes are fetched, and their owners.
+        # The mailboxes are kept until the new ones arrive
+        mailbox_domains = {}
+        with self._db:
+            for username in changes.removed:
+                self._delete_user(username)
+            for snapshot in changes.added.values():
+                self._delete_user(snapshot.username, False)
+                self._insert_user(snapshot)
+                mailbox_domains.update((domain, snapshot.username)
+                                       for domain in snapshot.domains)
+            for old, new, parts in changes.modified.values():
+                self._delete_user(new.username, False)
+                self._insert_user(new)
+                mailbox_domains.update((domain, new.username)
+                                       for domain in new.domains)
+            # Drop the mailboxes of the domains that are gone
+            self._db.execute("DELETE FROM mailboxes WHERE domain NOT IN "
+                             "(SELECT domain FROM domains)")
+
+        if full:
+            mailbox_domains.update(self._db.execute(
+                "SELECT domain, username FROM domains"))
+        else:
+            # Fetch again the ones that failed last time
+            for domain in self.errors:
+                owner = self.find_domain_owner(domain)
+                if owner is not None:
+                    mailbox_domains.setdefault(domain, owner)
+        self.errors = self._refresh_mailboxes(mailbox_domains)
+        return changes
+
+    def _delete_user(self, username, mailboxes=True):
+        """Removes a user and everything it owns from the index,
+           except its mailboxes if mailboxes is False"""
+        domains = "SELECT domain FROM domains WHERE username = ?"
+        if mailboxes:
+            self._db.execute("DELETE FROM mailboxes WHERE domain IN (%s)" %
+                             domains, (username,))
+        self._db.execute("DELETE FROM subdomains WHERE domain IN (%s)" %
+                         domains, (username,))
+        self._db.execute("DELETE FROM domains WHERE username = ?",
+                         (username,))
+        self._db.execute("DELETE FROM users WHERE username = ?", (username,))
+
+    def _insert_user(self, snapshot):
+        """Adds a user, its domains and subdomains to the index"""
+        limits = snapshot.limits
+
+        def field(key):
+            values = limits.get(key)
+            if values:
+                return values[0]
+            return None
+
+        self._db.execute("INSERT INTO users VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         (snapshot.username,
+                          field('creator'),
+                          field('package'),
+                          field('usertype'),
+                          field('email'),
+                          field('suspended') == 'yes',
+                          json.dumps(snapshot.to_dict())))
+        self._db.executemany("INSERT OR REPLACE INTO domains VALUES (?, ?)",
+                             [(domain, snapshot.username)
+                              for domain in snapshot.domains])
+        for domain, subdomains in snapshot.subdomains.items():
+            self._db.executemany("INSERT OR REPLACE INTO subdomains "
+                                 "VALUES (?, ?)",
+                                 [(domain, subdomain)
+                                  for subdomain in subdomains])
+
+    def _refresh_mailboxes(self, domains):
+        """Fetches the mailboxes of some domains into the index,
+           logged in as the users that own them
+
+        Parameters:
+        domains -- dictionary mapping each domain to its owner
+
+        Returns a dictionary of the domains that failed
+        and the ApiError raised
+        """
+        errors = {}
+        if not domains:
+            return errors
+        apis = dict((owner, self._api.login_as(owner))
+                    for owner in set(domains.values()))
+
+        def list_pop_accounts(owner, domain):
+            return apis[owner].list_pop_accounts(domain)
+
+        for (owner, domain), accounts, error in self._api.map(
+                list_pop_accounts,
+                sorted((owner, domain)
+                       for domain, owner in domains.items()),
+                self._workers):
+            if error is not None:
+                errors[domain] = error
+                continue
+            if not isinstance(accounts, list):
+                accounts = []
+            with self._db:
+                self._db.execute("DELETE FROM mailboxes WHERE domain = ?",
+                                 (domain,))
+                self._db.executemany("INSERT INTO mailboxes VALUES (?, ?)",
+                                     [(domain, account)
+                                      for account in accounts])
+        return errors
+
+    def find_domain_owner(self, domain):
+        """Returns the username that owns a domain, None if
+           the domain isn't in the index"""
+        row = self._db.execute("SELECT username FROM domains "
+                               "WHERE domain = ?", (domain,)).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def get_user(self, username):
+        """Returns a dictionary with the indexed information
+           of a user, None if the user isn't in the index"""
+        row = self._db.execute("SELECT username, reseller, package, "
+                               "usertype, email, suspended FROM users "
+                               "WHERE username = ?", (username,)).fetchone()
+        if row is None:
+            return None
+        return {'username': row[0],
+                'reseller': row[1],
+                'package': row[2],
+                'usertype': row[3],
+                'email': row[4],
+                'suspended': bool(row[5]),
+                'domains': self.list_domains(username)}
+
+    def list_users(self):
+        """Returns the sorted list of indexed usernames"""
+        return self._column("SELECT username FROM users ORDER BY username")
+
+    def list_users_by_package(self, package):
+        """Returns the sorted list of users on a package"""
+        return self._column("SELECT username FROM users WHERE package = ? "
+                            "ORDER BY username", (package,))
+
+    def list_users_by_reseller(self, reseller):
+        """Returns the sorted list of users created by a reseller"""
+        return self._column("SELECT username FROM users WHERE reseller = ? "
+                            "ORDER BY username", (reseller,))
+
+    def list_domains(self, username):
+        """Returns the sorted list of domains of a user"""
+        return self._column("SELECT domain FROM domains WHERE username = ? "
+                            "ORDER BY domain", (username,))
+
+    def list_subdomains(self, domain):
+        """Returns the sorted list of subdomains of a domain"""
+        return self._column("SELECT subdomain FROM subdomains "
+                            "WHERE domain = ? ORDER BY subdomain", (domain,))
+
+    def list_mailboxes(self, domain=None, username=None, reseller=None):
+        """List mailboxes
+
+        Returns the sorted list of mailboxes (as account@domain)
+        of a domain, of the domains of a user, or of the domains
+        of all the users of a reseller. Only one of the filters
+        can be given, none lists every mailbox.
+        """
+        query = "SELECT account || '@' || mailboxes.domain FROM mailboxes"
+        if domain is not None:
+            query += " WHERE mailboxes.domain = ?"
+            parameters = (domain,)
+        elif username is not None:
+            query += " JOIN domains ON domains.domain = mailboxes.domain " \
+                     "WHERE domains.username = ?"
+            parameters = (username,)
+        elif reseller is not None:
+            query += " JOIN domains ON domains.domain = mailboxes.domain " \
+                     "JOIN users ON users.username = domains.username " \
+                     "WHERE users.reseller = ?"
+            parameters = (reseller,)
+        else:
+            parameters = ()
+        return self._column(query + " ORDER BY 1", parameters)
+
+    def _column(self, query, parameters=()):
+        """Returns the first column of the rows of a query"""
+        return [row[0] for row in self._db.execute(query, parameters)]
+
+    def close(self):
+        """Closes the database"""
+        self._db.close()
+
+
+class InventoryCrawler(object):
+    """Inventory Crawler
+
+    Walks the whole tree of a server: resellers, users, domains
+    and, for each user, its subdomains, POP accounts, databases,
+    autoresponders and email lists. The records are yielded as
+    they arrive, as dictionaries with a 'type' key:
+
+        reseller       -- reseller
+        user           -- user, creator, domains
+        domain         -- user, domain, settings
+        subdomains     -- user, domain, subdomains
+        pop_accounts   -- user, domain, accounts
+        autoresponders -- user, domain, autoresponders
+        email_lists    -- user, domain, lists
+        databases      -- user, databases
+        error          -- call, arguments, error
+
+    Each list is a task on a work queue, run by a bounded pool
+    of workers. The tasks found by a task are queued after it,
+    and the newest ones run first, so the crawler finishes the
+    users it started before listing more of them and the queue
+    stays short. The commands of a user run logged in as it
+    (see Api.login_as).
+
+    Usage:
+
+    crawler = InventoryCrawler(api, workers=8)
+    for record in crawler.crawl():
+        print json.dumps(record)
+    """
+
+    def __init__(self, api, workers=8):
+        """Constructor
+
+        Parameters:
+        api -- Api object of the server, logged in
+               as an admin or a reseller
+        workers -- maximum number of concurrent requests
+                   (default: 8)
+        """
+        self._api = api
+        self._workers = int(workers)
+        self.calls = 0
+        self.errors = 0
+
+    def crawl(self):
+        """Crawl
+
+        Walks the server and yields its records. The calls
+        that fail are yielded as 'error' records, and the
+        crawl goes on.
+        """
+        pool = WorkerPool(self._workers)
+        finished = Queue.Queue()
+        # Pending tasks, newest last: (method name, arguments)
+        pending = [('_crawl_users', (None, None)),
+                   ('_crawl_resellers', ())]
+        running = 0
+        try:
+            while pending or running:
+                while pending and running < self._workers * 2:
+                    task = pending.pop()
+                    future = pool.submit(getattr(self, task[0]), *task[1])
+                    future.add_done_callback(
+                        lambda f, task=task: finished.put((task, f)))
+                    running += 1
+                task, future = finished.get()
+                running -= 1
+                self.calls += 1
+                try:
+                    records, tasks = future.result()
+                except ApiError, e:
+                    self.errors += 1
+                    records = [{'type': 'error',
+                                'call': task[0][len('_crawl_'):],
+                                'arguments': [a for a in task[1]
+                                              if a is not None],
+                                'error': str(e)}]
+                    tasks = []
+                for record in records:
+                    yield record
+                pending.extend(reversed(tasks))
+        finally:
+            # Once every task is done the workers are idle
+            pool.shutdown(running == 0, True)
+
+    def _crawl_resellers(self):
+        """Lists the resellers"""
+        resellers = _names(self._api.list_resellers())
+        return ([{'type': 'reseller', 'reseller': reseller}
+                 for reseller in resellers],
+                [task for reseller in resellers
+                 for task in (('_crawl_user', (reseller, None)),
+                              ('_crawl_users', (reseller, reseller)))])
+
+    def _crawl_users(self, reseller, creator):
+        """Lists the users of a reseller, or of
+           the logged user if reseller is None"""
+        users = _names(self._api.list_users(reseller))
+        return [], [('_crawl_user', (user, creator)) for user in users]
+
+    def _crawl_user(self, user, creator):
+        """Lists the domains of a user"""
+        domains = self._api.get_user_domains(user)
+        if not isinstance(domains, dict):
+            domains = dict((domain, ['']) for domain in _names(domains))
+        records = [{'type': 'user',
+                    'user': user,
+                    'creator': creator,
+                    'domains': sorted(domains)}]
+        tasks = [('_crawl_databases', (user,))]
+        for domain in sorted(domains):
+            records.append({'type': 'domain',
+                            'user': user,
+                            'domain': domain,
+                            'settings': domains[domain][0]})
+            for method in ('_crawl_subdomains',
+                           '_crawl_pop_accounts',
+                           '_crawl_autoresponders',
+                           '_crawl_email_lists'):
+                tasks.append((method, (user, domain)))
+        return records, tasks
+
+    def _crawl_subdomains(self, user, domain):
+        """Lists the subdomains of a domain"""
+        subdomains = self._api.login_as(user).list_subdomains(domain)
+        return [{'type': 'subdomains',
+                 'user': user,
+                 'domain': domain,
+                 'subdomains': _names(subdomains)}], []
+
+    def _crawl_pop_accounts(self, user, domain):
+        """Lists the POP accounts of a domain"""
+        accounts = self._api.login_as(user).list_pop_accounts(domain)
+        return [{'type': 'pop_accounts',
+                 'user': user,
+                 'domain': domain,
+                 'accounts': _names(accounts)}], []
+
+    def _crawl_autoresponders(self, user, domain):
+        """Lists the autoresponders of a domain"""
+        autoresponders = self._api.login_as(user).list_autoresponder(domain)
+        return [{'type': 'autoresponders',
+                 'user': user,
+                 'domain': domain,
+                 'autoresponders': _names(autoresponders)}], []
+
+    def _crawl_email_lists(self, user, domain):
+        """Lists the email lists of a domain"""
+        lists = self._api.login_as(user).list_email_list(domain)
+        return [{'type': 'email_lists',
+                 'user': user,
+                 'domain': domain,
+                 'lists': _names(lists)}], []
+
+    def _crawl_databases(self, user):
+        """Lists the databases of a user"""
+        databases = self._api.login_as(user).list_databases()
+        return [{'type': 'databases',
+                 'user': user,
+                 'databases': _names(databases)}], []
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""Directadmin API - Python implementation of Directadmin Web API
+
+Copyright (C) 2009, Andrés Gattinoni
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+=======================================================================
+
+Metrics
+
+Timing and outcome of each command sent to the server, and
+an in-memory aggregator for them.
+
+$Id$
+"""
+
+import threading
+
+__all__ = ['CommandMetrics', 'MetricsAggregator']
+
+# Upper bounds (in milliseconds) of the latency histogram buckets
+_buckets = (1, 2, 5, 10, 20, 50, 100, 200, 500,
+            1000, 2000, 5000, 10000, 30000, 60000)
+
+
+class CommandMetrics(object):
+    """Command Metrics
+
+    Measures of a command sent by an ApiConnector.
+    Times are in seconds:
+
+        cmd              -- command name
+        priority         -- priority class the command was sent with
+        queue_time       -- time spent waiting for a free slot
+                            of the RequestScheduler
+        connect_time     -- time spent opening the connection,
+                            zero when a kept-alive one was reused
+        first_byte_time  -- time from sending the request to
+                            getting the response headers
+        transfer_time    -- time spent reading the response body
+        parse_time       -- time spent decompressing and parsing the
+                            body. Streamed commands parse while they
+                            read, so their parse time only counts
+                            the decompression
+        total_time       -- time from start to finish of the command
+        response_bytes   -- size of the response body, as received
+        error            -- name of the exception class raised by
+                            the command, None if it succeeded
+    """
+    __slots__ = ('cmd',
+                 'priority',
+                 'queue_time',
+                 'connect_time',
+                 'first_byte_time',
+                 'transfer_time',
+                 'parse_time',
+                 'total_time',
+                 'response_bytes',
+                 'error')
+
+    def __init__(self, cmd):
+        """Constructor"""
+        self.cmd = cmd
+        self.priority = None
+        self.queue_time = 0.0
+        self.connect_time = 0.0
+        self.first_byte_time = 0.0
+        self.transfer_time = 0.0
+        self.parse_time = 0.0
+        self.total_time = 0.0
+        self.response_bytes = 0
+        self.error = None
+
+    def __repr__(self):
+        return "<CommandMetrics %s %.1fms %s>" % \
+               (self.cmd, self.total_time * 1000, self.error or 'ok')
+
+
+class MetricsAggregator(object):
+    """Metrics Aggregator
+
+    Metrics sink which keeps per-command counters and latency
+    histograms in memory.
+
+    Usage:
+
+    metrics = MetricsAggregator()
+    api.add_metrics_sink(metrics)
+    ...
+    print metrics.format_report()
+    """
+
+    def __init__(self):
+        """Constructor"""
+        self._lock = threading.Lock()
+        self._commands = {}
+
+    def record(self, metrics):
+        """Adds the CommandMetrics of a command to the counters"""
+        latency = metrics.total_time * 1000
+        bucket = len(_buckets)
+        for n, bound in enumerate(_buckets):
+            if latency <= bound:
+                bucket = n
+                break
+
+        with self._lock:
+            stats = self._commands.get(metrics.cmd)
+            if stats is None:
+                stats = {'count': 0,
+                         'errors': {},
+                         'response_bytes': 0,
+                         'queue_time': 0.0,
+                         'connect_time': 0.0,
+                         'first_byte_time': 0.0,
+                         'transfer_time': 0.0,
+                         'parse_time': 0.0,
+                         'total_time': 0.0,
+                         'histogram': [0] * (len(_buckets) + 1)}
+                self._commands[metrics.cmd] = stats
+            stats['count'] += 1
+            if metrics.error is not None:
+                stats['errors'][metrics.error] = \
+                    stats['errors'].get(metrics.error, 0) + 1
+            stats['response_bytes'] += metrics.response_bytes
+            stats['queue_time'] += metrics.queue_time
+            stats['connect_time'] += metrics.connect_time
+            stats['first_byte_time'] += metrics.first_byte_time
+            stats['transfer_time'] += metrics.transfer_time
+            stats['parse_time'] += metrics.parse_time
+            stats['total_time'] += metrics.total_time
+            stats['histogram'][bucket] += 1
+
+    def reset(self):
+        """Drops all the counters"""
+        with self._lock:
+            self._commands = {}
+
+    def report(self):
+        """Report
+
+        Returns a dictionary with the counters of each command:
+
+            count            -- number of times it was sent
+            errors           -- dictionary of exception names and
+                                the number of times they were raised
+            response_bytes   -- total size of the responses
+            queue_time, connect_time, first_byte_time,
+            transfer_time, parse_time,
+            total_time       -- total times, in seconds
+            histogram        -- list of (upper bound in milliseconds,
+                                number of commands) tuples, the last
+                                bound being None (no limit)
+        """
+        bounds = list(_buckets) + [None]
+        report = {}
+        with self._lock:
+            for cmd, stats in self._commands.items():
+                report[cmd] = dict(stats)
+                report[cmd]['errors'] = dict(stats['errors'])
+                report[cmd]['histogram'] = zip(bounds, stats['histogram'])
+        return report
+
+    def percentile(self, cmd, p):
+        """Percentile
+
+        Returns the upper bound (in milliseconds) of the histogram
+        bucket holding the p percentile (0-100) of the latency of
+        a command, or None if it falls in the last bucket
+        """
+        with self._lock:
+            histogram = list(self._commands[cmd]['histogram'])
+        target = sum(histogram) * p / 100.0
+        seen = 0
+        for bound, count in zip(list(_buckets) + [None], histogram):
+            seen += count
+            if count and seen >= target:
+                return bound
+        return None
+
+    def format_report(self):
+        """Returns the report as a printable table"""
+        lines = ["%-36s %7s %7s %9s %9s %9s %9s %9s %9s %9s" %
+                 ('command', 'count', 'errors', 'avg ms', 'queue',
+                  'connect', 'ttfb', 'transfer', 'parse', 'p99 ms')]
+        for cmd, stats in sorted(self.report().items()):
+            count = stats['count']
+            p99 = self.percentile(cmd, 99)
+            lines.append("%-36s %7d %7d %9.2f %9.2f %9.2f %9.2f %9.2f %9.2f "
+                         "%9s" %
+                         (cmd,
+                          count,
+                          sum(stats['errors'].values()),
+                          stats['total_time'] * 1000 / count,
+                          stats['queue_time'] * 1000 / count,
+                          stats['connect_time'] * 1000 / count,
+                          stats['first_byte_time'] * 1000 / count,
+                          stats['transfer_time'] * 1000 / count,
+                          stats['parse_time'] * 1000 / count,
+                          '>%d' % _buckets[-1] if p99 is None else p99))
+        return "\n".join(lines)
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""Directadmin API - Python implementation of Directadmin Web API
+
+Copyright (C) 2009, Andrés Gattinoni
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+=======================================================================
+
+Request policies
+
+Retries, hedged requests and circuit breaking, to keep slow
+or failing servers from stalling the callers.
+
+$Id$
+"""
+
+import random
+import threading
+import time
+
+__all__ = ['RetryPolicy', 'CircuitBreaker']
+
+
+class RetryPolicy(object):
+    """Retry Policy
+
+    Tells an ApiConnector how to retry read-only commands that
+    fail because of connection problems (timeouts, refused or
+    dropped connections, HTTP 5xx answers). Commands that change
+    the server are never retried nor hedged.
+
+    Usage:
+
+    policy = RetryPolicy(retries=3, backoff=0.2, hedge_after=1.5)
+    api = Api("admin", "password", "hostname.com", retry_policy=policy)
+    """
+
+    def __init__(self,
+                 retries=2,
+                 backoff=0.5,
+                 max_backoff=10,
+                 hedge_after=None):
+        """Constructor
+
+        Parameters:
+        retries -- number of times a failed command is retried
+                   (default: 2)
+        backoff -- base wait, in seconds, before the first retry.
+                   It doubles on each retry and a random part of it
+                   is used (full jitter), so clients don't retry
+                   all at once (default: 0.5)
+        max_backoff -- maximum wait before a retry, in seconds
+                       (default: 10)
+        hedge_after -- if set, when a command hasn't been answered
+                       after these seconds a duplicate request is
+                       sent and the first answer is used. The
+                       duplicate goes through the spare connection
+                       of the pool, outside pool_size and the
+                       scheduler's limit, so it doesn't wait behind
+                       the slow requests. While another duplicate
+                       holds that connection, none is sent
+                       (default: None)
+        """
+        self.retries = int(retries)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.hedge_after = hedge_after
+
+    def delay(self, attempt):
+        """Returns the seconds to wait before retry number
+           'attempt' (starting at zero)"""
+        return random.uniform(0, min(self.max_backoff,
+                                     self.backoff * 2 ** attempt))
+
+
+class CircuitBreaker(object):
+    """Circuit Breaker
+
+    Keeps track of the connection failures to a server. After
+    'failure_threshold' failures in a row the circuit opens and
+    commands fail right away, without waiting for a server that
+    is down. After 'reset_timeout' seconds a single trial command
+    is let through: if it works the circuit closes again,
+    otherwise it stays open for another period.
+
+    Use CircuitBreaker.for_host() to share the breaker of a
+    server among all the connectors that talk to it.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    _hosts = {}
+    _hosts_lock = threading.Lock()
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        """Constructor
+
+        Parameters:
+        failure_threshold -- failures in a row that open the
+                             circuit (default: 5)
+        reset_timeout -- seconds the circuit stays open before
+                         a trial command is allowed (default: 30)
+        """
+        self.failure_threshold = int(failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = None
+
+    @classmethod
+    def for_host(cls, hostname, port, failure_threshold=5, reset_timeout=30):
+        """For host
+
+        Returns the shared CircuitBreaker of a server, creating
+        it with the given settings if it doesn't exist yet
+        """
+        key = (hostname, int(port))
+        with cls._hosts_lock:
+            if key not in cls._hosts:
+                cls._hosts[key] = cls(failure_threshold, reset_timeout)
+            return cls._hosts[key]
+
+    def get_state(self):
+        """Returns the state of the circuit:
+           CLOSED, OPEN or HALF_OPEN"""
+        with self._lock:
+            if self._state == self.OPEN and \
+               time.time() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self):
+        """Allow
+
+        Returns True if a command can be sent. When the open
+        period is over, only the first caller gets True until
+        the trial command finishes.
+        """
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and \
+               time.time() - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+                return True
+            return False
+
+    def success(self):
+        """Records a command that reached the server"""
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+
+    def cancel(self):
+        """Cancel
+
+        Records a command that was allowed but never sent.
+        If it was the trial command, the next caller of
+        allow() gets to send one.
+        """
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._state = self.OPEN
+
+    def failure(self):
+        """Records a command that couldn't reach the server"""
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or \
+               self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.time()
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""Directadmin API - Python implementation of Directadmin Web API
+
+Copyright (C) 2009, Andrés Gattinoni
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+=======================================================================
+
+Records
+
+Typed views of the usage, limits and statistics returned
+by the server.
+
+$Id$
+"""
+
+__all__ = ['UNLIMITED', 'Record', 'UserUsage', 'UserLimits', 'ServerStats']
+
+
+class _Unlimited(object):
+    """Value of the limits that have no limit. It is
+       greater than any number and there's only one"""
+    __slots__ = ()
+
+    def __repr__(self):
+        return 'UNLIMITED'
+
+    def __str__(self):
+        return 'unlimited'
+
+    def __eq__(self, other):
+        return self is other
+
+    def __ne__(self, other):
+        return self is not other
+
+    def __gt__(self, other):
+        return self is not other
+
+    def __ge__(self, other):
+        return True
+
+    def __lt__(self, other):
+        return False
+
+    def __le__(self, other):
+        return self is other
+
+    def __hash__(self):
+        return id(self)
+
+    def __reduce__(self):
+        return 'UNLIMITED'
+
+UNLIMITED = _Unlimited()
+
+
+def _number(value):
+    """Decodes an amount: an int, a float for the
+       ones with decimals, or UNLIMITED. Texts that
+       aren't amounts are None, like missing ones"""
+    if value.lower() == 'unlimited':
+        return UNLIMITED
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def _flag(value):
+    """Decodes an ON/OFF or yes/no setting"""
+    return value.lower() in ('on', 'yes')
+
+
+def _text(value):
+    """Returns a text as it came"""
+    return value
+
+
+class Record(dict):
+    """Record
+
+    Typed view of a response of the server. The record is
+    the dictionary returned by the server (a dictionary of
+    lists, as returned by urlparse.parse_qs), so it is still
+    read and serialized like one, and its fields can also be
+    read as attributes. The fields are decoded the first time
+    they are read, and kept for the next times. Fields the
+    server didn't send are None.
+
+    usage = api.get_user_usage('user1')
+    usage.bandwidth          # 1024.5
+    usage['bandwidth'][0]    # '1024.5'
+    """
+    __slots__ = ()
+
+    # Field name -> (key of the raw response, decoder)
+    _fields = {}
+
+    def __init__(self, raw):
+        """Constructor
+
+        Parameters:
+        raw -- dictionary returned by the server, anything
+               else gives an empty record
+        """
+        if isinstance(raw, dict):
+            dict.__init__(self, raw)
+
+    @property
+    def raw(self):
+        """The response of the server, which is the record itself"""
+        return self
+
+    def __getattr__(self, name):
+        """Decodes a field on first access"""
+        try:
+            key, decode = self._fields[name]
+        except KeyError:
+            raise AttributeError(name)
+        values = self.get(key)
+        if not values or not values[0]:
+            value = None
+        else:
+            value = decode(values[0])
+        setattr(self, name, value)
+        return value
+
+    def as_dict(self):
+        """Returns a dictionary with all the fields decoded"""
+        return dict((name, getattr(self, name)) for name in self._fields)
+
+    def __repr__(self):
+        return "<%s %s>" % (self.__class__.__name__, dict.__repr__(self))
+
+
+# Amounts reported both as usage and as limits
+_amounts = ('bandwidth',
+            'quota',
+            'inode',
+            'vdomains',
+            'nsubdomains',
+            'nemails',
+            'nemailf',
+            'nemailml',
+            'nemailr',
+            'mysql',
+            'domainptr',
+            'ftp')
+
+
+class UserUsage(Record):
+    """User Usage
+
+    Usage of a user (CMD_API_SHOW_USER_USAGE). Bandwidth
+    and quota are in megabytes, the rest are counters.
+
+    Fields: bandwidth, quota, inode, vdomains, nsubdomains,
+            nemails, nemailf, nemailml, nemailr, mysql,
+            domainptr, ftp, db_quota, email_quota
+    """
+    _fields = dict((name, (name, _number)) for name in _amounts)
+    _fields['db_quota'] = ('db_quota', _number)
+    _fields['email_quota'] = ('email_quota', _number)
+    __slots__ = tuple(_fields)
+
+
+class UserLimits(Record):
+    """User Limits
+
+    Limits and settings of a user (CMD_API_SHOW_USER_CONFIG).
+    Limits are numbers or UNLIMITED, settings are booleans.
+
+    Fields: bandwidth, quota, inode, vdomains, nsubdomains,
+            nemails, nemailf, nemailml, nemailr, mysql,
+            domainptr, ftp (limits)
+            aftp, cgi, php, spam, ssl, ssh, cron, catchall,
+            sysinfo, dnscontrol, suspended (settings)
+            username, usertype, creator, package, domain, ip,
+            email, name, date_created (texts)
+    """
+    _fields = dict((name, (name, _number)) for name in _amounts)
+    _fields.update((name, (name, _flag)) for name in ('aftp',
+                                                      'cgi',
+                                                      'php',
+                                                      'spam',
+                                                      'ssl',
+                                                      'ssh',
+                                                      'cron',
+                                                      'catchall',
+                                                      'sysinfo',
+                                                      'dnscontrol',
+                                                      'suspended'))
+    _fields.update((name, (name, _text)) for name in ('username',
+                                                      'usertype',
+                                                      'creator',
+                                                      'package',
+                                                      'domain',
+                                                      'ip',
+                                                      'email',
+                                                      'name',
+                                                      'date_created'))
+    __slots__ = tuple(_fields)
+
+
+class ServerStats(Record):
+    """Server Stats
+
+    Statistics of the server (CMD_API_ADMIN_STATS).
+    Bandwidth and quota are in megabytes.
+
+    Fields: bandwidth, quota, vdomains, nsubdomains, nemails,
+            nemailf, nemailml, nemailr, mysql, domainptr, ftp,
+            nusers, nresellers, RX, TX (numbers)
+            loadavg (text)
+
+    The disks are in the 'disks' attribute, a list of
+    dictionaries (see Api.get_server_stats)
+    """
+    _fields = dict((name, (name, _number)) for name in _amounts)
+    _fields['nusers'] = ('nusers', _number)
+    _fields['nresellers'] = ('nresellers', _number)
+    _fields['RX'] = ('RX', _number)
+    _fields['TX'] = ('TX', _number)
+    _fields['loadavg'] = ('loadavg', _text)
+    __slots__ = tuple(_fields)
+
+    @property
+    def disks(self):
+        """List of the disks of the server, sorted by key"""
+        keys = [key for key in self if key.startswith('disk')]
+        keys.sort(key=lambda key: (len(key), key))
+        return [self[key][0] for key in keys]
@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+"""Directadmin API - Python implementation of Directadmin Web API
+
+Copyright (C) 2009, Andrés Gattinoni
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+=======================================================================
+
+=======================================================================
+
+Report
+
+Usage reports of the accounts of one or many servers, kept
+in columns for capacity planning.
+
+$Id$
+"""
+
+import heapq
+import itertools
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from records import UNLIMITED
+
+__all__ = ['UsageReport']
+
+# Amounts collected for every user. The limits go to columns
+# with the same name and a '_limit' suffix
+_amounts = ('bandwidth', 'quota', 'inode')
+
+_nan = float('nan')
+_inf = float('inf')
+
+
+def _float(value):
+    """Converts a decoded amount to a float: UNLIMITED
+       is infinity, and a missing amount is NaN"""
+    if value is None:
+        return _nan
+    if value is UNLIMITED:
+        return _inf
+    return float(value)
+
+
+def _fetch_usage(api, users, workers):
+    """Fetch usage
+
+    Reads the usage and limits of the users of a server,
+    without touching any report, so servers can be read
+    from many threads
+
+    Returns a tuple (users, usage, limits, errors) where
+    usage maps each user to a tuple of amounts, limits to
+    a tuple (amounts, creator, package), and errors to the
+    ApiError raised by its calls
+    """
+    if users is None:
+        users = api.iter_all_users()
+    users = list(users)
+    usage = {}
+    limits = {}
+    errors = {}
+    for user, result, error in api.map('get_user_usage', users, workers):
+        if error is not None:
+            errors[user] = error
+            continue
+        usage[user] = tuple(_float(getattr(result, name))
+                            for name in _amounts)
+    for user, result, error in api.map('get_user_limits', users, workers):
+        if error is not None:
+            errors[user] = error
+            continue
+        limits[user] = (tuple(_float(getattr(result, name))
+                              for name in _amounts),
+                        result.creator,
+                        result.package)
+    return users, usage, limits, errors
+
+
+def _percentile(values, p):
+    """Returns the p percentile (0-100) of a sorted sequence,
+       by the nearest rank"""
+    return values[int(round((len(values) - 1) * p / 100.0))]
+
+
+class _Labels(object):
+    """A text column, stored as a code for each row
+       and the list of the different texts"""
+    __slots__ = ('names', 'codes', '_index')
+
+    def __init__(self):
+        self.names = []
+        self.codes = array('i')
+        self._index = {}
+
+    def code(self, name):
+        """Returns the code of a text, adding it if it's new"""
+        code = self._index.get(name)
+        if code is None:
+            code = self._index[name] = len(self.names)
+            self.names.append(name)
+        return code
+
+
+class UsageReport(object):
+    """Usage Report
+
+    Usage and limits of bandwidth, disk quota (both in
+    megabytes) and inodes of many users, from one or many
+    servers. Each number is kept in a column (an array of
+    doubles) instead of a record per user, and the server,
+    reseller and package of the users are kept as codes. So
+    100.000 users take a few megabytes, and the totals and
+    rankings are computed without building an object per user.
+
+    Columns: bandwidth, quota, inode (used) and
+             bandwidth_limit, quota_limit, inode_limit
+    Limits without a limit are infinite, and the numbers
+    of the users that couldn't be read are NaN.
+
+    When NumPy is installed, column() returns NumPy arrays
+    and the totals and over quota lists are computed with it.
+    The results are the same without it.
+
+    Usage:
+
+    report = UsageReport()
+    report.collect(api, 'web1')
+    report.collect_fleet(ServerPool.from_config('~/.daconsole.conf'))
+    print report.totals('quota', by='package')
+    print report.percentiles('bandwidth')
+    for server, user, used, limit in report.over_quota():
+        ...
+    """
+
+    def __init__(self):
+        """Constructor"""
+        self.users = []
+        self.errors = {}
+        self._labels = {'server': _Labels(),
+                        'reseller': _Labels(),
+                        'package': _Labels()}
+        self._columns = {}
+        for name in _amounts:
+            self._columns[name] = array('d')
+            self._columns[name + '_limit'] = array('d')
+
+    def __len__(self):
+        """Number of users in the report"""
+        return len(self.users)
+
+    def columns(self):
+        """Returns the names of the columns"""
+        return sorted(self._columns)
+
+    def collect(self, api, server='localhost', users=None, workers=8):
+        """Collect
+
+        Adds the usage and limits of the users of a server,
+        reading them concurrently (get_user_usage and
+        get_user_limits). The users whose usage or limits
+        couldn't be read get NaN values, and their errors
+        are kept in the 'errors' attribute, as a dictionary
+        of (server, user) tuples and ApiErrors.
+
+        Parameters:
+        api -- Api object of the server
+        server -- name of the server in the report
+                  (default: localhost)
+        users -- list of usernames, None collects all
+                 the users of the server (default: None)
+        workers -- maximum number of concurrent requests
+                   (default: 8)
+
+        Returns the number of users added
+        """
+        return self._add(server, *_fetch_usage(api, users, workers))
+
+    def collect_fleet(self, pool, workers=8):
+        """Collect fleet
+
+        Collects the users of every server of a ServerPool.
+        The servers are read at the same time, and the rows
+        of each one are added on this thread once it has been
+        read. A server that can't be listed is kept in
+        'errors' as (server, None)
+
+        Parameters:
+        pool -- ServerPool of the servers
+        workers -- maximum number of concurrent requests
+                   to each server (default: 8)
+
+        Returns the number of users added
+        """
+        count = 0
+        for server, fetched, error in pool.run(_fetch_usage,
+                                               (None, workers)):
+            if error is not None:
+                self.errors[(server, None)] = error
+                continue
+            count += self._add(server, *fetched)
+        return count
+
+    def _add(self, server, users, usage, limits, errors):
+        """Adds the rows of a server read by _fetch_usage"""
+        start = len(self.users)
+        count = len(users)
+        self.users.extend(users)
+        labels = self._labels['server']
+        labels.codes.extend(array('i', [labels.code(server)]) * count)
+        for name in ('reseller', 'package'):
+            self._labels[name].codes.extend(array('i', [-1]) * count)
+        for column in self._columns.values():
+            column.extend(array('d', [_nan]) * count)
+
+        resellers = self._labels['reseller']
+        packages = self._labels['package']
+        for row, user in enumerate(users, start):
+            if user in usage:
+                for name, value in zip(_amounts, usage[user]):
+                    self._columns[name][row] = value
+            if user in limits:
+                amounts, creator, package = limits[user]
+                for name, value in zip(_amounts, amounts):
+                    self._columns[name + '_limit'][row] = value
+                resellers.codes[row] = resellers.code(creator)
+                packages.codes[row] = packages.code(package)
+        for user, error in errors.items():
+            self.errors[(server, user)] = error
+        return count
+
+    def row(self, row):
+        """Returns the (server, user) of a row"""
+        labels = self._labels['server']
+        return labels.names[labels.codes[row]], self.users[row]
+
+    def column(self, name):
+        """Returns a copy of a column, as a NumPy array
+           if NumPy is installed, otherwise as an array"""
+        if numpy is not None:
+            return numpy.frombuffer(self._columns[name].tostring(),
+                                    numpy.float64)
+        return array('d', self._columns[name])
+
+    def totals(self, column, by='reseller'):
+        """Totals
+
+        Adds up a column by server, reseller or package,
+        skipping the NaN values
+
+        Returns a dictionary of names and tuples
+        (number of users, total)
+        """
+        labels = self._labels[by]
+        values = self._columns[column]
+        size = len(labels.names)
+        if numpy is not None:
+            codes = numpy.frombuffer(labels.codes.tostring(), numpy.intc)
+            values = numpy.frombuffer(values.tostring(), numpy.float64)
+            valid = (codes >= 0) & ~numpy.isnan(values)
+            counts = numpy.bincount(codes[valid], minlength=size)
+            sums = numpy.bincount(codes[valid],
+                                  weights=values[valid],
+                                  minlength=size)
+            counts = [int(count) for count in counts]
+            sums = [float(total) for total in sums]
+        else:
+            counts = [0] * size
+            sums = [0.0] * size
+            for code, value in itertools.izip(labels.codes, values):
+                if code >= 0 and value == value:
+                    counts[code] += 1
+                    sums[code] += value
+        return dict((name, (counts[code], sums[code]))
+                    for code, name in enumerate(labels.names)
+                    if counts[code])
+
+    def percentiles(self, column, percentiles=(50, 90, 95, 99)):
+        """Returns a dictionary with percentiles (0-100) of a
+           column, by the nearest rank, skipping the NaN values.
+           It is empty if the column has no values"""
+        if numpy is not None:
+            values = self.column(column)
+            values = numpy.sort(values[~numpy.isnan(values)])
+        else:
+            values = sorted(value for value in self._columns[column]
+                            if value == value)
+        if not len(values):
+            return {}
+        return dict((p, float(_percentile(values, p))) for p in percentiles)
+
+    def over_quota(self, amount='quota', ratio=1.0):
+        """Over quota
+
+        Lists the users using more than a ratio of their
+        limit of an amount ('bandwidth', 'quota' or 'inode').
+        A ratio of 0.9 lists the ones over 90% of it.
+
+        Returns a list of tuples (server, user, used, limit),
+        the most exceeded first
+        """
+        used = self._columns[amount]
+        limits = self._columns[amount + '_limit']
+        if numpy is not None:
+            used = numpy.frombuffer(used.tostring(), numpy.float64)
+            limits = numpy.frombuffer(limits.tostring(), numpy.float64)
+            with numpy.errstate(invalid='ignore'):
+                over = numpy.isfinite(limits) & (limits > 0) & \
+                       (used > limits * ratio)
+            rows = [int(row) for row in numpy.flatnonzero(over)]
+        else:
+            rows = [row for row, (value, limit) in
+                    enumerate(itertools.izip(used, limits))
+                    if 0 < limit < _inf and value > limit * ratio]
+        rows.sort(key=lambda row: used[row] / limits[row], reverse=True)
+        return [self.row(row) + (float(used[row]), float(limits[row]))
+                for row in rows]
+
+    def top(self, column, n=10, by=None):
+        """Top
+
+        Returns the n biggest values of a column, with a heap,
+        as tuples (server, user, value). With 'by' ('server',
+        'reseller' or 'package') the groups with the biggest
+        totals are returned instead, as (name, users, total).
+        NaN values are skipped.
+        """
+        if by is not None:
+            return [(name, count, total) for name, (count, total) in
+                    heapq.nlargest(n,
+                                   self.totals(column, by).iteritems(),
+                                   key=lambda item: item[1][1])]
+        values = self._columns[column]
+        biggest = heapq.nlargest(n, ((value, row) for row, value in
+                                     enumerate(values) if value == value))
+        return [self.row(row) + (value,) for value, row in biggest]
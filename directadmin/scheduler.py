@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""Directadmin API - Python implementation of Directadmin Web API
+
+Copyright (C) 2009, Andrés Gattinoni
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+=======================================================================
+
+Request scheduler
+
+Priority classes and a per-host limit of concurrent requests,
+so interactive commands don't wait behind bulk jobs.
+
+$Id$
+"""
+
+import collections
+import threading
+import time
+
+from workers import TimeoutError
+
+__all__ = ['INTERACTIVE', 'NORMAL', 'BULK', 'RequestScheduler']
+
+INTERACTIVE = 'interactive'
+NORMAL = 'normal'
+BULK = 'bulk'
+
+# Priority classes, from the most to the least urgent
+_priorities = (INTERACTIVE, NORMAL, BULK)
+
+# Share of the free slots each class gets when all of them wait
+_default_weights = {INTERACTIVE: 16,
+                    NORMAL: 4,
+                    BULK: 1}
+
+
+class RequestScheduler(object):
+    """Request Scheduler
+
+    Limits the number of requests in flight to a server and
+    decides which waiting request goes next.
+
+    Requests belong to a priority class: INTERACTIVE, NORMAL
+    or BULK. Within a class they are sent in arrival order.
+    Between classes the free slots are shared by weight
+    (stride scheduling): with the default weights an
+    interactive request goes ahead of any queued bulk work,
+    but bulk work still gets a slot from time to time, so
+    it never starves.
+
+    Use RequestScheduler.for_host() to share the scheduler of
+    a server among all the connectors that talk to it.
+
+    Usage:
+
+    scheduler = RequestScheduler.for_host("hostname.com", 2222)
+    console = Api("admin", "password", "hostname.com",
+                  scheduler=scheduler, priority=INTERACTIVE)
+    bulk = console.with_priority(BULK)
+    """
+    _hosts = {}
+    _hosts_lock = threading.Lock()
+
+    def __init__(self, max_concurrent=4, weights=None):
+        """Constructor
+
+        Parameters:
+        max_concurrent -- maximum number of requests in
+                          flight at the same time (default: 4)
+        weights -- dictionary with the weight of each priority
+                   class, the missing ones keep their default
+                   (default: None)
+        """
+        self.max_concurrent = int(max_concurrent)
+        self._weights = dict(_default_weights)
+        if weights is not None:
+            self._weights.update(weights)
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._running = 0
+        self._waiting = 0
+        self._vtime = 0.0
+        self._queues = {}
+        self._passes = {}
+        self._stats = {}
+        for priority in _priorities:
+            self._queues[priority] = collections.deque()
+            self._passes[priority] = 0.0
+            self._stats[priority] = {'dispatched': 0,
+                                     'timeouts': 0,
+                                     'max_depth': 0,
+                                     'wait_time': 0.0,
+                                     'max_wait': 0.0}
+
+    @classmethod
+    def for_host(cls, hostname, port, max_concurrent=4, weights=None):
+        """For host
+
+        Returns the shared RequestScheduler of a server, creating
+        it with the given settings if it doesn't exist yet
+        """
+        key = (hostname, int(port))
+        with cls._hosts_lock:
+            if key not in cls._hosts:
+                cls._hosts[key] = cls(max_concurrent, weights)
+            return cls._hosts[key]
+
+    def acquire(self, priority=NORMAL, timeout=None):
+        """Acquire
+
+        Waits for a free slot to send a request. Every
+        acquire() must be followed by a release().
+
+        Parameters:
+        priority -- priority class of the request (default: NORMAL)
+        timeout -- maximum seconds to wait, None waits
+                   forever (default: None)
+
+        Returns the seconds spent waiting
+        Raises TimeoutError if no slot was free in time
+        """
+        if priority not in self._queues:
+            raise ValueError("Unknown priority: %s" % priority)
+        start = time.time()
+        with self._lock:
+            if self._running < self.max_concurrent and not self._waiting:
+                self._running += 1
+                self._stats[priority]['dispatched'] += 1
+                return 0.0
+
+            queue = self._queues[priority]
+            if not queue:
+                # An idle class doesn't save up turns
+                self._passes[priority] = max(self._passes[priority],
+                                             self._vtime)
+            waiter = [False]
+            queue.append(waiter)
+            self._waiting += 1
+            stats = self._stats[priority]
+            stats['max_depth'] = max(stats['max_depth'], len(queue))
+
+            while not waiter[0]:
+                if timeout is None:
+                    self._condition.wait()
+                    continue
+                remaining = start + timeout - time.time()
+                if remaining <= 0:
+                    queue.remove(waiter)
+                    self._waiting -= 1
+                    stats['timeouts'] += 1
+                    raise TimeoutError("No request slot free in time")
+                self._condition.wait(remaining)
+
+            waited = time.time() - start
+            stats['wait_time'] += waited
+            stats['max_wait'] = max(stats['max_wait'], waited)
+            return waited
+
+    def release(self):
+        """Frees the slot of a finished request"""
+        with self._lock:
+            self._running -= 1
+            self._dispatch()
+
+    def _dispatch(self):
+        """Hands the free slots to the waiting requests,
+           must be called with the lock held"""
+        granted = False
+        while self._running < self.max_concurrent and self._waiting:
+            priority = min([p for p in _priorities if self._queues[p]],
+                           key=lambda p: (self._passes[p],
+                                          _priorities.index(p)))
+            self._vtime = self._passes[priority]
+            self._passes[priority] += 1.0 / self._weights[priority]
+            self._queues[priority].popleft()[0] = True
+            self._waiting -= 1
+            self._running += 1
+            self._stats[priority]['dispatched'] += 1
+            granted = True
+        if granted:
+            self._condition.notify_all()
+
+    def stats(self):
+        """Stats
+
+        Returns a dictionary with the counters of each
+        priority class:
+
+            depth       -- requests waiting right now
+            max_depth   -- most requests ever waiting at once
+            dispatched  -- requests that got a slot
+            timeouts    -- requests that gave up waiting
+            wait_time   -- total seconds spent waiting
+            max_wait    -- longest wait, in seconds
+
+        and the number of requests in flight as 'running'
+        """
+        with self._lock:
+            stats = {'running': self._running}
+            for priority in _priorities:
+                stats[priority] = dict(self._stats[priority])
+                stats[priority]['depth'] = len(self._queues[priority])
+            return stats
@@ -0,0 +1,385 @@
+# -*- coding: utf-8 -*-
+"""Directadmin API - Python implementation of Directadmin Web API
+
+Copyright (C) 2009, Andrés Gattinoni
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+=======================================================================
+
+Sync
+
+Incremental snapshots of the accounts of a server, and the
+changes between one snapshot and the next.
+
+$Id$
+"""
+
+import hashlib
+import json
+import threading
+import time
+
+__all__ = ['domain_owners_signal', 'UserSnapshot', 'ChangeSet', 'SyncEngine']
+
+
+def _domain_info(domains):
+    """Domain info
+
+    Takes the response of get_user_domains, where each domain
+    maps to 'bandwidth used:bandwidth limit:disk usage:log
+    usage:subdomains:suspended:quota:ssl:cgi:php', and returns
+    a dictionary of domains and the settings that don't change
+    with the usage (everything but the used bandwidth, disk
+    and logs), so traffic alone doesn't mark a domain as changed
+    """
+    if isinstance(domains, list):
+        return dict((domain, '') for domain in domains)
+    if not isinstance(domains, dict):
+        return {}
+    info = {}
+    for domain, values in domains.items():
+        fields = values[0].split(':')
+        info[domain] = ':'.join(fields[1:2] + fields[4:])
+    return info
+
+
+def domain_owners_signal(api):
+    """Domain owners signal
+
+    Change signal for SyncEngine, built with a single
+    list_domain_owners call: a digest of the domains of
+    each user. It sees the domains that are added, removed
+    or moved to another user, but not the changes of limits
+    or domain settings, so it's meant to be used along with
+    max_age.
+
+    Returns a dictionary of usernames and digests
+    """
+    owners = {}
+    response = api.list_domain_owners()
+    if isinstance(response, dict):
+        for domain, users in response.items():
+            owners.setdefault(users[0], []).append(domain)
+    return dict((user, hashlib.sha1(json.dumps(sorted(domains))).hexdigest())
+                for user, domains in owners.items())
+
+
+def _as_list(response):
+    """Returns a list response sorted, and an empty
+       list for commands that returned nothing"""
+    if isinstance(response, list):
+        return sorted(response)
+    return []
+
+
+class UserSnapshot(object):
+    """User Snapshot
+
+    What the sync engine knows about a user:
+
+        username    -- name of the user
+        limits      -- raw response of get_user_limits
+        domains     -- dictionary of the user's domains and
+                       their settings
+        subdomains  -- dictionary of the user's domains and
+                       their lists of subdomains
+        checked     -- time of the last check
+        signal      -- value of the change signal of the user
+                       at the last check, None without one
+        fingerprint -- digest of limits, domains and subdomains
+    """
+    __slots__ = ('username',
+                 'limits',
+                 'domains',
+                 'subdomains',
+                 'checked',
+                 'signal',
+                 'fingerprint')
+
+    def __init__(self,
+                 username,
+                 limits,
+                 domains,
+                 subdomains,
+                 checked,
+                 signal=None):
+        """Constructor"""
+        self.username = username
+        self.limits = limits
+        self.domains = domains
+        self.subdomains = subdomains
+        self.checked = checked
+        self.signal = signal
+        self.fingerprint = hashlib.sha1(json.dumps([limits,
+                                                    domains,
+                                                    subdomains],
+                                                   sort_keys=True)).hexdigest()
+
+    def diff(self, other):
+        """Returns the names of the parts ('limits', 'domains',
+           'subdomains') that differ from another snapshot"""
+        if self.fingerprint == other.fingerprint:
+            return []
+        return [part for part in ('limits', 'domains', 'subdomains')
+                if getattr(self, part) != getattr(other, part)]
+
+    def to_dict(self):
+        """Returns the snapshot as a dictionary"""
+        return {'username': self.username,
+                'limits': self.limits,
+                'domains': self.domains,
+                'subdomains': self.subdomains,
+                'checked': self.checked,
+                'signal': self.signal}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Builds a snapshot from the result of to_dict()"""
+        return cls(data['username'],
+                   data['limits'],
+                   data['domains'],
+                   data['subdomains'],
+                   data['checked'],
+                   data.get('signal'))
+
+    def __repr__(self):
+        return "<UserSnapshot %s %s>" % (self.username, self.fingerprint[:8])
+
+
+class ChangeSet(object):
+    """Change Set
+
+    Changes found by a sync:
+
+        added    -- dictionary of new users and their snapshots
+        removed  -- dictionary of deleted users and their last
+                    snapshots
+        modified -- dictionary of changed users and tuples
+                    (old snapshot, new snapshot, changed parts)
+        errors   -- dictionary of the users that couldn't be
+                    checked and the ApiError raised. Their last
+                    snapshot is kept
+        calls    -- number of API calls done by the sync
+    """
+
+    def __init__(self):
+        """Constructor"""
+        self.added = {}
+        self.removed = {}
+        self.modified = {}
+        self.errors = {}
+        self.calls = 0
+
+    def __nonzero__(self):
+        """True if anything changed"""
+        return bool(self.added or self.removed or self.modified)
+
+    def __repr__(self):
+        return "<ChangeSet +%d -%d ~%d (%d errors, %d calls)>" % \
+               (len(self.added), len(self.removed), len(self.modified),
+                len(self.errors), self.calls)
+
+
+class SyncEngine(object):
+    """Sync Engine
+
+    Keeps a snapshot of the users of a server (their limits,
+    domains and subdomains) and updates it incrementally.
+
+    Each sync lists the users with list_all_users, which
+    finds the added and removed ones. Then every user is
+    checked with get_user_limits and get_user_domains, and is
+    fingerprinted. The subdomains, which take one call per
+    domain, are only fetched for new domains and for domains
+    whose settings changed (their number of subdomains among
+    them). So a sync still takes two calls per account, and
+    only the subdomain calls grow with the churn.
+
+    A signal avoids those calls: a function that takes the
+    Api and returns, with a few calls, a value for each user
+    that changes when the user does (see domain_owners_signal).
+    Only the users whose value changed are checked, so a sync
+    takes a couple of calls plus the checks of the changed
+    users.
+
+    With max_age, users checked less than max_age seconds ago
+    are skipped, spreading the checks over several syncs. Along
+    with a signal, users are checked at least every max_age
+    seconds, which finds the changes the signal can't see.
+
+    Usage:
+
+    engine = SyncEngine(api)
+    engine.load('/var/lib/sync.json')
+    changes = engine.sync()
+    for username, (old, new, parts) in changes.modified.items():
+        ...
+    engine.save('/var/lib/sync.json')
+    """
+
+    def __init__(self, api, workers=4, max_age=None, signal=None):
+        """Constructor
+
+        Parameters:
+        api -- Api object of the server
+        workers -- maximum number of users checked at the
+                   same time (default: 4)
+        max_age -- seconds a user's snapshot is trusted without
+                   checking it again, None checks every user on
+                   every sync, or only the changed ones with a
+                   signal (default: None)
+        signal -- function that takes the Api and returns a
+                  dictionary of usernames and values that change
+                  when the users do, None checks the users without
+                  one (default: None)
+        """
+        self._api = api
+        self._workers = int(workers)
+        self._max_age = max_age
+        self._signal = signal
+        self._snapshot = {}
+        self._lock = threading.Lock()
+
+    def get_snapshot(self):
+        """Returns a dictionary of usernames and UserSnapshots"""
+        return dict(self._snapshot)
+
+    def set_snapshot(self, snapshot):
+        """Replaces the snapshot with a dictionary of
+           usernames and UserSnapshots"""
+        self._snapshot = dict(snapshot)
+
+    def sync(self):
+        """Sync
+
+        Brings the snapshot up to date with the server
+
+        Returns a ChangeSet
+        """
+        now = time.time()
+        changes = ChangeSet()
+        previous = self._snapshot
+        usernames = set(self._api.list_all_users())
+        changes.calls += 1
+        signals = None
+        if self._signal is not None:
+            signals = self._signal(self._api)
+            changes.calls += 1
+
+        snapshot = {}
+        for username, old in previous.items():
+            if username not in usernames:
+                changes.removed[username] = old
+            elif signals is not None and \
+                 old.signal != signals.get(username):
+                # Changed, it's checked below
+                continue
+            elif self._max_age is None:
+                if signals is not None:
+                    snapshot[username] = old
+            elif now - old.checked < self._max_age:
+                snapshot[username] = old
+
+        pending = [username for username in usernames
+                   if username not in snapshot]
+        for username, new, calls, error in self._check(pending, now):
+            changes.calls += calls
+            old = previous.get(username)
+            if error is not None:
+                changes.errors[username] = error
+                if old is not None:
+                    snapshot[username] = old
+                continue
+            if signals is not None:
+                new.signal = signals.get(username)
+            snapshot[username] = new
+            if old is None:
+                changes.added[username] = new
+            else:
+                parts = new.diff(old)
+                if parts:
+                    changes.modified[username] = (old, new, parts)
+
+        self._snapshot = snapshot
+        return changes
+
+    def _check(self, usernames, now):
+        """Check
+
+        Checks users concurrently and yields a tuple
+        (username, snapshot, API calls, error) for each one
+        """
+        if not usernames:
+            return
+        for item, result, error in self._api.map(
+                self._check_user,
+                [(username, self._snapshot.get(username), now)
+                 for username in usernames],
+                min(self._workers, len(usernames))):
+            if error is not None:
+                yield item[0], None, 0, error
+            else:
+                yield item[0], result[0], result[1], None
+
+    def _check_user(self, username, old, now):
+        """Check user
+
+        Takes a new snapshot of a user, reusing the subdomains
+        of the old one for the domains that didn't change
+
+        Returns a tuple (snapshot, API calls)
+        """
+        limits = self._api.get_user_limits(username)
+        domains = _domain_info(self._api.get_user_domains(username))
+        calls = 2
+        subdomains = {}
+        user_api = None
+        for domain, info in domains.items():
+            if old is not None and old.domains.get(domain) == info and \
+               domain in old.subdomains:
+                subdomains[domain] = old.subdomains[domain]
+            else:
+                # Subdomains are listed by the user that owns them
+                if user_api is None:
+                    user_api = self._api.login_as(username)
+                subdomains[domain] = _as_list(user_api.list_subdomains(domain))
+                calls += 1
+        return UserSnapshot(username,
+                            getattr(limits, 'raw', limits),
+                            domains,
+                            subdomains,
+                            now), calls
+
+    def save(self, filename):
+        """Saves the snapshot to a JSON file"""
+        with self._lock:
+            data = [user.to_dict() for user in self._snapshot.values()]
+            f = open(filename, 'w')
+            try:
+                json.dump(data, f)
+            finally:
+                f.close()
+
+    def load(self, filename):
+        """Loads a snapshot saved with save()"""
+        with self._lock:
+            f = open(filename)
+            try:
+                data = json.load(f)
+            finally:
+                f.close()
+            self._snapshot = dict((user['username'],
+                                   UserSnapshot.from_dict(user))
+                                  for user in data)
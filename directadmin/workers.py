@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+"""Directadmin API - Python implementation of Directadmin Web API
+
+Copyright (C) 2009, Andrés Gattinoni
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+=======================================================================
+
+Background workers
+
+A small thread pool and Future implementation used to run
+API calls concurrently. It follows the interface of the
+concurrent.futures module, which is not available on Python 2.
+
+$Id$
+"""
+
+import sys
+import threading
+import time
+import Queue
+
+__all__ = ['CancelledError', 'TimeoutError', 'Future', 'WorkerPool',
+           'as_completed']
+
+
+class CancelledError(Exception):
+    """Cancelled Error
+
+    Raised when asking for the result of a cancelled Future
+    """
+    pass
+
+
+class TimeoutError(Exception):
+    """Timeout Error
+
+    Raised when a result is not available in the given time
+    """
+    pass
+
+
+class Future(object):
+    """Future
+
+    Result of a call that runs in the background.
+
+    Usage:
+
+    future = pool.submit(api.get_user_usage, 'username')
+    ...
+    usage = future.result()
+    """
+    _PENDING = 'pending'
+    _RUNNING = 'running'
+    _CANCELLED = 'cancelled'
+    _FINISHED = 'finished'
+
+    def __init__(self):
+        """Constructor"""
+        self._condition = threading.Condition()
+        self._state = self._PENDING
+        self._result = None
+        self._exc_info = None
+        self._callbacks = []
+
+    def cancel(self):
+        """Cancels the call
+
+        Only calls that haven't started can be cancelled.
+        Returns True if the call was cancelled.
+        """
+        with self._condition:
+            if self._state == self._CANCELLED:
+                return True
+            if self._state != self._PENDING:
+                return False
+            self._state = self._CANCELLED
+            self._condition.notify_all()
+        self._run_callbacks()
+        return True
+
+    def cancelled(self):
+        """Returns True if the call was cancelled"""
+        return self._state == self._CANCELLED
+
+    def running(self):
+        """Returns True if the call is running"""
+        return self._state == self._RUNNING
+
+    def done(self):
+        """Returns True if the call finished or was cancelled"""
+        return self._state in (self._CANCELLED, self._FINISHED)
+
+    def result(self, timeout=None):
+        """Result
+
+        Waits for the call to finish and returns its result,
+        or raises the exception the call raised.
+
+        Parameters:
+        timeout -- seconds to wait, None waits forever (default: None)
+
+        Raises CancelledError if the call was cancelled
+        Raises TimeoutError if the call didn't finish in time
+        """
+        self._wait(timeout)
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+    def exception(self, timeout=None):
+        """Exception
+
+        Waits for the call to finish and returns the exception
+        it raised, or None if it succeeded.
+
+        Parameters:
+        timeout -- seconds to wait, None waits forever (default: None)
+        """
+        self._wait(timeout)
+        if self._exc_info is not None:
+            return self._exc_info[1]
+        return None
+
+    def add_done_callback(self, function):
+        """Add done callback
+
+        Calls function with the Future as its only argument
+        once the call finishes or is cancelled. If that
+        already happened, function is called right away.
+        """
+        with self._condition:
+            if not self.done():
+                self._callbacks.append(function)
+                return
+        function(self)
+
+    def _wait(self, timeout):
+        """Waits for the Future to be done"""
+        if timeout is not None:
+            deadline = time.time() + timeout
+        with self._condition:
+            while not self.done():
+                if timeout is None:
+                    self._condition.wait()
+                    continue
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            if self._state == self._CANCELLED:
+                raise CancelledError()
+            if self._state != self._FINISHED:
+                raise TimeoutError()
+
+    def _start(self):
+        """Marks the call as running
+
+        Returns False if the call was cancelled
+        and must not be run.
+        """
+        with self._condition:
+            if self._state == self._CANCELLED:
+                return False
+            self._state = self._RUNNING
+            return True
+
+    def _set_result(self, result):
+        """Sets the result of the call"""
+        with self._condition:
+            self._result = result
+            self._state = self._FINISHED
+            self._condition.notify_all()
+        self._run_callbacks()
+
+    def _set_exception(self, exc_info):
+        """Sets the exception raised by the call,
+           as returned by sys.exc_info()"""
+        with self._condition:
+            self._exc_info = exc_info
+            self._state = self._FINISHED
+            self._condition.notify_all()
+        self._run_callbacks()
+
+    def _run_callbacks(self):
+        """Runs the done callbacks"""
+        with self._condition:
+            callbacks, self._callbacks = self._callbacks, []
+        for function in callbacks:
+            function(self)
+
+
+class WorkerPool(object):
+    """Worker Pool
+
+    Runs calls on a fixed number of background threads.
+    Threads are started on the first submitted call.
+    """
+
+    def __init__(self, size=8):
+        """Constructor
+
+        Parameters:
+        size -- number of worker threads (default: 8)
+        """
+        self._size = int(size)
+        if self._size < 1:
+            raise ValueError("size must be greater than zero")
+        self._queue = Queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+    def submit(self, function, *args, **kwargs):
+        """Submit
+
+        Schedules function(*args, **kwargs) to be run
+        by a worker and returns a Future for its result.
+        """
+        future = Future()
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("Can't submit calls after shutdown")
+            self._start_workers()
+            self._queue.put((future, function, args, kwargs))
+        return future
+
+    def shutdown(self, wait=True, cancel=False):
+        """Shutdown
+
+        Stops the workers once they finish the calls
+        already submitted.
+
+        Parameters:
+        wait -- boolean, if True waits for the workers
+                to finish (default: True)
+        cancel -- boolean, if True pending calls are
+                  cancelled instead of run (default: False)
+        """
+        with self._lock:
+            self._shutdown = True
+            if cancel:
+                self._cancel_pending()
+            for thread in self._threads:
+                self._queue.put(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _start_workers(self):
+        """Starts the worker threads, if they aren't running"""
+        while len(self._threads) < self._size:
+            thread = threading.Thread(target=self._work)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def _cancel_pending(self):
+        """Cancels all the calls that haven't started"""
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except Queue.Empty:
+                return
+            if item is not None:
+                item[0].cancel()
+
+    def _work(self):
+        """Worker thread main loop"""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            future, function, args, kwargs = item
+            if not future._start():
+                continue
+            try:
+                result = function(*args, **kwargs)
+            except:
+                future._set_exception(sys.exc_info())
+            else:
+                future._set_result(result)
+
+
+def as_completed(futures, timeout=None):
+    """As completed
+
+    Yields the given futures as they finish
+    (or get cancelled), in completion order.
+
+    Parameters:
+    futures -- iterable of Future objects
+    timeout -- seconds to wait for all of them, None waits
+               forever (default: None)
+
+    Raises TimeoutError if they don't finish in time
+    """
+    pending = []
+    for future in futures:
+        if future not in pending:
+            pending.append(future)
+
+    finished = Queue.Queue()
+    for future in pending:
+        future.add_done_callback(finished.put)
+
+    if timeout is not None:
+        deadline = time.time() + timeout
+    for n in range(len(pending)):
+        if timeout is None:
+            yield finished.get()
+            continue
+        remaining = deadline - time.time()
+        try:
+            yield finished.get(True, max(remaining, 0))
+        except Queue.Empty:
+            raise TimeoutError()
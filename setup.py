@@ -32,8 +32,8 @@ $Id$
 import sys
 from distutils.core import setup
 
-if not hasattr(sys, 'version_info') or sys.version_info < (2, 5, 0):
-    raise SystemExit("python-directadmin requires Python 2.5 or higher to work")
+if not hasattr(sys, 'version_info') or sys.version_info < (2, 7, 0):
+    raise SystemExit("python-directadmin requires Python 2.7 or higher to work")
 
 _description = "python-directadmin is a Python implementation " \
                "of Directadmin Panel Control Web API."
@@ -48,7 +48,9 @@ setup(name='python-directadmin',
       url='http://code.google.com/p/python-directadmin/',
       download_url='http://code.google.com/p/python-directadmin/downloads/list',
       packages=['directadmin'],
-      scripts=['scripts/da_suspension', 'scripts/da_console'],
+      scripts=['scripts/da_suspension',
+               'scripts/da_console',
+               'scripts/da_inventory'],
       platforms=['POSIX'],
       classifiers=[
         'Development Status :: 3 - Alpha',
@@ -58,6 +60,7 @@ setup(name='python-directadmin',
         'License :: OSI Approved :: GNU General Public License (GPL)',
         'Operating System :: POSIX',
         'Programming Language :: Python',
+        'Programming Language :: Python :: 2.7',
         'Topic :: Internet',
         'Topic :: Software Development :: Libraries :: Python Modules',
         'Topic :: System :: Monitoring'
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Fixtures of the test suite
+
+This file is part of python-directadmin.
+
+python-directadmin is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+python-directadmin is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with python-directadmin.  If not, see <http://www.gnu.org/licenses/>.
+
+The tests run against the fake Directadmin server of the
+benchmarks, so no live panel is needed:
+
+python -m unittest discover -s tests
+"""
+import os
+import sys
+import unittest
+import urllib
+import urlparse
+
+_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, _root)
+sys.path.insert(0, os.path.join(_root, 'benchmarks'))
+
+import directadmin
+from fakeserver import FakeDirectadmin
+
+
+class ChangingServer(FakeDirectadmin):
+    """Fake server whose users can get another quota or more
+       domains, and whose domains can fail to list their
+       mailboxes, between the calls of a test"""
+
+    def __init__(self, *args, **kwargs):
+        FakeDirectadmin.__init__(self, *args, **kwargs)
+        self.quotas = {}
+        self.domains = {}
+        self.broken = set()
+
+    def user_domains(self, user):
+        """Returns the domains of a user"""
+        return ['%s.com' % user] + self.domains.get(user, [])
+
+    def respond(self, cmd, parameters):
+        body = FakeDirectadmin.respond(self, cmd, parameters)
+        user = parameters.get('user')
+        if cmd == 'CMD_API_SHOW_USER_CONFIG' and user in self.quotas:
+            fields = dict(urlparse.parse_qsl(body))
+            fields['quota'] = self.quotas[user]
+            return urllib.urlencode(fields)
+        if cmd == 'CMD_API_SHOW_USER_DOMAINS':
+            info = urlparse.parse_qsl(body)[0][1]
+            return urllib.urlencode([(domain, info)
+                                     for domain in self.user_domains(user)])
+        if cmd == 'CMD_API_DOMAIN_OWNERS':
+            return urllib.urlencode([(domain, user)
+                                     for user in self.users
+                                     for domain in self.user_domains(user)])
+        if cmd == 'CMD_API_POP' and parameters.get('domain') in self.broken:
+            return urllib.urlencode([('error', '1'),
+                                     ('text', 'Cannot list the accounts'),
+                                     ('details', parameters['domain'])])
+        return body
+
+
+class ServerTestCase(unittest.TestCase):
+    """Test case with a fake Directadmin server started for
+       each test, and an Api logged in as its admin"""
+    users = 20
+
+    def make_server(self):
+        """Returns the server to test against, tests can
+           override it to change the answers of the server"""
+        return FakeDirectadmin(users=self.users)
+
+    def make_api(self, **kwargs):
+        """Returns an Api connected to the server, closed
+           at the end of the test"""
+        api = directadmin.Api(self.server.username,
+                              self.server.password,
+                              self.server.hostname,
+                              self.server.port,
+                              **kwargs)
+        self.addCleanup(api.close)
+        return api
+
+    def setUp(self):
+        self.server = self.make_server()
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.api = self.make_api()
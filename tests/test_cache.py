@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the response cache
+
+This file is part of python-directadmin.
+
+python-directadmin is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+python-directadmin is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with python-directadmin.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import time
+import unittest
+
+import fixtures
+from directadmin import ResponseCache
+
+_config = 'CMD_API_SHOW_USER_CONFIG'
+
+
+def user(name):
+    """Returns the GET parameters of a command about a user"""
+    return [('user', name)]
+
+
+class ResponseCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = ResponseCache(size=3, ttls={_config: 60})
+
+    def test_only_commands_with_a_ttl_are_cached(self):
+        self.assertTrue(self.cache.caches('CMD_API_SHOW_USERS'))
+        self.assertTrue(self.cache.caches(_config))
+        self.assertFalse(self.cache.caches('CMD_API_SHOW_USER_USAGE'))
+        self.cache.put('CMD_API_SHOW_USER_USAGE', None, user('bob'), {})
+        self.assertEqual(self.cache.get('CMD_API_SHOW_USER_USAGE', None,
+                                        user('bob')),
+                         (False, None))
+
+    def test_hit_returns_a_copy(self):
+        self.cache.put('CMD_API_SHOW_USERS', None, None, ['bob'])
+        found, users = self.cache.get('CMD_API_SHOW_USERS')
+        self.assertTrue(found)
+        users.append('alice')
+        self.assertEqual(self.cache.get('CMD_API_SHOW_USERS'),
+                         (True, ['bob']))
+        self.assertEqual(self.cache.stats()['hits'], 2)
+
+    def test_parameters_are_part_of_the_key(self):
+        self.cache.put(_config, None, user('bob'), {'quota': ['1']})
+        self.assertFalse(self.cache.get(_config, None, user('alice'))[0])
+        self.assertEqual(self.cache.get(_config, None, {'user': 'bob'}),
+                         (True, {'quota': ['1']}))
+
+    def test_entries_expire(self):
+        cache = ResponseCache(ttls={_config: 0.05})
+        cache.put(_config, None, user('bob'), {})
+        self.assertTrue(cache.get(_config, None, user('bob'))[0])
+        time.sleep(0.1)
+        self.assertFalse(cache.get(_config, None, user('bob'))[0])
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_least_recently_used_is_evicted(self):
+        for name in ('a', 'b', 'c'):
+            self.cache.put(_config, None, user(name), {})
+        self.cache.get(_config, None, user('a'))
+        self.cache.put(_config, None, user('d'), {})
+        self.assertTrue(self.cache.get(_config, None, user('a'))[0])
+        self.assertFalse(self.cache.get(_config, None, user('b'))[0])
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+        self.assertEqual(self.cache.stats()['size'], 3)
+
+    def test_scoped_invalidation(self):
+        self.cache.put(_config, None, user('bob'), {})
+        self.cache.put(_config, None, user('alice'), {})
+        self.cache.put('CMD_API_SHOW_USERS', None, None, ['alice', 'bob'])
+        self.cache.invalidate('CMD_API_SELECT_USERS',
+                              [('location', 'CMD_SELECT_USERS'),
+                               ('suspend', 'Suspend'),
+                               ('select0', 'bob')])
+        self.assertFalse(self.cache.get(_config, None, user('bob'))[0])
+        self.assertTrue(self.cache.get(_config, None, user('alice'))[0])
+        self.assertFalse(self.cache.get('CMD_API_SHOW_USERS')[0])
+        self.assertEqual(self.cache.stats()['invalidations'], 2)
+
+    def test_unknown_changes_clear_the_cache(self):
+        self.cache.put('CMD_API_SHOW_USERS', None, None, ['bob'])
+        self.cache.invalidate('CMD_API_SOMETHING_NEW', [('user', 'bob')])
+        self.assertEqual(self.cache.stats()['size'], 0)
+
+    def test_stale_response_is_not_stored(self):
+        generation = self.cache.generation(_config, None, user('bob'))
+        other = self.cache.generation(_config, None, user('alice'))
+        self.cache.invalidate('CMD_API_SELECT_USERS', [('select0', 'bob')])
+        self.cache.put(_config, None, user('bob'), {}, generation)
+        self.cache.put(_config, None, user('alice'), {}, other)
+        self.assertFalse(self.cache.get(_config, None, user('bob'))[0])
+        self.assertTrue(self.cache.get(_config, None, user('alice'))[0])
+
+    def test_clear_changes_every_generation(self):
+        generation = self.cache.generation('CMD_API_SHOW_USERS')
+        self.cache.clear()
+        self.cache.put('CMD_API_SHOW_USERS', None, None, [], generation)
+        self.assertFalse(self.cache.get('CMD_API_SHOW_USERS')[0])
+
+
+class ApiCacheTest(fixtures.ServerTestCase):
+
+    def setUp(self):
+        super(ApiCacheTest, self).setUp()
+        self.cache = ResponseCache(ttls={_config: 60})
+        self.api = self.make_api(cache=self.cache)
+
+    def test_reads_are_served_from_the_cache(self):
+        self.assertEqual(self.api.list_users(), self.api.list_users())
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_changes_drop_the_responses_they_affect(self):
+        self.api.get_user_limits('user1')
+        self.api.get_user_limits('user2')
+        self.api.suspend_account('user1')
+        self.api.get_user_limits('user1')
+        self.api.get_user_limits('user2')
+        stats = self.cache.stats()
+        self.assertEqual(stats['misses'], 3)
+        self.assertEqual(stats['hits'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the request template of the connector
+
+This file is part of python-directadmin.
+
+python-directadmin is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+python-directadmin is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with python-directadmin.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import base64
+import unittest
+
+import fixtures
+from directadmin import ApiConnector
+
+
+def basic(username, password):
+    """Returns the Authorization header of some credentials"""
+    return 'Basic %s' % base64.b64encode('%s:%s' % (username, password))
+
+
+class RequestTemplateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.connector = ApiConnector('admin', 'secret', 'host.com', 2222)
+
+    def test_template(self):
+        template = self.connector._template
+        self.assertEqual(template.base_url, 'http://host.com:2222')
+        self.assertEqual(template.get_headers['Authorization'],
+                         basic('admin', 'secret'))
+        self.assertEqual(template.get_headers['User-Agent'],
+                         'Python Directadmin')
+        self.assertEqual(template.get_headers['Accept-Encoding'],
+                         'gzip, deflate')
+        self.assertFalse('Content-Type' in template.get_headers)
+        self.assertEqual(template.post_headers['Content-Type'],
+                         'application/x-www-form-urlencoded')
+
+    def test_https_and_no_compression(self):
+        connector = ApiConnector('admin', 'secret', 'host.com', 2223,
+                                 https=True, compression=False)
+        self.assertEqual(connector._template.base_url,
+                         'https://host.com:2223')
+        self.assertFalse('Accept-Encoding' in
+                         connector._template.get_headers)
+
+    def test_prepare_get(self):
+        method, path, body, headers = self.connector._prepare(
+            'CMD_API_SHOW_USER_CONFIG', None, [('user', 'bob')])
+        self.assertEqual((method, path, body),
+                         ('GET', '/CMD_API_SHOW_USER_CONFIG?user=bob', None))
+        self.assertTrue(headers is self.connector._template.get_headers)
+
+    def test_prepare_post(self):
+        method, path, body, headers = self.connector._prepare(
+            'CMD_API_POP', [('action', 'create'), ('domain', 'a b.com')])
+        self.assertEqual((method, path, body),
+                         ('POST', '/CMD_API_POP',
+                          'action=create&domain=a+b.com'))
+        self.assertTrue(headers is self.connector._template.post_headers)
+
+    def test_new_credentials_rebuild_the_template(self):
+        old = self.connector._template
+        self.connector.set_credentials('admin', 'other')
+        self.assertEqual(self.connector._template.get_headers['Authorization'],
+                         basic('admin', 'other'))
+        self.assertEqual(old.get_headers['Authorization'],
+                         basic('admin', 'secret'))
+
+    def test_login_key_is_sent_instead_of_the_password(self):
+        connector = ApiConnector('admin', 'secret', 'host.com',
+                                 login_key='key')
+        self.assertEqual(connector._template.get_headers['Authorization'],
+                         basic('admin', 'key'))
+
+    def test_login_as_has_its_own_template(self):
+        user = self.connector.login_as('bob')
+        self.assertEqual(user._template.get_headers['Authorization'],
+                         basic('admin|bob', 'secret'))
+        self.assertEqual(self.connector._template.get_headers['Authorization'],
+                         basic('admin', 'secret'))
+        self.assertEqual(self.connector.login_as('alice').login_as('bob')
+                         ._template.get_headers['Authorization'],
+                         basic('admin|bob', 'secret'))
+
+
+class AuthenticationTest(fixtures.ServerTestCase):
+
+    def test_basic_checks_the_password_on_every_request(self):
+        self.api.list_users()
+        self.api.list_users()
+        self.assertEqual(self.server.password_checks, 2)
+
+    def test_session_checks_the_password_once(self):
+        api = self.make_api(auth='session')
+        self.assertEqual(len(api.list_users()), self.users)
+        self.assertEqual(len(api.list_users()), self.users)
+        self.assertEqual(self.server.password_checks, 1)
+
+    def test_expired_session_is_renewed(self):
+        api = self.make_api(auth='session')
+        api.list_users()
+        self.server.expire_sessions()
+        self.assertEqual(len(api.list_users()), self.users)
+        self.assertEqual(self.server.password_checks, 2)
+
+    def test_login_as_sends_the_user(self):
+        user = self.api.login_as('user1')
+        self.assertEqual(user.list_subdomains('user1.com'), ['www', 'mail'])
+
+
+class CompressionTest(fixtures.ServerTestCase):
+
+    def test_compressed_responses(self):
+        expected = self.api.list_users()
+        for encoding in ('gzip', 'deflate'):
+            self.server.compression = encoding
+            self.assertEqual(self.api.list_users(), expected)
+            self.assertEqual(list(self.api.iter_all_users()), expected)
+            self.assertEqual(self.api.get_user_usage('user1').bandwidth,
+                             1024.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the inventory index
+
+This file is part of python-directadmin.
+
+python-directadmin is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+python-directadmin is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with python-directadmin.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import fixtures
+from directadmin import ApiError, InventoryIndex
+
+
+class InventoryIndexTest(fixtures.ServerTestCase):
+    users = 5
+
+    def make_server(self):
+        return fixtures.ChangingServer(users=self.users)
+
+    def setUp(self):
+        super(InventoryIndexTest, self).setUp()
+        self.index = InventoryIndex(self.api)
+        self.addCleanup(self.index.close)
+
+    def test_refresh_fills_the_index(self):
+        changes = self.index.refresh()
+        self.assertEqual(len(changes.added), self.users)
+        self.assertEqual(self.index.list_users(), self.server.users)
+        self.assertEqual(self.index.find_domain_owner('user2.com'), 'user2')
+        self.assertEqual(self.index.find_domain_owner('nobody.com'), None)
+        self.assertEqual(self.index.list_domains('user2'), ['user2.com'])
+        self.assertEqual(self.index.list_subdomains('user2.com'),
+                         ['mail', 'www'])
+        self.assertEqual(self.index.list_mailboxes(username='user2'),
+                         ['info@user2.com', 'sales@user2.com'])
+        self.assertEqual(len(self.index.list_mailboxes()), 2 * self.users)
+        self.assertEqual(self.index.errors, {})
+
+    def test_refresh_follows_the_changes(self):
+        self.index.refresh()
+        self.server.domains['user1'] = ['extra.com']
+        self.server.set_users(self.users - 1)
+        changes = self.index.refresh()
+        self.assertEqual(changes.modified.keys(), ['user1'])
+        self.assertEqual(changes.removed.keys(), ['user4'])
+        self.assertEqual(self.index.find_domain_owner('extra.com'), 'user1')
+        self.assertEqual(self.index.list_mailboxes(domain='extra.com'),
+                         ['info@extra.com', 'sales@extra.com'])
+        self.assertEqual(self.index.find_domain_owner('user4.com'), None)
+        self.assertEqual(self.index.get_user('user4'), None)
+        self.assertEqual(self.index.list_mailboxes(domain='user4.com'), [])
+
+    def test_failed_mailboxes_are_kept_and_fetched_again(self):
+        self.index.refresh()
+        self.server.quotas['user1'] = '2048'
+        self.server.broken.add('user1.com')
+        changes = self.index.refresh()
+        self.assertEqual(changes.modified.keys(), ['user1'])
+        self.assertEqual(self.index.errors.keys(), ['user1.com'])
+        self.assertTrue(isinstance(self.index.errors['user1.com'], ApiError))
+        self.assertEqual(self.index.list_mailboxes(domain='user1.com'),
+                         ['info@user1.com', 'sales@user1.com'])
+
+        self.server.broken.clear()
+        changes = self.index.refresh()
+        self.assertFalse(changes)
+        self.assertEqual(self.index.errors, {})
+
+    def test_index_is_kept_on_disk(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        filename = os.path.join(directory, 'inventory.db')
+        index = InventoryIndex(self.api, filename)
+        index.refresh()
+        index.close()
+
+        index = InventoryIndex(None, filename)
+        self.assertEqual(index.list_users(), self.server.users)
+        self.assertEqual(index.find_domain_owner('user3.com'), 'user3')
+        self.assertRaises(ValueError, index.refresh)
+        index.close()
+
+        index = InventoryIndex(self.api, filename)
+        self.assertFalse(index.refresh())
+        index.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the retry policy and the circuit breaker
+
+This file is part of python-directadmin.
+
+python-directadmin is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+python-directadmin is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with python-directadmin.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import socket
+import time
+import unittest
+
+import fixtures
+import directadmin
+from directadmin import CircuitBreaker, RetryPolicy
+
+
+class Recorder(list):
+    """Metrics sink that keeps the CommandMetrics it gets"""
+
+    def record(self, metrics):
+        self.append(metrics)
+
+
+def closed_port():
+    """Returns a local port nothing listens on"""
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+class RetryPolicyTest(unittest.TestCase):
+
+    def test_delay_is_jittered_and_capped(self):
+        policy = RetryPolicy(retries=5, backoff=0.5, max_backoff=2)
+        for attempt in range(6):
+            limit = min(2, 0.5 * 2 ** attempt)
+            for i in range(20):
+                delay = policy.delay(attempt)
+                self.assertTrue(0 <= delay <= limit)
+
+    def test_retries_connection_errors(self):
+        api = directadmin.Api('admin', 'password', '127.0.0.1',
+                              closed_port(),
+                              retry_policy=RetryPolicy(retries=2,
+                                                       backoff=0.01))
+        sink = Recorder()
+        api.add_metrics_sink(sink)
+        self.assertRaises(directadmin.ApiConnectionError, api.list_users)
+        # The first attempt and its two retries failed
+        self.assertEqual(len(sink), 3)
+        self.assertEqual(set(m.error for m in sink),
+                         set(['ApiConnectionError']))
+        api.close()
+
+    def test_commands_that_change_the_server_are_not_retried(self):
+        api = directadmin.Api('admin', 'password', '127.0.0.1',
+                              closed_port(),
+                              retry_policy=RetryPolicy(retries=2,
+                                                       backoff=0.01))
+        sink = Recorder()
+        api.add_metrics_sink(sink)
+        self.assertRaises(directadmin.ApiConnectionError,
+                          api.suspend_account, 'user1')
+        self.assertEqual(len(sink), 1)
+        api.close()
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def test_opens_after_failure_threshold(self):
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+        for i in range(2):
+            self.assertTrue(breaker.allow())
+            breaker.failure()
+        self.assertEqual(breaker.get_state(), CircuitBreaker.CLOSED)
+        breaker.failure()
+        self.assertEqual(breaker.get_state(), CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow())
+
+    def test_success_resets_the_failures(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+        breaker.failure()
+        breaker.success()
+        breaker.failure()
+        self.assertEqual(breaker.get_state(), CircuitBreaker.CLOSED)
+
+    def test_half_open_lets_a_single_trial_through(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+        breaker.failure()
+        self.assertFalse(breaker.allow())
+        time.sleep(0.1)
+        self.assertEqual(breaker.get_state(), CircuitBreaker.HALF_OPEN)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.success()
+        self.assertEqual(breaker.get_state(), CircuitBreaker.CLOSED)
+        self.assertTrue(breaker.allow())
+
+    def test_failed_trial_opens_again(self):
+        breaker = CircuitBreaker(failure_threshold=5, reset_timeout=0.05)
+        for i in range(5):
+            breaker.failure()
+        time.sleep(0.1)
+        self.assertTrue(breaker.allow())
+        breaker.failure()
+        self.assertEqual(breaker.get_state(), CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow())
+
+    def test_cancelled_trial_lets_another_through(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+        breaker.failure()
+        time.sleep(0.1)
+        self.assertTrue(breaker.allow())
+        breaker.cancel()
+        self.assertTrue(breaker.allow())
+
+    def test_open_circuit_fails_fast(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+        api = directadmin.Api('admin', 'password', '127.0.0.1',
+                              closed_port(),
+                              circuit_breaker=breaker)
+        self.assertRaises(directadmin.ApiConnectionError, api.list_users)
+        self.assertRaises(directadmin.CircuitOpenError, api.list_users)
+        api.close()
+
+
+class BreakerServerTest(fixtures.ServerTestCase):
+
+    def test_answers_close_the_circuit(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+        breaker.failure()
+        time.sleep(0.1)
+        api = self.make_api(circuit_breaker=breaker)
+        self.assertEqual(len(api.list_users()), self.users)
+        self.assertEqual(breaker.get_state(), CircuitBreaker.CLOSED)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the user records and the typed responses
+
+This file is part of python-directadmin.
+
+python-directadmin is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+python-directadmin is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with python-directadmin.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import json
+import pickle
+import unittest
+
+import fixtures
+from directadmin import AdminUser, EndUser, ResellerUser, ValidationError
+from directadmin import UNLIMITED, ServerStats, UserLimits, UserUsage
+
+
+class UserTest(unittest.TestCase):
+
+    def test_users_are_slotted(self):
+        for user in (AdminUser('admin2', 'a@b.com', 'secret'),
+                     ResellerUser('res1', 'a@b.com', 'secret', 'b.com'),
+                     EndUser('user1', 'a@b.com', 'secret', 'b.com')):
+            self.assertFalse(hasattr(user, '__dict__'))
+
+    def test_get_list_keeps_the_order_of_the_fields(self):
+        user = EndUser('user1', 'a@b.com', 'secret', 'b.com', 'basic',
+                       'shared')
+        self.assertEqual(user.get_list(),
+                         [('username', 'user1'),
+                          ('email', 'a@b.com'),
+                          ('passwd', 'secret'),
+                          ('passwd2', 'secret'),
+                          ('domain', 'b.com'),
+                          ('ip', 'shared'),
+                          ('package', 'basic')])
+
+    def test_extra_properties(self):
+        user = AdminUser('admin2', 'a@b.com', 'secret')
+        self.assertFalse('notify' in user)
+        self.assertRaises(KeyError, lambda: user['notify'])
+        user.update({'notify': 'yes', 'email': 'c@d.com'})
+        self.assertEqual(user['notify'], 'yes')
+        self.assertEqual(user['email'], 'c@d.com')
+        self.assertEqual(user.get_list()[-1], ('notify', 'yes'))
+
+    def test_default_config_is_copied_on_change(self):
+        first = ResellerUser('res1', 'a@b.com', 'secret', 'b.com')
+        second = ResellerUser('res2', 'a@b.com', 'secret', 'c.com')
+        default = first['bandwidth']
+        first['bandwidth'] = 1024
+        self.assertEqual(first['bandwidth'], 1024)
+        self.assertEqual(second['bandwidth'], default)
+        self.assertEqual(dict(ResellerUser._default_config)['bandwidth'],
+                         default)
+        self.assertTrue(('bandwidth', 1024) in first.get_list())
+
+    def test_packaged_users_have_no_config(self):
+        user = EndUser('user1', 'a@b.com', 'secret', 'b.com', 'basic')
+        self.assertFalse('bandwidth' in user)
+
+    def test_validate(self):
+        EndUser('user1', 'a@b.com', 'secret', 'b.com', 'basic').validate()
+        ResellerUser('res1', 'a@b.com', 'secret', 'b.com').validate()
+        for user in (EndUser('u', 'a@b.com', 'secret', 'b.com', 'basic'),
+                     EndUser('user1', 'ab.com', 'secret', 'b.com', 'basic'),
+                     EndUser('user1', 'a@b.com', 'abc', 'b.com', 'basic'),
+                     EndUser('user1', 'a@b.com', 'secret', 'bcom', 'basic')):
+            self.assertRaises(ValidationError, user.validate)
+        user = EndUser('user1', 'a@b.com', 'secret', 'b.com', 'basic')
+        user['passwd2'] = 'other'
+        self.assertRaises(ValidationError, user.validate)
+
+
+class RecordTest(unittest.TestCase):
+
+    def test_amounts_are_decoded(self):
+        usage = UserUsage({'bandwidth': ['1024.5'],
+                           'quota': ['unlimited'],
+                           'inode': ['12000'],
+                           'mysql': ['n/a'],
+                           'ftp': ['']})
+        self.assertEqual(usage.bandwidth, 1024.5)
+        self.assertTrue(usage.quota is UNLIMITED)
+        self.assertEqual(usage.inode, 12000)
+        self.assertEqual(usage.mysql, None)
+        self.assertEqual(usage.ftp, None)
+        self.assertEqual(usage.vdomains, None)
+        self.assertRaises(AttributeError, getattr, usage, 'unknown')
+
+    def test_settings_and_texts_are_decoded(self):
+        limits = UserLimits({'ssl': ['ON'],
+                             'cgi': ['OFF'],
+                             'suspended': ['yes'],
+                             'package': ['basic']})
+        self.assertTrue(limits.ssl)
+        self.assertFalse(limits.cgi)
+        self.assertTrue(limits.suspended)
+        self.assertEqual(limits.package, 'basic')
+        self.assertEqual(limits.as_dict()['package'], 'basic')
+
+    def test_records_are_dictionaries(self):
+        raw = {'bandwidth': ['10'], 'quota': ['20']}
+        usage = UserUsage(raw)
+        self.assertTrue(isinstance(usage, dict))
+        self.assertEqual(usage, raw)
+        self.assertEqual(dict(usage), raw)
+        self.assertEqual(sorted(usage.items()), sorted(raw.items()))
+        self.assertEqual(json.loads(json.dumps(usage)), raw)
+        self.assertTrue(usage.raw is usage)
+
+    def test_other_responses_give_empty_records(self):
+        self.assertEqual(UserUsage(True), {})
+        self.assertEqual(UserUsage(None).bandwidth, None)
+
+    def test_disks_are_sorted(self):
+        stats = ServerStats({'disk10': ['j'], 'disk2': ['b'],
+                             'disk1': ['a'], 'nusers': ['3']})
+        self.assertEqual(stats.disks, ['a', 'b', 'j'])
+        self.assertEqual(stats.nusers, 3)
+
+    def test_unlimited(self):
+        self.assertTrue(UNLIMITED > 10 ** 9)
+        self.assertTrue(UNLIMITED >= UNLIMITED)
+        self.assertFalse(UNLIMITED < 0)
+        self.assertEqual(max([5, UNLIMITED, 7]), UNLIMITED)
+        self.assertEqual(str(UNLIMITED), 'unlimited')
+        self.assertTrue(pickle.loads(pickle.dumps(UNLIMITED)) is UNLIMITED)
+
+
+class ApiRecordsTest(fixtures.ServerTestCase):
+
+    def test_api_returns_records(self):
+        usage = self.api.get_user_usage('user1')
+        self.assertTrue(isinstance(usage, UserUsage))
+        self.assertEqual(usage.bandwidth, 1024.5)
+        self.assertEqual(usage.mysql, 1)
+        limits = self.api.get_user_limits('user1')
+        self.assertTrue(isinstance(limits, UserLimits))
+        self.assertTrue(limits.quota is UNLIMITED)
+        self.assertFalse(limits.suspended)
+        self.assertEqual(limits.username, 'user1')
+
+
+if __name__ == '__main__':
+    unittest.main()
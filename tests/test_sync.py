@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the sync engine
+
+This file is part of python-directadmin.
+
+python-directadmin is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+python-directadmin is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with python-directadmin.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import fixtures
+from directadmin import SyncEngine, domain_owners_signal
+
+
+class SyncEngineTest(fixtures.ServerTestCase):
+    users = 10
+
+    def make_server(self):
+        return fixtures.ChangingServer(users=self.users)
+
+    def test_first_sync_adds_every_user(self):
+        engine = SyncEngine(self.api)
+        changes = engine.sync()
+        self.assertEqual(sorted(changes.added),
+                         sorted(self.server.users))
+        self.assertFalse(changes.removed or changes.modified)
+        snapshot = engine.get_snapshot()['user3']
+        self.assertEqual(snapshot.domains.keys(), ['user3.com'])
+        self.assertEqual(sorted(snapshot.subdomains['user3.com']),
+                         ['mail', 'www'])
+
+    def test_nothing_changed(self):
+        engine = SyncEngine(self.api)
+        engine.sync()
+        changes = engine.sync()
+        self.assertFalse(changes)
+        self.assertEqual(changes.errors, {})
+
+    def test_added_and_removed_users(self):
+        engine = SyncEngine(self.api)
+        engine.sync()
+        self.server.set_users(self.users - 2)
+        changes = engine.sync()
+        self.assertEqual(sorted(changes.removed), ['user8', 'user9'])
+        self.server.set_users(self.users)
+        changes = engine.sync()
+        self.assertEqual(sorted(changes.added), ['user8', 'user9'])
+
+    def test_modified_users(self):
+        engine = SyncEngine(self.api)
+        engine.sync()
+        self.server.quotas['user1'] = '2048'
+        self.server.domains['user2'] = ['extra.com']
+        changes = engine.sync()
+        self.assertEqual(sorted(changes.modified), ['user1', 'user2'])
+        old, new, parts = changes.modified['user1']
+        self.assertEqual(parts, ['limits'])
+        self.assertEqual(new.limits['quota'], ['2048'])
+        old, new, parts = changes.modified['user2']
+        self.assertEqual(parts, ['domains', 'subdomains'])
+
+    def test_max_age_skips_recent_users(self):
+        engine = SyncEngine(self.api, max_age=3600)
+        engine.sync()
+        self.server.quotas['user1'] = '2048'
+        changes = engine.sync()
+        self.assertFalse(changes)
+        # Only the users were listed
+        self.assertEqual(changes.calls, 1)
+
+    def test_signal_checks_only_changed_users(self):
+        engine = SyncEngine(self.api, signal=domain_owners_signal)
+        engine.sync()
+        changes = engine.sync()
+        self.assertFalse(changes)
+        self.assertEqual(changes.calls, 2)
+        self.server.domains['user4'] = ['extra.com']
+        changes = engine.sync()
+        self.assertEqual(changes.modified.keys(), ['user4'])
+        # The list, the signal, the user's limits and domains,
+        # and the subdomains of its new domain
+        self.assertEqual(changes.calls, 5)
+
+    def test_snapshot_is_saved_and_loaded(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        filename = os.path.join(directory, 'snapshot.json')
+        engine = SyncEngine(self.api, signal=domain_owners_signal)
+        engine.sync()
+        engine.save(filename)
+
+        engine = SyncEngine(self.api, signal=domain_owners_signal)
+        engine.load(filename)
+        self.assertEqual(sorted(engine.get_snapshot()),
+                         sorted(self.server.users))
+        changes = engine.sync()
+        self.assertFalse(changes)
+        self.assertEqual(changes.calls, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()